@@ -0,0 +1,251 @@
+import itertools
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+# 控制器命令帧中的单条指令，例如 [ch3:1] [cap:013nF] [volt:+200V] [freq:+02000Hz] [-:0000500]
+_TOKEN_RE = re.compile(rb'\[([^\[\]:]+):([^\[\]]*)\]')
+_SETTING_KEYS = (b'cap', b'volt', b'freq')
+_STEP_KEYS = (b'+', b'-')
+
+
+def _number(value):
+    """把 '+02000Hz' / '013nF' / '+200V' 之类的取值规整为数值，便于比较不同写法的同一设置"""
+    m = re.search(rb'[-+]?\d+(\.\d+)?', value)
+    return float(m.group()) if m else value
+
+
+class ControllerState:
+    """
+    ANC 控制器状态缓存：当前选中的通道，每个通道最近一次设置的电容/电压/频率，
+    以及每个通道最近一次下发步进命令的时间（供位置缓存判断读数是否已过期）。
+
+    状态由实际写出的字节流更新（见 TrackedSerial），因此无论命令来自 LTDS、Position 还是停止流程，
+    缓存都与控制器保持一致；写入失败或无法确定时调用 invalidate()，下一帧会完整重发。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.selected = None
+        self.settings = {}
+        self.last_move = {}
+        self.invalidated_at = 0.0
+
+    def invalidate(self):
+        with self._lock:
+            self.selected = None
+            self.settings = {}
+            # 不确定控制器实际执行了什么，任何通道都可能已移动
+            self.invalidated_at = time.time()
+
+    def moved_since(self, channel, timestamp):
+        """该通道在 timestamp 之后是否可能下发过步进命令"""
+        return max(self.last_move.get(channel, 0.0), self.invalidated_at) > timestamp
+
+    @staticmethod
+    def _apply(selected, settings, key, value):
+        """在给定状态上应用一条指令，返回新的选中通道"""
+        if key.startswith(b'ch') and key[2:].isdigit():
+            channel = int(key[2:])
+            if value.strip() == b'1':
+                return channel
+            # 关闭通道后再次使用必须重新选通，设置也视为失效
+            settings.pop(channel, None)
+            return None if selected == channel else selected
+        if key in _SETTING_KEYS and selected is not None:
+            settings.setdefault(selected, {})[key] = _number(value)
+        return selected
+
+    def observe(self, data):
+        """根据已写出的字节更新缓存"""
+        with self._lock:
+            for key, value in _TOKEN_RE.findall(bytes(data)):
+                key = key.strip()
+                if key in _STEP_KEYS and self.selected is not None:
+                    self.last_move[self.selected] = time.time()
+                self.selected = self._apply(self.selected, self.settings, key, value)
+
+    def compact(self, commands):
+        """
+        把命令列表合并为一帧，省去与缓存状态相同的选通道/电容/电压/频率指令，移动等其他指令原样保留。
+        只模拟、不修改缓存；真正写出后由 observe() 更新。
+        """
+        with self._lock:
+            selected = self.selected
+            settings = {ch: dict(values) for ch, values in self.settings.items()}
+        frame = []
+        for cmd in commands:
+            tokens = _TOKEN_RE.findall(cmd)
+            if len(tokens) == 1:
+                key, value = tokens[0]
+                key = key.strip()
+                if key.startswith(b'ch') and key[2:].isdigit() and value.strip() == b'1' \
+                        and selected == int(key[2:]):
+                    continue
+                if key in _SETTING_KEYS and selected is not None \
+                        and settings.get(selected, {}).get(key) == _number(value):
+                    continue
+                selected = self._apply(selected, settings, key, value)
+            frame.append(cmd)
+        return b''.join(frame)
+
+
+class TrackedSerial:
+    """
+    ANC 串口的薄包装：所有写入先经 ControllerState 记录，其余属性/方法透传给底层 serial.Serial。
+    """
+
+    def __init__(self, ser):
+        self._ser = ser
+        self.state = ControllerState()
+
+    def write(self, data):
+        try:
+            n = self._ser.write(data)
+        except Exception:
+            # 不确定控制器收到了多少，清空缓存
+            self.state.invalidate()
+            raise
+        self.state.observe(data)
+        return n
+
+    def close(self):
+        self.state.invalidate()
+        return self._ser.close()
+
+    def __getattr__(self, name):
+        return getattr(self._ser, name)
+
+
+def build_frame(anc, commands):
+    """把命令合并为单次写入的字节串；串口带状态缓存时只发送变化的设置"""
+    state = getattr(anc, 'state', None)
+    if isinstance(state, ControllerState):
+        return state.compact(commands)
+    return b''.join(commands)
+
+
+# 命令优先级：数值越小越先执行
+STOP, MOVE, QUERY = 0, 1, 2
+
+# 停止时清零的通道（设备0: ch1-3，设备1: ch4-6）
+HALT_CHANNELS = (1, 2, 3, 4, 5, 6)
+
+
+def halt_frame(channels=HALT_CHANNELS):
+    """全通道停止帧：逐通道把电容/电压/频率清零，最后关闭所有通道，一次写出、中间不等待"""
+    frame = b''.join(f'[ch{ch}:1][cap:000nF][volt:+000V] [freq:+00000Hz]'.encode() for ch in channels)
+    return frame + b''.join(f'[ch{ch}:0]'.encode() for ch in channels)
+
+
+def _needle_port():
+    from SerialPage import NeedelConnectionThread
+    return NeedelConnectionThread.anc
+
+
+class ANCCommandQueue:
+    """
+    ANC 串口的专用 I/O 工作线程：按优先级（停止 > 移动 > 查询）依次执行提交的任务，返回 Future。
+
+    每个任务在 SerialLock.serial_lock 内以 fn(anc) 的形式执行，因此与仍直接持锁访问串口的旧代码互斥；
+    任务之间释放串口，高优先级命令（例如停止）最多只需等待当前正在执行的那一个任务。
+    注意：持有 serial_lock 时不能等待本队列的 Future（工作线程也需要该锁），否则会死锁。
+
+    运动流程（点动、逼近、等待到位）用 with anc_queue.motion(): 包住整个过程，期间 motion_active 为真，
+    后台位置刷新暂停，不会在两次步进命令之间切换通道。
+    """
+
+    def __init__(self, port_getter=_needle_port, lock=None):
+        from SerialLock import SerialLock
+        self._port_getter = port_getter
+        self._lock = lock if lock is not None else SerialLock.serial_lock
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._motion_count = 0
+        self._motion_lock = threading.Lock()
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    @property
+    def motion_active(self):
+        return self._motion_count > 0
+
+    @contextmanager
+    def motion(self):
+        """标记一段运动正在进行（可嵌套、可多线程同时标记）"""
+        with self._motion_lock:
+            self._motion_count += 1
+        try:
+            yield
+        finally:
+            with self._motion_lock:
+                self._motion_count -= 1
+
+    def _ensure_worker(self):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True, name="ANCCommandQueue")
+                self._thread.start()
+
+    def submit(self, fn, priority=QUERY):
+        """提交任务 fn(anc)，返回 Future；同优先级按提交顺序执行"""
+        future = Future()
+        self._queue.put((priority, next(self._counter), fn, future))
+        self._ensure_worker()
+        return future
+
+    def send(self, commands, priority=MOVE):
+        """把命令列表合并为单帧（只发送变化的设置）并写出，Future 结果为写出的字节串"""
+        def job(anc):
+            frame = build_frame(anc, commands)
+            if frame:
+                anc.write(frame)
+            return frame
+        return self.submit(job, priority)
+
+    def halt(self, channels=HALT_CHANNELS):
+        """
+        紧急停止：取消所有排队中的移动任务（查询保留），并以最高优先级写出一帧全通道停止命令。
+        停止帧原样写出，不做状态压缩。
+        """
+        kept = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item[0] == MOVE:
+                item[3].cancel()
+            else:
+                kept.append(item)
+        for item in kept:
+            self._queue.put(item)
+        frame = halt_frame(channels)
+        return self.submit(lambda anc: anc.write(frame), STOP)
+
+    def _run(self):
+        while True:
+            _, _, fn, future = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                with self._lock:
+                    anc = self._port_getter()
+                    if anc is None or not getattr(anc, 'is_open', True):
+                        raise ConnectionError("串口未连接或已关闭")
+                    result = fn(anc)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+
+# 全局唯一的 ANC 命令队列
+anc_queue = ANCCommandQueue()
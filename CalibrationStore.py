@@ -0,0 +1,79 @@
+import os
+import threading
+
+
+class CalibrationStore:
+    """
+    标定数据的内存缓存：探针/光纤模板参考点偏移（dia0.txt / dia1.txt）和 pad 模板偏移（Paddia.txt）。
+
+    启动时加载一次，之后只在文件变化时（由 MainPage1 的 QFileSystemWatcher 通知）或本程序写入时更新，
+    热路径上直接读属性，不再访问文件系统。
+    """
+
+    DIA_FILES = {0: 'dia0.txt', 1: 'dia1.txt'}
+    PAD_DIA_FILE = 'Paddia.txt'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dia = {0: (0, 0), 1: (0, 0)}
+        self.pad_dia = (0, 0)
+        self.reload()
+
+    @property
+    def files(self):
+        """需要监视的全部标定文件（绝对路径）"""
+        return [os.path.abspath(f) for f in list(self.DIA_FILES.values()) + [self.PAD_DIA_FILE]]
+
+    @staticmethod
+    def _read_offset(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                numbers = f.readline().strip().split(',')
+            if len(numbers) >= 2:
+                return int(numbers[0]), int(numbers[1])
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def reload(self, path=None):
+        """重新读取标定文件；path 为 None 时全部重读，否则只重读对应文件。返回是否有文件被重读"""
+        name = os.path.basename(path) if path else None
+        reloaded = False
+        with self._lock:
+            for equipment, dia_file in self.DIA_FILES.items():
+                if name is None or name == dia_file:
+                    offset = self._read_offset(dia_file)
+                    if offset is not None:
+                        self._dia[equipment] = offset
+                    reloaded = True
+            if name is None or name == self.PAD_DIA_FILE:
+                offset = self._read_offset(self.PAD_DIA_FILE)
+                if offset is not None:
+                    self.pad_dia = offset
+                reloaded = True
+        return reloaded
+
+    def dia(self, equipment=0):
+        """模板中心到参考点的偏移 (x, y)；equipment 0 为电探针，1 为光纤"""
+        return self._dia[1 if equipment else 0]
+
+    def set_dia(self, equipment, x, y):
+        """更新并保存探针/光纤参考点偏移"""
+        equipment = 1 if equipment else 0
+        with self._lock:
+            with open(self.DIA_FILES[equipment], 'w', encoding='utf-8') as f:
+                f.write(f"{x},{y}")
+            self._dia[equipment] = (int(x), int(y))
+
+    def set_pad_dia(self, x, y):
+        """更新并保存 pad 参考点偏移"""
+        with self._lock:
+            with open(self.PAD_DIA_FILE, 'w', encoding='utf-8') as f:
+                f.write(f"{x},{y}")
+                f.flush()  # 强制刷新缓冲区
+                os.fsync(f.fileno())  # 强制同步到磁盘
+            self.pad_dia = (int(x), int(y))
+
+
+# 全局唯一的标定数据实例
+calibration = CalibrationStore()
@@ -22,6 +22,7 @@ from CameraConfig.CameraParams_header import MVCC_INTVALUE_EX, MV_FRAME_OUT_INFO
     MV_TRIGGER_MODE_OFF, MV_CC_DEVICE_INFO, MVCC_FLOATVALUE, MV_DISPLAY_FRAME_INFO, MV_SAVE_IMG_TO_FILE_PARAM, \
     MV_Image_Jpeg, MV_Image_Bmp
 from CameraConfig.MvCameraControl_class import MvCamera
+from CameraConfig.FrameRing import FrameRing
 from CameraConfig.PixelType_header import PixelType_Gvsp_Mono8, PixelType_Gvsp_Mono10, \
     PixelType_Gvsp_Mono12, PixelType_Gvsp_Mono10_Packed, PixelType_Gvsp_Mono12_Packed, PixelType_Gvsp_BayerGR8, \
     PixelType_Gvsp_BayerRG8, PixelType_Gvsp_BayerGB8, PixelType_Gvsp_BayerBG8, PixelType_Gvsp_BayerGR10, \
@@ -140,8 +141,7 @@ class CameraOperation:
     def __init__(self, obj_cam, st_device_list, n_connect_num=0, b_open_device=False, b_start_grabbing=False,
                  h_thread_handle=None,
                  b_thread_closed=False, st_frame_info=None, b_exit=False, b_save_bmp=False, b_save_jpg=False,
-                 buf_save_image=None,
-                 n_save_image_size=0, n_win_gui_id=0, frame_rate=0, exposure_time=0, gain=0):
+                 n_win_gui_id=0, frame_rate=0, exposure_time=0, gain=0):
 
         self.obj_cam = obj_cam
         self.st_device_list = st_device_list
@@ -153,16 +153,15 @@ class CameraOperation:
         self.b_exit = b_exit
         self.b_save_bmp = b_save_bmp
         self.b_save_jpg = b_save_jpg
-        self.buf_grab_image = None
         self.buf_grab_image_size = 0
-        self.buf_save_image = buf_save_image
-        self.n_save_image_size = n_save_image_size
         self.h_thread_handle = h_thread_handle
         # self.b_thread_closed  # removed no-op
         self.frame_rate = frame_rate
         self.exposure_time = exposure_time
         self.gain = gain
-        self.buf_lock = threading.Lock()  # 取图和存图的buffer锁
+        # 零拷贝帧环形缓冲区：相机直接写入槽位，读取方拿只读视图
+        self.frame_ring = None
+        self.n_ring_slots = 3
         self.camera_lock = threading.Lock()  # 🔒 相机访问锁（防止多线程竞争）
         self.is_resetting = False  # 🚩 标记是否正在重置缓冲区（防止访问违规）
         # 目标抓取间隔（秒），用于轻微节流，默认约16FPS
@@ -383,40 +382,33 @@ class CameraOperation:
         consecutive_errors = 0
         max_consecutive_errors = 5  # 连续5次错误后退出线程，由上层决定是否重连
 
-        # 预分配抓取缓冲区
-        if self.buf_grab_image is None or self.buf_grab_image_size < NeedBufSize:
+        # 预分配帧环形缓冲区（相机SDK直接写入槽位，避免二次拷贝）
+        if self.frame_ring is None or self.frame_ring.slot_size < NeedBufSize:
             try:
-                self.buf_grab_image = (c_ubyte * NeedBufSize)()
-                self.buf_grab_image_size = NeedBufSize
+                self.frame_ring = FrameRing(NeedBufSize, self.n_ring_slots)
             except MemoryError:
                 print("内存不足，无法分配图像缓冲区")
                 return
+        self.buf_grab_image_size = NeedBufSize
 
         while not self.b_exit and not self._stop_event.is_set():
+            slot = self.frame_ring.acquire_write()
+            if slot is None:
+                # 所有槽位都在被读取，稍后重试
+                time.sleep(0.005)
+                continue
+
             # 🔒 加锁保护相机访问，防止多线程竞争
             with self.camera_lock:
-                ret = self.obj_cam.MV_CC_GetOneFrameTimeout(self.buf_grab_image, self.buf_grab_image_size, stFrameInfo, 2000)
+                ret = self.obj_cam.MV_CC_GetOneFrameTimeout(slot.buf, slot.size, stFrameInfo, 2000)
 
             if ret == MV_OK:
                 consecutive_errors = 0
-                # 将当前帧复制到保存缓冲区（线程安全）
-                with self.buf_lock:
-                    try:
-                        if self.buf_save_image is None or self.n_save_image_size < stFrameInfo.nFrameLen:
-                            self.buf_save_image = (c_ubyte * stFrameInfo.nFrameLen)()
-                            self.n_save_image_size = stFrameInfo.nFrameLen
-                        # 保存帧信息的浅拷贝到新的结构体，避免复用导致的数据被覆盖
-                        st_copy = MV_FRAME_OUT_INFO_EX()
-                        ctypes.memmove(ctypes.byref(st_copy), ctypes.byref(stFrameInfo), ctypes.sizeof(MV_FRAME_OUT_INFO_EX))
-                        self.st_frame_info = st_copy
-                        # 复制图像数据
-                        ctypes.memmove(self.buf_save_image, self.buf_grab_image, stFrameInfo.nFrameLen)
-                    except MemoryError:
-                        print("内存不足，复制图像失败")
-                        # 降低帧率或短暂休眠以缓解
-                        time.sleep(0.05)
-                        continue
+                # 发布为最新帧（仅拷贝帧信息结构体，不拷贝图像数据）
+                self.frame_ring.commit(slot, stFrameInfo)
+                _, self.st_frame_info = self.frame_ring.latest_info()
             else:
+                self.frame_ring.abort(slot)
                 consecutive_errors += 1
                 error_code = To_hex_str(ret)
                 from MainPage import logger
@@ -430,24 +422,17 @@ class CameraOperation:
                     self.is_resetting = True
                     logger.log("[INFO] 已设置重置标志，等待其他操作完成...")
                     time.sleep(0.5)  # 等待其他线程完成当前操作
-                    
-                    with self.buf_lock:
-                        logger.log("[INFO] 开始清理缓冲区...")
-                        # 清理可能损坏的缓冲区
-                        self.buf_grab_image = None
-                        self.buf_grab_image_size = 0
-                        self.buf_save_image = None
-                        self.n_save_image_size = 0
-                        
-                        # 在锁内重新分配缓冲区（防止其他线程访问）
-                        try:
-                            time.sleep(0.1)  # 短暂等待，确保缓冲区完全释放
-                            self.buf_grab_image = (c_ubyte * NeedBufSize)()
-                            self.buf_grab_image_size = NeedBufSize
-                            logger.log("[OK] 缓冲区重置成功")
-                            consecutive_errors = 0  # 重置错误计数
-                        except Exception as e:
-                            logger.log(f"[FAIL] 缓冲区重置失败: {e}")
+
+                    logger.log("[INFO] 开始清理缓冲区...")
+                    self.st_frame_info = None
+                    # 重新分配所有槽位；仍被读取方钉住的旧槽位由其引用保持有效
+                    try:
+                        time.sleep(0.1)  # 短暂等待，确保缓冲区完全释放
+                        self.frame_ring.reset(NeedBufSize)
+                        logger.log("[OK] 缓冲区重置成功")
+                        consecutive_errors = 0  # 重置错误计数
+                    except Exception as e:
+                        logger.log(f"[FAIL] 缓冲区重置失败: {e}")
                     
                     # 重置完成后等待，然后清除标志
                     time.sleep(0.2)
@@ -464,53 +449,33 @@ class CameraOperation:
 
     # 存jpg图像
     def Save_jpg(self):
-
-        if self.buf_save_image is None:
-            return
-
-        # 获取缓存锁
-        self.buf_lock.acquire()
-
-        file_path = str(self.st_frame_info.nFrameNum) + ".jpg"
-
-        stSaveParam = MV_SAVE_IMG_TO_FILE_PARAM()
-        stSaveParam.enPixelType = self.st_frame_info.enPixelType  # ch:相机对应的像素格式 | en:Camera pixel type
-        stSaveParam.nWidth = self.st_frame_info.nWidth  # ch:相机对应的宽 | en:Width
-        stSaveParam.nHeight = self.st_frame_info.nHeight  # ch:相机对应的高 | en:Height
-        stSaveParam.nDataLen = self.st_frame_info.nFrameLen
-        stSaveParam.pData = cast(self.buf_save_image, POINTER(c_ubyte))
-        stSaveParam.enImageType = MV_Image_Jpeg  # ch:需要保存的图像类型 | en:Image format to save
-        stSaveParam.nQuality = 80
-        stSaveParam.pImagePath = file_path.encode('ascii')
-        stSaveParam.iMethodValue = 2
-        ret = self.obj_cam.MV_CC_SaveImageToFile(stSaveParam)
-
-        self.buf_lock.release()
-        return ret
+        return self._save_latest_frame(MV_Image_Jpeg, "jpg", 80)
 
     # 存BMP图像
     def Save_Bmp(self):
+        return self._save_latest_frame(MV_Image_Bmp, "bmp", 8)
 
-        if 0 == self.buf_save_image:
+    def _save_latest_frame(self, image_type, ext, quality):
+        if self.frame_ring is None:
             return
 
-        # 获取缓存锁
-        self.buf_lock.acquire()
-
-        file_path = str(self.st_frame_info.nFrameNum) + ".bmp"
-
-        stSaveParam = MV_SAVE_IMG_TO_FILE_PARAM()
-        stSaveParam.enPixelType = self.st_frame_info.enPixelType  # ch:相机对应的像素格式 | en:Camera pixel type
-        stSaveParam.nWidth = self.st_frame_info.nWidth  # ch:相机对应的宽 | en:Width
-        stSaveParam.nHeight = self.st_frame_info.nHeight  # ch:相机对应的高 | en:Height
-        stSaveParam.nDataLen = self.st_frame_info.nFrameLen
-        stSaveParam.pData = cast(self.buf_save_image, POINTER(c_ubyte))
-        stSaveParam.enImageType = MV_Image_Bmp  # ch:需要保存的图像类型 | en:Image format to save
-        stSaveParam.nQuality = 8
-        stSaveParam.pImagePath = file_path.encode('ascii')
-        stSaveParam.iMethodValue = 2
-        ret = self.obj_cam.MV_CC_SaveImageToFile(stSaveParam)
-
-        self.buf_lock.release()
+        # 钉住最新帧槽位，保存期间取图线程不会覆盖它
+        with self.frame_ring.read_latest() as slot:
+            if slot is None:
+                return
+            st_info = slot.st_frame_info
+            file_path = str(st_info.nFrameNum) + "." + ext
+
+            stSaveParam = MV_SAVE_IMG_TO_FILE_PARAM()
+            stSaveParam.enPixelType = st_info.enPixelType  # ch:相机对应的像素格式 | en:Camera pixel type
+            stSaveParam.nWidth = st_info.nWidth  # ch:相机对应的宽 | en:Width
+            stSaveParam.nHeight = st_info.nHeight  # ch:相机对应的高 | en:Height
+            stSaveParam.nDataLen = st_info.nFrameLen
+            stSaveParam.pData = cast(slot.buf, POINTER(c_ubyte))
+            stSaveParam.enImageType = image_type  # ch:需要保存的图像类型 | en:Image format to save
+            stSaveParam.nQuality = quality
+            stSaveParam.pImagePath = file_path.encode('ascii')
+            stSaveParam.iMethodValue = 2
+            ret = self.obj_cam.MV_CC_SaveImageToFile(stSaveParam)
 
         return ret
@@ -0,0 +1,100 @@
+# -- coding: utf-8 --
+import queue
+import threading
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+
+class _DropQueue(queue.Queue):
+    """容量有限的队列：满时丢弃最旧的元素，保证下游总是处理最新帧"""
+
+    def __init__(self, maxsize=1):
+        super().__init__(maxsize)
+        self.dropped = 0
+
+    def put_latest(self, item):
+        while True:
+            try:
+                self.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+
+class FramePipeline(QObject):
+    """
+    分级帧处理流水线（例如 解码 -> 缩放 -> 匹配 -> 叠加），每级一个工作线程。
+
+    - source(): 阻塞等待并返回下一帧（超时返回 None），运行在第一个工作线程中；
+    - stages:   [(名称, 函数), ...]，每个函数接收上一级的输出，返回 None 表示丢弃本帧；
+    - 级间使用容量为 queue_size 的队列，下游处理不过来时丢弃旧帧而不是阻塞上游；
+    - 最后一级的输出通过 frame_ready 信号发回GUI线程（跨线程信号自动排队）。
+    """
+
+    frame_ready = pyqtSignal(object)
+
+    def __init__(self, source, stages, queue_size=1, parent=None):
+        super().__init__(parent)
+        self._source = source
+        self._stages = list(stages)
+        self._queues = [_DropQueue(queue_size) for _ in self._stages]
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    @property
+    def dropped(self):
+        """各级队列累计丢弃的帧数"""
+        return {name: q.dropped for (name, _), q in zip(self._stages, self._queues)}
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop_event.clear()
+        self._threads.append(threading.Thread(target=self._source_loop, daemon=True, name="FramePipeline-source"))
+        for i, (name, _) in enumerate(self._stages):
+            self._threads.append(threading.Thread(target=self._stage_loop, args=(i,), daemon=True,
+                                                  name=f"FramePipeline-{name}"))
+        for t in self._threads:
+            t.start()
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        for t in self._threads:
+            t.join(timeout=timeout)
+        self._threads = []
+
+    def _source_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                item = self._source()
+            except Exception as e:
+                print(f"帧流水线取帧异常: {e}")
+                self._stop_event.wait(0.1)
+                continue
+            if item is not None and self._queues:
+                self._queues[0].put_latest(item)
+
+    def _stage_loop(self, index):
+        name, fn = self._stages[index]
+        in_queue = self._queues[index]
+        is_last = index == len(self._stages) - 1
+        while not self._stop_event.is_set():
+            try:
+                item = in_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                result = fn(item)
+            except Exception as e:
+                print(f"帧流水线[{name}]处理异常: {e}")
+                continue
+            if result is None:
+                continue
+            if is_last:
+                self.frame_ready.emit(result)
+            else:
+                self._queues[index + 1].put_latest(result)
@@ -0,0 +1,152 @@
+# -- coding: utf-8 --
+import threading
+import time
+from contextlib import contextmanager
+from ctypes import c_ubyte, sizeof, memmove, byref
+
+import numpy as np
+
+from CameraConfig.CameraParams_header import MV_FRAME_OUT_INFO_EX
+
+
+class FrameSlot:
+    """环形缓冲区中的一个帧槽位（预分配的ctypes缓冲区 + 帧信息）"""
+
+    def __init__(self, index, size):
+        self.index = index
+        self.buf = (c_ubyte * size)()
+        self.size = size
+        self.st_frame_info = MV_FRAME_OUT_INFO_EX()
+        self.seq = 0
+        self.timestamp = 0.0
+        self.readers = 0
+        # 只读NumPy视图直接指向ctypes内存，不做任何拷贝
+        self._view = np.frombuffer(self.buf, dtype=np.uint8)
+        self._view.flags.writeable = False
+
+    @property
+    def width(self):
+        return self.st_frame_info.nWidth
+
+    @property
+    def height(self):
+        return self.st_frame_info.nHeight
+
+    @property
+    def frame_len(self):
+        return self.st_frame_info.nFrameLen
+
+    def data(self):
+        """返回当前帧的只读一维视图（长度为nFrameLen）"""
+        return self._view[:self.frame_len]
+
+    def image(self):
+        """返回当前帧的只读二维视图 (height, width)，仅适用于8bit单通道/Bayer数据"""
+        return self._view[:self.width * self.height].reshape((self.height, self.width))
+
+
+class FrameRing:
+    """
+    取图线程与显示/处理线程之间的零拷贝N槽环形缓冲区。
+
+    - 取图线程通过 acquire_write() 拿到下一个空闲槽位，相机SDK直接写入该槽位的缓冲区，
+      写完后 commit() 发布为"最新帧"，序号递增。
+    - 读取方通过 read_latest() 上下文管理器获得最新完成帧的只读视图；读取期间该槽位被钉住，
+      取图线程不会覆盖它。
+    - 锁只保护槽位索引/计数的簿记，持锁时间与帧大小无关。
+    """
+
+    def __init__(self, slot_size, n_slots=3):
+        if n_slots < 2:
+            raise ValueError("n_slots 至少为2")
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self.n_slots = n_slots
+        self.slot_size = 0
+        self._slots = []
+        self._latest = None
+        self._writing = None
+        self._seq = 0
+        self.dropped = 0
+        self.reset(slot_size)
+
+    def reset(self, slot_size=None):
+        """重新分配全部槽位（例如缓冲区错误后）。已钉住的旧槽位由读取方持有引用，不会被释放。"""
+        with self._lock:
+            size = int(slot_size or self.slot_size)
+            self._slots = [FrameSlot(i, size) for i in range(self.n_slots)]
+            self.slot_size = size
+            self._latest = None
+            self._writing = None
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def acquire_write(self):
+        """取图线程获取一个可写槽位：跳过最新帧槽位和正在被读取的槽位"""
+        with self._lock:
+            start = (self._latest.index + 1) if self._latest is not None else 0
+            for k in range(self.n_slots):
+                slot = self._slots[(start + k) % self.n_slots]
+                if slot is not self._latest and slot.readers == 0:
+                    self._writing = slot
+                    return slot
+            # 所有非最新槽位都被钉住（读取方过慢），本帧丢弃
+            self.dropped += 1
+            return None
+
+    def commit(self, slot, st_frame_info):
+        """发布写入完成的槽位为最新帧，返回该帧序号"""
+        with self._lock:
+            if slot is not self._writing:
+                # 写入期间发生了reset，该槽位已失效
+                return 0
+            memmove(byref(slot.st_frame_info), byref(st_frame_info), sizeof(MV_FRAME_OUT_INFO_EX))
+            self._seq += 1
+            slot.seq = self._seq
+            slot.timestamp = time.time()
+            self._latest = slot
+            self._writing = None
+            self._cond.notify_all()
+            return self._seq
+
+    def abort(self, slot):
+        """取图失败时放弃已申请的槽位"""
+        with self._lock:
+            if slot is self._writing:
+                self._writing = None
+
+    def latest_info(self):
+        """返回 (序号, 帧信息拷贝) 的快照，不钉住槽位"""
+        with self._lock:
+            if self._latest is None:
+                return 0, None
+            st_copy = MV_FRAME_OUT_INFO_EX()
+            memmove(byref(st_copy), byref(self._latest.st_frame_info), sizeof(MV_FRAME_OUT_INFO_EX))
+            return self._latest.seq, st_copy
+
+    def wait_for(self, after_seq, timeout=None):
+        """阻塞等待序号大于 after_seq 的新帧，返回最新序号（超时返回当前序号）"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after_seq, timeout)
+            return self._seq
+
+    @contextmanager
+    def read_latest(self, after_seq=0):
+        """
+        钉住最新完成的槽位并返回它；若没有比 after_seq 更新的帧则返回 None。
+        注意：视图只在with块内有效，离开后需要保留的数据必须自行拷贝（或经由cvtColor等产生新数组）。
+        """
+        with self._lock:
+            slot = self._latest
+            if slot is None or slot.seq <= after_seq:
+                slot = None
+            else:
+                slot.readers += 1
+        try:
+            yield slot
+        finally:
+            if slot is not None:
+                with self._lock:
+                    slot.readers -= 1
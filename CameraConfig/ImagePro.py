@@ -1,25 +1,27 @@
 import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
 
 import cv2
 import numpy as np
-from functools import lru_cache
+
+from CalibrationStore import calibration
 
 # 全局变量，用于存储预加载的模板
 templateNeedle = None
 templateNeedle_size = (0, 0)
-templateDevice = None
-templateDevice_size = (0, 0)
 templateLight = None
 templateLight_size = (0, 0)
 
 
 # 缓存模板加载结果
 def load_templates():
-    global templateNeedle, templateNeedle_size, templateDevice, templateDevice_size, templateLight, templateLight_size
+    global templateNeedle, templateNeedle_size, templateLight, templateLight_size
     # 定义模板路径和对应的全局变量
     templates = {
         'templateNeedle.png': ('templateNeedle', 'templateNeedle_size'),
-        'templatepad.png': ('templateDevice', 'templateDevice_size'),
         'templateLight.png': ('templateLight', 'templateLight_size')
     }
 
@@ -44,6 +46,38 @@ def load_templates():
         else:
             print(f"Template file not found: {path}")
 
+    # pad模板（templatepad.png）由模板库加载：仅在文件mtime变化时重建各尺度模板
+    device_bank.refresh()
+
+
+def demosaic_for_display(raw, fast=True, roi=None):
+    """
+    Bayer原始帧 -> 三通道图像（通道顺序与 cv2.COLOR_BayerBG2RGB 一致）。
+
+    fast=True 时使用 2x2 超像素合并：每个 2x2 Bayer 单元直接合成一个像素，
+    分辨率减半、不做插值，计算量约为全分辨率解码的 1/4，适合随后还要缩小显示的场景。
+    fast=False 时走全分辨率 cvtColor 解码（高质量）。
+    roi=(x, y, w, h) 为传感器坐标下的裁剪区域，在解码前裁剪；起点对齐到偶数以保持 Bayer 相位。
+    """
+    if roi is not None:
+        x, y, w, h = roi
+        x, y = max(0, int(x)) & ~1, max(0, int(y)) & ~1
+        w, h = int(w) & ~1, int(h) & ~1
+        if w > 0 and h > 0:
+            raw = raw[y:y + h, x:x + w]
+
+    if not fast:
+        return cv2.cvtColor(raw, cv2.COLOR_BayerBG2RGB)
+
+    h, w = raw.shape[:2]
+    raw = raw[:h & ~1, :w & ~1]
+    c0 = raw[0::2, 0::2]
+    c2 = raw[1::2, 1::2]
+    # 两个绿色像素取平均
+    c1 = cv2.addWeighted(np.ascontiguousarray(raw[0::2, 1::2]), 0.5,
+                         np.ascontiguousarray(raw[1::2, 0::2]), 0.5, 0)
+    return cv2.merge([np.ascontiguousarray(c0), c1, np.ascontiguousarray(c2)])
+
 
 def is_nearby_vectorized(centers_np, x, y, min_distance):
     """
@@ -59,73 +93,316 @@ import cv2
 import numpy as np
 
 
+# 灰度模板金字塔缓存：id(模板) -> (模板引用, [第0层, 第1层, ...])
+_template_pyramid_cache = {}
+
+
+def _to_gray(image):
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+
+
+def _template_pyramid(template_img, levels):
+    """返回模板的灰度金字塔，模板更新（对象变化）后自动重建"""
+    key = id(template_img)
+    cached = _template_pyramid_cache.get(key)
+    if cached is None or cached[0] is not template_img or len(cached[1]) <= levels:
+        pyramid = [_to_gray(template_img)]
+        for _ in range(levels):
+            pyramid.append(cv2.pyrDown(pyramid[-1]))
+        # 只保留当前模板，避免旧模板无限累积
+        _template_pyramid_cache.clear()
+        _template_pyramid_cache[key] = (template_img, pyramid)
+        cached = _template_pyramid_cache[key]
+    return cached[1]
+
+
+def _subpixel_peak(res, loc):
+    """在相关响应图的峰值处做一维抛物线拟合，返回亚像素偏移 (dx, dy)，范围 [-0.5, 0.5]"""
+    x, y = loc
+    h, w = res.shape
+    dx = dy = 0.0
+    if 0 < x < w - 1:
+        l, c, r = res[y, x - 1], res[y, x], res[y, x + 1]
+        denom = l - 2 * c + r
+        if denom < 0:
+            dx = float(np.clip(0.5 * (l - r) / denom, -0.5, 0.5))
+    if 0 < y < h - 1:
+        t, c, b = res[y - 1, x], res[y, x], res[y + 1, x]
+        denom = t - 2 * c + b
+        if denom < 0:
+            dy = float(np.clip(0.5 * (t - b) / denom, -0.5, 0.5))
+    return dx, dy
+
+
+# 3x3 邻域二次曲面 f(u,v)=a+bu+cv+du²+euv+fv² 的最小二乘设计矩阵及其伪逆（常量，只算一次）
+_QUAD_U, _QUAD_V = np.meshgrid([-1.0, 0.0, 1.0], [-1.0, 0.0, 1.0])
+_QUAD_A = np.stack([np.ones(9), _QUAD_U.ravel(), _QUAD_V.ravel(),
+                    _QUAD_U.ravel() ** 2, (_QUAD_U * _QUAD_V).ravel(), _QUAD_V.ravel() ** 2], axis=1)
+_QUAD_PINV = np.linalg.pinv(_QUAD_A)
+
+# 亚像素定位结果：x/y 为模板中心（含参考点偏移）的亚像素坐标，cov 为 2x2 位置协方差（像素²）
+ProbeLocation = namedtuple('ProbeLocation', ['x', 'y', 'score', 'confidence', 'cov'])
+
+
+def _quadratic_peak(res, loc):
+    """
+    在峰值 3x3 邻域内拟合二维二次曲面，返回 (dx, dy, cov)。
+
+    dx/dy 为曲面极值相对整数峰值的偏移；cov 由拟合残差噪声经 Hessian 传播得到，
+    峰越尖锐、拟合越好，协方差越小。峰在边界或曲面非凸时退回一维抛物线拟合，cov 为 None。
+    """
+    x, y = loc
+    h, w = res.shape
+    if not (0 < x < w - 1 and 0 < y < h - 1):
+        dx, dy = _subpixel_peak(res, loc)
+        return dx, dy, None
+    patch = res[y - 1:y + 2, x - 1:x + 2].astype(np.float64).ravel()
+    coef = _QUAD_PINV @ patch
+    _, b, c, d, e, f = coef
+    hess = np.array([[2 * d, e], [e, 2 * f]])
+    # 极大值要求 Hessian 负定
+    if hess[0, 0] >= 0 or np.linalg.det(hess) <= 0:
+        dx, dy = _subpixel_peak(res, loc)
+        return dx, dy, None
+    hess_inv = np.linalg.inv(hess)
+    offset = -hess_inv @ np.array([b, c])
+    if np.any(np.abs(offset) > 1.0):
+        dx, dy = _subpixel_peak(res, loc)
+        return dx, dy, None
+    # 残差方差（9个点、6个参数），下限避免完美拟合时协方差为0
+    resid = patch - _QUAD_A @ coef
+    noise_var = max(float(resid @ resid) / 3.0, 1e-6)
+    # 梯度 (b, c) 各由6个点估计，方差为 noise_var/6；偏移 = -H⁻¹g，故 cov = H⁻¹ Σg H⁻¹
+    cov = hess_inv @ (np.eye(2) * noise_var / 6.0) @ hess_inv
+    # 加上二次模型本身的偏差下限（约0.05像素）
+    cov += np.eye(2) * 0.05 ** 2
+    return float(offset[0]), float(offset[1]), cov
+
+
+def refine_subpixel(image, template_img, x, y, threshold=0.6):
+    """
+    在已知的模板左上角 (x, y) 附近重新计算小窗口相关图并做二次曲面拟合。
+
+    返回 ProbeLocation（x/y 仍为模板左上角坐标），未命中时返回 None。
+    置信度 = 得分 / (1 + 位置标准差)，同时反映匹配相似度和峰值的尖锐程度。
+    """
+    image_gray = _to_gray(image)
+    templ_gray = _template_pyramid(template_img, 0)[0]
+    ih, iw = image_gray.shape[:2]
+    th, tw = templ_gray.shape[:2]
+    ix, iy = int(round(x)), int(round(y))
+    # 窗口覆盖整数峰值两侧各2个像素，保证3x3邻域完整
+    x0, y0 = max(0, ix - 2), max(0, iy - 2)
+    x1, y1 = min(iw, ix + tw + 2), min(ih, iy + th + 2)
+    if x1 - x0 < tw or y1 - y0 < th:
+        return None
+    res = cv2.matchTemplate(image_gray[y0:y1, x0:x1], templ_gray, cv2.TM_CCOEFF_NORMED)
+    _, max_val, _, max_loc = cv2.minMaxLoc(res)
+    if max_val < threshold:
+        return None
+    dx, dy, cov = _quadratic_peak(res, max_loc)
+    if cov is None:
+        # 一维拟合没有误差估计，按量化误差（1/12像素²）保守给出
+        cov = np.eye(2) / 12.0
+    sigma = float(np.sqrt(np.trace(cov) / 2.0))
+    confidence = float(max_val) / (1.0 + sigma)
+    return ProbeLocation(x0 + max_loc[0] + dx, y0 + max_loc[1] + dy, float(max_val), confidence, cov)
+
+
+def pyramid_match(image, template_img, levels=2, threshold=0.6, search_margin=None):
+    """
+    由粗到精的灰度金字塔模板匹配（TM_CCOEFF_NORMED）。
+
+    先在缩小 2**levels 倍的图像上全局搜索，再回到原分辨率只在粗定位峰值附近的小窗口内精匹配，
+    最后对峰值做抛物线插值得到亚像素位置。若精匹配得分低于 threshold（粗层可能漏检），
+    退回原分辨率全图搜索以保证结果正确。
+
+    返回 (x, y, score)，x/y 为模板左上角的亚像素坐标；模板比图像大时返回 (None, None, -1)。
+    """
+    image_gray = _to_gray(image)
+    ih, iw = image_gray.shape[:2]
+    th, tw = template_img.shape[:2]
+    if th > ih or tw > iw:
+        return None, None, -1.0
+
+    # 模板在最粗层至少保留约8个像素，否则减少层数
+    while levels > 0 and min(th, tw) >> levels < 8:
+        levels -= 1
+    templ_pyramid = _template_pyramid(template_img, levels)
+    templ_gray = templ_pyramid[0]
+
+    if levels > 0:
+        coarse = image_gray
+        for _ in range(levels):
+            coarse = cv2.pyrDown(coarse)
+        res = cv2.matchTemplate(coarse, templ_pyramid[levels], cv2.TM_CCOEFF_NORMED)
+        _, _, _, coarse_loc = cv2.minMaxLoc(res)
+
+        # 回到原分辨率，在粗定位附近开窗精匹配
+        scale = 1 << levels
+        margin = search_margin if search_margin is not None else 2 * scale
+        x0 = max(0, coarse_loc[0] * scale - margin)
+        y0 = max(0, coarse_loc[1] * scale - margin)
+        x1 = min(iw, coarse_loc[0] * scale + tw + margin)
+        y1 = min(ih, coarse_loc[1] * scale + th + margin)
+        res = cv2.matchTemplate(image_gray[y0:y1, x0:x1], templ_gray, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, max_loc = cv2.minMaxLoc(res)
+        if max_val >= threshold:
+            dx, dy = _subpixel_peak(res, max_loc)
+            return x0 + max_loc[0] + dx, y0 + max_loc[1] + dy, float(max_val)
+
+    # 单层或粗层漏检：原分辨率全图搜索
+    res = cv2.matchTemplate(image_gray, templ_gray, cv2.TM_CCOEFF_NORMED)
+    _, max_val, _, max_loc = cv2.minMaxLoc(res)
+    dx, dy = _subpixel_peak(res, max_loc)
+    return max_loc[0] + dx, max_loc[1] + dy, float(max_val)
+
+
+class TrackState(Enum):
+    IDLE = 'idle'              # 尚未锁定目标
+    TRACKING = 'tracking'      # 在上一位置附近的窗口内持续命中
+    REACQUIRED = 'reacquired'  # 丢失后通过全局搜索重新找到
+    LOST = 'lost'              # 窗口和全局搜索都未命中
+
+
+class ProbeTracker:
+    """
+    探针/光纤跟踪匹配：优先在上一次位置附近的窗口内搜索（开销与窗口大小成正比，而非整帧），
+    窗口未命中时先扩大窗口，再退回全局金字塔搜索；全局也未命中则进入 LOST 状态。
+    """
+
+    def __init__(self, margin=24, max_margin=96):
+        self.margin = margin
+        self.max_margin = max_margin
+        self.state = TrackState.IDLE
+        self.last_loc = None       # 模板左上角（亚像素）
+        self.last_score = -1.0
+        self._template_id = None
+
+    @property
+    def lost(self):
+        return self.state == TrackState.LOST
+
+    def reset(self):
+        self.state = TrackState.IDLE
+        self.last_loc = None
+        self.last_score = -1.0
+
+    def _match_window(self, image, template_img, margin, threshold):
+        ih, iw = image.shape[:2]
+        th, tw = template_img.shape[:2]
+        lx, ly = int(round(self.last_loc[0])), int(round(self.last_loc[1]))
+        x0, y0 = max(0, lx - margin), max(0, ly - margin)
+        x1, y1 = min(iw, lx + tw + margin), min(ih, ly + th + margin)
+        if x1 - x0 < tw or y1 - y0 < th:
+            return None, None, -1.0
+        x, y, score = pyramid_match(image[y0:y1, x0:x1], template_img, levels=0, threshold=threshold)
+        if x is None:
+            return None, None, -1.0
+        return x0 + x, y0 + y, score
+
+    def match(self, image, template_img, threshold=0.6):
+        """返回 (x, y, score)，x/y 为模板左上角亚像素坐标；未命中时 x/y 为 None"""
+        if self._template_id != id(template_img):
+            # 模板更换后之前的位置不再可信
+            self._template_id = id(template_img)
+            self.reset()
+
+        if self.last_loc is not None and self.state != TrackState.LOST:
+            margin = self.margin
+            while margin <= self.max_margin:
+                x, y, score = self._match_window(image, template_img, margin, threshold)
+                if x is not None and score >= threshold:
+                    self.state = TrackState.TRACKING
+                    self.last_loc, self.last_score = (x, y), score
+                    return x, y, score
+                margin *= 2
+
+        x, y, score = pyramid_match(image, template_img, threshold=threshold)
+        if x is not None and score >= threshold:
+            self.state = TrackState.REACQUIRED if self.state == TrackState.LOST else TrackState.TRACKING
+            self.last_loc, self.last_score = (x, y), score
+            return x, y, score
+
+        self.state = TrackState.LOST
+        self.last_score = score
+        return None, None, score
+
+
+# 每种设备（0电探针，1光纤）各自一个跟踪器
+_trackers = {0: ProbeTracker(), 1: ProbeTracker()}
+
+
+def get_tracker(equipment=0):
+    return _trackers[1 if equipment else 0]
+
+
+# 每种设备最近一次的亚像素定位结果
+_last_locations = {0: None, 1: None}
+
+
+def last_probe_location(equipment=0):
+    """返回最近一次 locate_probe 的结果（ProbeLocation），未命中或尚未匹配时为 None"""
+    return _last_locations[1 if equipment else 0]
+
+
+def locate_probe(image, x_dia=0, y_dia=0, equipment=0, threshold=0.6):
+    """
+    探针/光纤亚像素定位：跟踪器给出粗位置，再在峰值附近做二次曲面拟合。
+
+    返回 ProbeLocation，x/y 为参考点（模板中心加 dia 偏移）的亚像素坐标；未命中返回 None。
+    """
+    equipment = 1 if equipment else 0
+    template_img = templateLight if equipment else templateNeedle
+    if template_img is None:
+        _last_locations[equipment] = None
+        return None
+
+    tracker = get_tracker(equipment)
+    x, y, score = tracker.match(image, template_img, threshold)
+    location = None
+    if x is not None and score >= threshold:
+        location = refine_subpixel(image, template_img, x, y, threshold)
+        if location is None:
+            # 细化窗口不完整（贴近图像边缘），沿用跟踪器的抛物线结果
+            location = ProbeLocation(x, y, score, score / (1.0 + np.sqrt(1 / 12.0)), np.eye(2) / 12.0)
+        else:
+            # 用拟合结果更新跟踪位置，下一帧窗口更准
+            tracker.last_loc = (location.x, location.y)
+        h, w = template_img.shape[:2]
+        location = location._replace(x=location.x + w // 2 + x_dia, y=location.y + h // 2 + y_dia)
+    _last_locations[equipment] = location
+    return location
+
+
 def template(video, x_dia=0, y_dia=0, equipment=0, sharpen_params=None):
-    """高性能彩色图像模板匹配（无预处理）"""
-    global templateNeedle, templateLight
+    """
+    探针/光纤模板匹配并在画面上标记匹配点。
 
-    # ================================= 步骤1：直接使用彩色图像 =================================
+    返回 (x, y, 模板高, 模板宽)，x/y 为亚像素坐标（浮点），需要误差/置信度时使用 locate_probe。
+    """
     template_img = templateLight if equipment else templateNeedle
     if template_img is None:
         return None, None, 0, 0
 
-    # 确保都是彩色图像
-    if len(video.shape) == 2:
-        video = cv2.cvtColor(video, cv2.COLOR_GRAY2BGR)
-    if len(template_img.shape) == 2:
-        template_img = cv2.cvtColor(template_img, cv2.COLOR_GRAY2BGR)
-
-    # ================================= 步骤2：简化的单尺度匹配 =================================
-    # 使用最快的匹配方法，减少尺度搜索
-    scales = [1.0]  # 只使用原始尺度，提升性能
-    best_val = -1
-    best_loc = None
-    best_scale = 1.0
-    best_template = template_img
-    
-    for scale in scales:
-        # 缩放模板
-        if scale != 1.0:
-            h, w = template_img.shape[:2]
-            new_h, new_w = int(h * scale), int(w * scale)
-            if new_h < 10 or new_w < 10:
-                continue
-            scaled_template = cv2.resize(template_img, (new_w, new_h))
-        else:
-            scaled_template = template_img
-        
-        # 使用单一最快的匹配方法
-        res = cv2.matchTemplate(video, scaled_template, cv2.TM_CCOEFF_NORMED)
-        _, max_val, _, max_loc = cv2.minMaxLoc(res)
-        
-        if max_val > best_val:
-            best_val = max_val
-            best_loc = max_loc
-            best_scale = scale
-            best_template = scaled_template
-
-    # ================================= 步骤3：快速匹配判断 =================================
     threshold = 0.6  # 统一阈值
-    if best_val > threshold:
-        x, y = best_loc
-        h, w = best_template.shape[:2]
-
-        # 计算红点中心并绘制
-        red_dot_x = int(x + w // 2 + x_dia)
-        red_dot_y = int(y + h // 2 + y_dia)
-        
+    location = locate_probe(video, x_dia, y_dia, equipment, threshold)
+
+    if location is not None:
         # 根据匹配得分调整红点颜色
-        if best_val > 0.8:
+        if location.score > 0.8:
             color = (0, 255, 0)  # 绿色 - 高置信度
-        elif best_val > 0.7:
+        elif location.score > 0.7:
             color = (0, 165, 255)  # 橙色 - 中等置信度
         else:
             color = (0, 0, 255)  # 红色 - 低置信度
-        
-        cv2.circle(video, (red_dot_x, red_dot_y), 5, color, -1)
 
-        return red_dot_x, red_dot_y, template_img.shape[0], template_img.shape[1]
+        cv2.circle(video, (int(round(location.x)), int(round(location.y))), 5, color, -1)
+
+        return location.x, location.y, template_img.shape[0], template_img.shape[1]
     else:
-        cv2.putText(video, f"No Match (Score={best_val:.2f}, Need>{threshold:.2f})", (10, 30),
+        best_val = get_tracker(equipment).last_score
+        cv2.putText(video, f"No Match (Score={best_val:.2f}, Need>={threshold:.2f})", (10, 30),
                     cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
         return None, None, 0, 0
 
@@ -200,110 +477,231 @@ def adaptive_preprocess(image):
     return image
 
 
-def match_device_templates(video):
-    global templateDevice, templateDevice_size
+def _local_peaks(res, threshold, w, h):
+    """
+    在匹配响应图中提取局部极大值：膨胀后与原图相等且超过阈值的点。
+    邻域取模板尺寸的一半，相当于每个pad区域只留一个候选点。返回 (xs, ys, scores)。
+    """
+    kw, kh = max(1, w // 2) | 1, max(1, h // 2) | 1
+    dilated = cv2.dilate(res, cv2.getStructuringElement(cv2.MORPH_RECT, (kw, kh)))
+    ys, xs = np.nonzero((res >= threshold) & (res >= dilated))
+    return xs, ys, res[ys, xs]
+
+
+def _nms_centers(cx, cy, ws, hs, scores):
+    """
+    按得分从高到低的贪心非极大值抑制（向量化）：中心点在两框较小宽/高一半以内视为重叠。
+    返回保留下来的索引（按得分降序）。
+    """
+    order = np.argsort(-scores, kind='stable')
+    suppressed = np.zeros(len(order), dtype=bool)
+    keep = []
+    for i in order:
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        suppressed |= ((np.abs(cx - cx[i]) < np.minimum(ws, ws[i]) // 2) &
+                       (np.abs(cy - cy[i]) < np.minimum(hs, hs[i]) // 2))
+    return keep
+
+
+# 多尺度/多角度匹配共用的持久线程池（cv2.matchTemplate/dft 执行时会释放GIL）
+_match_workers = max(1, min(4, os.cpu_count() or 1))
+_match_executor = None
+_match_executor_lock = threading.Lock()
+
+
+def set_match_workers(n):
+    """设置匹配线程池的线程数；n<=1 时在调用线程中顺序执行。可在匹配进行中调用"""
+    global _match_workers, _match_executor
+    with _match_executor_lock:
+        _match_workers = max(1, int(n))
+        if _match_executor is not None:
+            _match_executor.shutdown(wait=False)
+            _match_executor = None
+
+
+def _parallel_map(fn, items):
+    """在匹配线程池中并行执行 fn(item)，按输入顺序返回结果"""
+    global _match_executor
+    items = list(items)
+    if _match_workers <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+    # 在锁内提交全部任务：set_match_workers 替换线程池时不会有任务提交到已关闭的旧线程池，
+    # 旧线程池中已提交的任务照常执行完
+    with _match_executor_lock:
+        if _match_executor is None:
+            _match_executor = ThreadPoolExecutor(max_workers=_match_workers, thread_name_prefix='TemplateMatch')
+        futures = [_match_executor.submit(fn, item) for item in items]
+    return [f.result() for f in futures]
+
+
+class TemplateBank:
+    """
+    多尺度（可选多角度）模板库：按模板文件 mtime 缓存灰度模板及其所有缩放/旋转变体，
+    匹配时不再重复 resize。
+
+    use_fft=True 时对整幅图像只做一次DFT，所有变体共享该频谱，每个变体只需一次频域乘法和逆变换，
+    再用盒式滤波求局部方差完成 TM_CCOEFF_NORMED 归一化；模板频谱按DFT尺寸缓存。
+    对当前尺寸的pad模板，cv2.matchTemplate 单次调用更快，因此默认关闭；
+    变体数量（尺度×角度）或模板尺寸变大时再打开。
+    """
+
+    def __init__(self, path, scales=(0.8, 0.9, 1.0, 1.1, 1.2), angles=(0,), use_fft=False, min_size=10):
+        self.path = path
+        self.scales = tuple(scales)
+        self.angles = tuple(angles)
+        self.use_fft = use_fft
+        self.min_size = min_size
+        self.image = None
+        self.gray = None
+        self.variants = []   # [(scale, angle, 灰度模板), ...]
+        self._mtime = None
+        self._spectra = {}   # DFT尺寸 -> [(频谱, 模板去均值后的平方和), ...]
+
+    def refresh(self):
+        """模板文件有变化时重新加载，返回是否重建"""
+        if not os.path.exists(self.path):
+            return False
+        mtime = os.path.getmtime(self.path)
+        if mtime == self._mtime:
+            return False
+        img = cv2.imread(self.path, cv2.IMREAD_COLOR)
+        if img is None:
+            return False
+        self.build(img)
+        self._mtime = mtime
+        return True
+
+    def build(self, image):
+        """由模板图像生成全部尺度/角度的灰度变体"""
+        self.image = image
+        self.gray = _to_gray(image)
+        h, w = self.gray.shape
+        variants = []
+        for scale in self.scales:
+            new_w, new_h = int(w * scale), int(h * scale)
+            if new_w < self.min_size or new_h < self.min_size:
+                continue
+            scaled = self.gray if scale == 1.0 else cv2.resize(self.gray, (new_w, new_h))
+            for angle in self.angles:
+                if angle:
+                    m = cv2.getRotationMatrix2D((new_w / 2.0, new_h / 2.0), angle, 1.0)
+                    variant = cv2.warpAffine(scaled, m, (new_w, new_h), borderMode=cv2.BORDER_REPLICATE)
+                else:
+                    variant = scaled
+                variants.append((scale, angle, variant))
+        self.variants = variants
+        self._spectra = {}
+
+    def _template_spectra(self, dft_size):
+        spectra = self._spectra.get(dft_size)
+        if spectra is None:
+            spectra = []
+            for _, _, templ in self.variants:
+                t = templ.astype(np.float32)
+                t -= t.mean()
+                padded = np.zeros(dft_size, np.float32)
+                padded[:t.shape[0], :t.shape[1]] = t
+                spectra.append((cv2.dft(padded), float((t * t).sum())))
+            self._spectra[dft_size] = spectra
+        return spectra
+
+    def _match_all_fft(self, image_gray):
+        ih, iw = image_gray.shape
+        dft_size = (cv2.getOptimalDFTSize(ih), cv2.getOptimalDFTSize(iw))
+        padded = np.zeros(dft_size, np.float32)
+        padded[:ih, :iw] = image_gray
+        image_spectrum = cv2.dft(padded)
+        # 局部和用float64计算，避免大窗口下 E[x^2]-E[x]^2 的精度损失
+        image_d = image_gray.astype(np.float64)
+        image_sq = image_d * image_d
+
+        # 局部方差只依赖模板尺寸，先按尺寸算好，供各变体共享
+        local_std = {}
+        for _, _, templ in self.variants:
+            th, tw = templ.shape
+            if th <= ih and tw <= iw and (th, tw) not in local_std:
+                box = dict(ddepth=-1, ksize=(tw, th), anchor=(0, 0), normalize=False,
+                           borderType=cv2.BORDER_CONSTANT)
+                s1 = cv2.boxFilter(image_d, **box)[:ih - th + 1, :iw - tw + 1]
+                s2 = cv2.boxFilter(image_sq, **box)[:ih - th + 1, :iw - tw + 1]
+                local_std[(th, tw)] = np.sqrt(np.maximum(s2 - s1 * s1 / (th * tw), 0))
+
+        def correlate(job):
+            (scale, angle, templ), (spectrum, templ_norm) = job
+            th, tw = templ.shape
+            corr = cv2.idft(cv2.mulSpectrums(image_spectrum, spectrum, 0, conjB=True),
+                            flags=cv2.DFT_REAL_OUTPUT | cv2.DFT_SCALE)[:ih - th + 1, :iw - tw + 1]
+            # 与 cv2.matchTemplate 相同的归一化规则：分母过小（平坦区域）时按比值截断或置0
+            denom = local_std[(th, tw)] * np.sqrt(templ_norm)
+            num = np.abs(corr)
+            res = np.zeros_like(corr)
+            ok = num < denom
+            res[ok] = corr[ok] / denom[ok]
+            edge = ~ok & (num < denom * 1.125)
+            res[edge] = np.sign(corr[edge])
+            return scale, angle, tw, th, res
+
+        jobs = [job for job in zip(self.variants, self._template_spectra(dft_size))
+                if (job[0][2].shape[0], job[0][2].shape[1]) in local_std]
+        return _parallel_map(correlate, jobs)
+
+    def match_all(self, image_gray):
+        """对所有变体做 TM_CCOEFF_NORMED 匹配，返回 [(scale, angle, w, h, 响应图), ...]"""
+        if self.use_fft:
+            return self._match_all_fft(image_gray)
+        ih, iw = image_gray.shape
+
+        def correlate(variant):
+            scale, angle, templ = variant
+            th, tw = templ.shape
+            return scale, angle, tw, th, cv2.matchTemplate(image_gray, templ, cv2.TM_CCOEFF_NORMED)
+
+        # 各变体在持久线程池中并行匹配，结果合并后统一做NMS
+        return _parallel_map(correlate, [v for v in self.variants
+                                         if v[2].shape[0] <= ih and v[2].shape[1] <= iw])
+
+
+# pad（器件）模板库
+device_bank = TemplateBank('templatepad.png')
+
 
-    if templateDevice is None:
+def match_device_templates(video):
+    if not device_bank.variants:
         print("模板未加载，无法进行匹配")
         return []
 
-    try:
-        with open('Paddia.txt', 'r', encoding='utf-8') as f:
-            xdia, ydia = map(int, f.read().strip().split(','))
-    except:
-        xdia, ydia = 0, 0
+    xdia, ydia = calibration.pad_dia
 
     # 灰度转换
-    video_gray = cv2.cvtColor(video, cv2.COLOR_BGR2GRAY) if len(video.shape) == 3 else video
-    template_gray = cv2.cvtColor(templateDevice, cv2.COLOR_BGR2GRAY) if len(
-        templateDevice.shape) == 3 else templateDevice
-
-    original_template_h, original_template_w = template_gray.shape
-
-    # 多尺度匹配
-    scales = [0.8, 0.9, 1.0, 1.1, 1.2]
-    all_matches = []
-
-    for scale in scales:
-        # 缩放模板
-        if scale != 1.0:
-            new_w = int(original_template_w * scale)
-            new_h = int(original_template_h * scale)
-            if new_w < 10 or new_h < 10: continue
-            template_resized = cv2.resize(template_gray, (new_w, new_h))
-        else:
-            template_resized = template_gray
-
-        # 执行匹配
-        res = cv2.matchTemplate(video_gray, template_resized, cv2.TM_CCOEFF_NORMED)
-
-        # 更严格的阈值设置
-        threshold = max(0.85, 0.8)  # 使用固定高阈值或更智能的动态阈值
-        locs = np.where(res >= threshold)
-
-        # 只保留每个局部区域的最佳匹配
-        temp_matches = []
-        for pt in zip(*locs[::-1]):
-            temp_matches.append({
-                'pt': pt,
-                'size': (template_resized.shape[1], template_resized.shape[0]),
-                'score': res[pt[1], pt[0]],
-                'scale': scale
-            })
-
-        # 对当前尺度的匹配进行局部NMS
-        temp_matches.sort(key=lambda x: x['score'], reverse=True)
-        filtered_matches = []
-        for match in temp_matches:
-            pt = match['pt']
-            w, h = match['size']
-            center_x = pt[0] + w // 2
-            center_y = pt[1] + h // 2
-
-            # 更严格的重叠检查
-            overlap = False
-            for selected in filtered_matches:
-                s_pt = selected['pt']
-                s_w, s_h = selected['size']
-                s_center_x = s_pt[0] + s_w // 2
-                s_center_y = s_pt[1] + s_h // 2
-
-                # 检查中心点距离和区域重叠
-                if (abs(center_x - s_center_x) < max(w, s_w) // 2 and
-                        abs(center_y - s_center_y) < max(h, s_h) // 2):
-                    overlap = True
-                    break
-
-            if not overlap:
-                filtered_matches.append(match)
-
-        all_matches.extend(filtered_matches)
-
-    # 全局非极大值抑制
-    all_matches.sort(key=lambda x: x['score'], reverse=True)
-    final_locations = []
-
-    for match in all_matches:
-        pt = match['pt']
-        w, h = match['size']
-        center_x = pt[0] + w // 2 + xdia
-        center_y = pt[1] + h // 2 + ydia
-
-        # 更严格的重叠检查
-        overlap = False
-        for selected in final_locations:
-            s_x, s_y, s_w, s_h = selected
-            s_center_x = s_x + s_w // 2
-            s_center_y = s_y + s_h // 2
-
-            # 使用更小的重叠阈值
-            if (abs(center_x - s_center_x) < min(w, s_w) // 2 and
-                    abs(center_y - s_center_y) < min(h, s_h) // 2):
-                overlap = True
-                break
-
-        if not overlap:
-            final_locations.append((center_x, center_y, w, h))
-            cv2.circle(video, (center_x, center_y), 4, (0, 255, 255), -1)
-
-    return [(x, y) for x, y, _, _ in final_locations]
\ No newline at end of file
+    video_gray = _to_gray(video)
+
+    # 所有尺度一次性匹配（模板变体已在模板库中预先生成）
+    threshold = 0.85
+    cand_x, cand_y, cand_w, cand_h, cand_score = [], [], [], [], []
+    for _, _, w, h, res in device_bank.match_all(video_gray):
+        # 只保留局部极大值作为候选
+        xs, ys, scores = _local_peaks(res, threshold, w, h)
+        cand_x.append(xs + w // 2)
+        cand_y.append(ys + h // 2)
+        cand_w.append(np.full(len(xs), w))
+        cand_h.append(np.full(len(xs), h))
+        cand_score.append(scores)
+
+    if not cand_score:
+        return []
+
+    # 所有尺度的候选一起做非极大值抑制
+    cx, cy = np.concatenate(cand_x), np.concatenate(cand_y)
+    ws, hs = np.concatenate(cand_w), np.concatenate(cand_h)
+    keep = _nms_centers(cx, cy, ws, hs, np.concatenate(cand_score))
+
+    centers = []
+    for i in keep:
+        center_x = int(cx[i]) + xdia
+        center_y = int(cy[i]) + ydia
+        centers.append((center_x, center_y))
+        cv2.circle(video, (center_x, center_y), 4, (0, 255, 255), -1)
+
+    return centers
@@ -4,10 +4,11 @@ import time
 
 import MainPage
 from ANC300 import Positioner
+from ANCController import build_frame, anc_queue, MOVE
 import math
 
-from Position import getPosition
-from SerialLock import SerialLock
+from Position import wait_motion_done, queue_read_voltage
+from PositionService import position_service
 from locationClass import locationClass
 from SerialPage import NeedelConnectionThread, SIM928ConnectionThread
 from StopClass import StopClass
@@ -16,11 +17,17 @@ from TemperatureConfig import is_low
 
 ax = {'x':1,'y':2,'z':3,'x2':4,'y2':5,'z2':6}
 
-def _safe_serial_write(anc, data, max_retries=3):
-    """安全的串口写入，带重试机制"""
+def _send_commands(anc, commands, max_retries=3):
+    """
+    把一组命令合并为单次串口写入：控制器状态缓存中未变化的选通道/电容/电压/频率不再重发。
+    写入失败时缓存已被清空，重试前重新合并（即完整重发全部设置）。
+    """
     for attempt in range(max_retries):
+        frame = build_frame(anc, commands)
+        if not frame:
+            return True
         try:
-            anc.write(data)
+            anc.write(frame)
             time.sleep(0.01)  # 写入后短暂延迟，避免缓冲区溢出
             return True
         except Exception as e:
@@ -30,107 +37,162 @@ def _safe_serial_write(anc, data, max_retries=3):
             time.sleep(0.05)  # 重试前等待
     return False
 
-def ReturnNeedleMove(direction,distance,indicatorLight,isclick=False,flag=False,equipment=0):
-    # 根据全局配置选择参数
+
+def _move_params():
+    """当前温度模式下的 (XY频率, Z频率, 电压)"""
     if is_low():
-        frequencyXY = '2000'
-        frequencyZ = '500'
-        voltage = '200'
-    else:
-        frequencyXY = '300'
-        frequencyZ = '100'
-        voltage = '100'
+        return '2000', '500', '200'
+    return '300', '100', '100'
 
+
+def _direction_channel(direction, equipment):
+    """移动方向对应的控制器通道号"""
     directionArray = [[2,3,1],[6,5,4]]
-    with SerialLock.serial_lock:
-        try:
-            anc = NeedelConnectionThread.anc
-            if anc is None or not anc.is_open:
-                print("串口未连接或已关闭")
-                return False
-            
-            indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(True))
-            
-            # 预先构建所有命令
-            commands = []
-            if direction == 0:
-                commands = [
-                    f'[ch{directionArray[equipment][0]}:1]'.encode(),
-                    b'[cap:013nF]',
-                    f'[volt:+{voltage}V]'.encode(),
-                    f'[freq:+0{frequencyXY}Hz]'.encode(),
-                    f'[-:0000{distance}] '.encode()
-                ]
-            elif direction == 1:
-                commands = [
-                    f'[ch{directionArray[equipment][0]}:1]'.encode(),
-                    b'[cap:013nF]',
-                    f'[volt:+{voltage}V]'.encode(),
-                    f'[freq:+0{frequencyXY}Hz]'.encode(),
-                    f'[+:0000{distance}] '.encode()
-                ]
-            elif direction == 2:
-                move_cmd = f'[+:0000{distance}] '.encode() if equipment == 1 else f'[-:0000{distance}] '.encode()
-                commands = [
-                    f'[ch{directionArray[equipment][1]}:1]'.encode(),
-                    b'[cap:013nF]',
-                    f'[volt:+{voltage}V]'.encode(),
-                    f'[freq:+0{frequencyXY}Hz]'.encode(),
-                    move_cmd
-                ]
-            elif direction == 3:
-                move_cmd = f'[-:0000{distance}] '.encode() if equipment == 1 else f'[+:0000{distance}] '.encode()
-                commands = [
-                    f'[ch{directionArray[equipment][1]}:1]'.encode(),
-                    b'[cap:013nF]',
-                    f'[volt:+{voltage}V]'.encode(),
-                    f'[freq:+0{frequencyXY}Hz]'.encode(),
-                    move_cmd
-                ]
-            elif direction == 4:
-                commands = [
-                    f'[ch{directionArray[equipment][2]}:1]'.encode(),
-                    b'[cap:013nF]',
-                    f'[volt:+{voltage}V]'.encode(),
-                    f'[freq:+00{frequencyZ}Hz]'.encode(),
-                    f'[-:0000{distance}] '.encode()
-                ]
-            elif direction == 5:
-                commands = [
-                    f'[ch{directionArray[equipment][2]}:1]'.encode(),
-                    b'[cap:013nF]',
-                    f'[volt:+{voltage}V]'.encode(),
-                    f'[freq:+00{frequencyZ}Hz]'.encode(),
-                    f'[+:0000{distance}] '.encode()
-                ]
-            
-            # 批量写入所有命令
-            all_success = True
-            for cmd in commands:
-                if not _safe_serial_write(anc, cmd):
-                    all_success = False
-                    break
-            
-            if not all_success:
+    return directionArray[equipment][direction // 2]
+
+
+def _move_commands(direction, distance, equipment, frequencyXY, frequencyZ, voltage):
+    """构建单个方向移动的全部串口命令（选通道、电容、电压、频率、步数）"""
+    directionArray = [[2,3,1],[6,5,4]]
+    if direction == 0:
+        return [
+            f'[ch{directionArray[equipment][0]}:1]'.encode(),
+            b'[cap:013nF]',
+            f'[volt:+{voltage}V]'.encode(),
+            f'[freq:+0{frequencyXY}Hz]'.encode(),
+            f'[-:0000{distance}] '.encode()
+        ]
+    elif direction == 1:
+        return [
+            f'[ch{directionArray[equipment][0]}:1]'.encode(),
+            b'[cap:013nF]',
+            f'[volt:+{voltage}V]'.encode(),
+            f'[freq:+0{frequencyXY}Hz]'.encode(),
+            f'[+:0000{distance}] '.encode()
+        ]
+    elif direction == 2:
+        move_cmd = f'[+:0000{distance}] '.encode() if equipment == 1 else f'[-:0000{distance}] '.encode()
+        return [
+            f'[ch{directionArray[equipment][1]}:1]'.encode(),
+            b'[cap:013nF]',
+            f'[volt:+{voltage}V]'.encode(),
+            f'[freq:+0{frequencyXY}Hz]'.encode(),
+            move_cmd
+        ]
+    elif direction == 3:
+        move_cmd = f'[-:0000{distance}] '.encode() if equipment == 1 else f'[+:0000{distance}] '.encode()
+        return [
+            f'[ch{directionArray[equipment][1]}:1]'.encode(),
+            b'[cap:013nF]',
+            f'[volt:+{voltage}V]'.encode(),
+            f'[freq:+0{frequencyXY}Hz]'.encode(),
+            move_cmd
+        ]
+    elif direction == 4:
+        return [
+            f'[ch{directionArray[equipment][2]}:1]'.encode(),
+            b'[cap:013nF]',
+            f'[volt:+{voltage}V]'.encode(),
+            f'[freq:+00{frequencyZ}Hz]'.encode(),
+            f'[-:0000{distance}] '.encode()
+        ]
+    elif direction == 5:
+        return [
+            f'[ch{directionArray[equipment][2]}:1]'.encode(),
+            b'[cap:013nF]',
+            f'[volt:+{voltage}V]'.encode(),
+            f'[freq:+00{frequencyZ}Hz]'.encode(),
+            f'[+:0000{distance}] '.encode()
+        ]
+    return []
+
+
+def _queue_commands(commands, priority=MOVE, timeout=5.0):
+    """经 ANC 命令队列合并发送一组命令并等待写出，返回是否成功。调用方不能持有串口锁"""
+    try:
+        return anc_queue.submit(lambda anc: _send_commands(anc, commands), priority).result(timeout)
+    except Exception as e:
+        print(f"串口命令发送失败: {e}")
+        return False
+
+
+def ReturnNeedleMove(direction,distance,indicatorLight,isclick=False,flag=False,equipment=0):
+    # 根据全局配置选择参数
+    frequencyXY, frequencyZ, voltage = _move_params()
+
+    try:
+        anc = NeedelConnectionThread.anc
+        if anc is None or not anc.is_open:
+            print("串口未连接或已关闭")
+            return False
+        
+        indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(True))
+        
+        # 预先构建所有命令，合并为单次写入（只发送变化的设置），由命令队列按移动优先级下发
+        commands = _move_commands(direction, distance, equipment, frequencyXY, frequencyZ, voltage)
+        
+        with anc_queue.motion():
+            if not _queue_commands(commands):
                 print("串口命令写入失败")
                 indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(False))
                 return False
-            
-            # 等待命令执行完成
-            if flag:
-                time.sleep((distance + 1) / 300)
-            else:
-                time.sleep(0.8)
 
-            if not isclick:
-                indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(False))
-            
-            return True
-            
-        except Exception as e:
-            print(f"ReturnNeedleMove 异常: {e}")
+            # 等待命令执行完成：轮询电容读数判断停止，原固定等待时长作为后备；
+            # 每次轮询都是独立的查询任务，期间串口不被独占
+            frequency = float(frequencyZ if direction >= 4 else frequencyXY)
+            fallback = (distance + 1) / 300 if flag else 0.8
+            wait_motion_done(None, _direction_channel(direction, equipment), distance / frequency, fallback,
+                             reader=queue_read_voltage)
+
+        if not isclick:
             indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(False))
-            return False
+        
+        return True
+        
+    except Exception as e:
+        print(f"ReturnNeedleMove 异常: {e}")
+        indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(False))
+        return False
+
+
+def ReturnNeedleMoveXY(moves, indicatorLight, equipment=0):
+    """
+    依次驱动多个轴：moves 为 [(direction, distance), ...]。控制器同一时刻只选中一个通道，
+    因此逐轴选通道、下发步数并等待该轴运动完成后再切换到下一轴。
+    返回各轴预计运动时长之和（秒，按步数/频率估算），失败返回 None；
+    调用方根据相机测量判断是否到位（见 VisualServo）。
+    """
+    frequencyXY, frequencyZ, voltage = _move_params()
+    moves = [(d, int(n)) for d, n in moves if int(n) > 0]
+    if not moves:
+        return 0.0
+
+    try:
+        anc = NeedelConnectionThread.anc
+        if anc is None or not anc.is_open:
+            print("串口未连接或已关闭")
+            return None
+
+        indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(True))
+        duration = 0.0
+        with anc_queue.motion():
+            for direction, distance in moves:
+                commands = _move_commands(direction, distance, equipment, frequencyXY, frequencyZ, voltage)
+                if not _queue_commands(commands):
+                    print("串口命令写入失败")
+                    indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(False))
+                    return None
+                frequency = float(frequencyZ if direction >= 4 else frequencyXY)
+                expected = distance / frequency
+                duration += expected
+                # 停止时 wait_motion_done 立即返回，由调用方的 stop_fn 结束伺服
+                wait_motion_done(None, _direction_channel(direction, equipment), expected, expected + 0.5,
+                                 reader=queue_read_voltage)
+    except Exception as e:
+        print(f"ReturnNeedleMoveXY 异常: {e}")
+        indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(False))
+        return None
+    return duration
 
 
 def WhileMove(direction,indicatorLight,equipment=0,distance=1000):
@@ -145,107 +207,94 @@ def WhileMove(direction,indicatorLight,equipment=0,distance=1000):
         voltage = '100'
 
     directionArray = [[2,3,1],[6,5,4]]
-    # 初始化串口命令 - 使用安全写入
-    with SerialLock.serial_lock:
-        try:
-            anc = NeedelConnectionThread.anc
-            if anc is None or not anc.is_open:
-                print("串口未连接或已关闭")
-                return False
-            
-            indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(True))
-            
-            # 批量停止所有通道
-            stop_cmds = [
-                b'[ch1:0]', b'[ch2:0]', b'[ch3:0]',
-                b'[ch4:0]', b'[ch5:0]', b'[ch6:0]'
-            ]
-            for cmd in stop_cmds:
-                if not _safe_serial_write(anc, cmd):
-                    print("停止通道命令失败")
-                    indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(False))
-                    return False
-            time.sleep(0.1)
-        except Exception as e:
-            print(f"WhileMove 初始化失败: {e}")
-            indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(False))
-            return False
+    # 初始化串口命令 - 经命令队列下发，不再自行持锁
+    anc = NeedelConnectionThread.anc
+    if anc is None or not anc.is_open:
+        print("串口未连接或已关闭")
+        return False
+
+    indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(True))
+
+    # 批量停止所有通道（单次写入）
+    stop_cmds = [
+        b'[ch1:0]', b'[ch2:0]', b'[ch3:0]',
+        b'[ch4:0]', b'[ch5:0]', b'[ch6:0]'
+    ]
+    if not _queue_commands(stop_cmds):
+        print("停止通道命令失败")
+        indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(False))
+        return False
+    time.sleep(0.1)
     
-    # distance = min(1000,distance)
-    if direction == 0 or direction == 1:
-        with SerialLock.serial_lock:
+    # 点动期间标记为运动中：后台位置刷新暂停，不会在两次步进之间切换通道
+    with anc_queue.motion():
+        # distance = min(1000,distance)
+        if direction == 0 or direction == 1:
             setup_cmds = [
                 f'[ch{directionArray[equipment][0]}:1]'.encode(),
                 b'[cap:013nF]',
                 f'[volt:+{voltage}V]'.encode(),
                 f'[freq:+0{frequencyXY}Hz]'.encode()
             ]
-            for cmd in setup_cmds:
-                if not _safe_serial_write(anc, cmd):
-                    indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(False))
-                    return False
+            if not _queue_commands(setup_cmds):
+                indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(False))
+                return False
             time.sleep(0.1)
         
-        num_str = '[-:0000' if direction ==0 else '[+:0000'
-        while StopClass.stop_num == 0:
-            # 🔒 每次写入时加锁，避免长时间持锁
-            with SerialLock.serial_lock:
-                _safe_serial_write(anc, (num_str + str(distance) + '] ').encode())
-            time.sleep(0.1)  # 在锁外sleep
+            num_str = '[-:0000' if direction ==0 else '[+:0000'
+            while not StopClass.is_stopped():
+                # 每次步进都是一个独立的移动任务，查询任务不会长时间占住串口；
+                # 每帧都带选通道指令（已选中时由状态缓存省去），中间插入的查询切换了通道也不会步进错轴
+                _queue_commands([setup_cmds[0], (num_str + str(distance) + '] ').encode()])
+                StopClass.stop_event.wait(0.1)
     
-    elif direction == 2 or direction == 3:
-        with SerialLock.serial_lock:
+        elif direction == 2 or direction == 3:
             setup_cmds = [
                 f'[ch{directionArray[equipment][1]}:1]'.encode(),
                 b'[cap:013nF]',
                 f'[volt:+{voltage}V]'.encode(),
                 f'[freq:+0{frequencyXY}Hz]'.encode()
             ]
-            for cmd in setup_cmds:
-                if not _safe_serial_write(anc, cmd):
-                    indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(False))
-                    return False
+            if not _queue_commands(setup_cmds):
+                indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(False))
+                return False
             time.sleep(0.1)
         
-        num_str1 = '[+:0000' if direction == 2 else '[-:0000'
-        num_str2 = '[-:0000' if direction == 2 else '[+:0000'
-        while StopClass.stop_num == 0:
-            # 🔒 每次写入时加锁，避免长时间持锁
-            with SerialLock.serial_lock:
+            num_str1 = '[+:0000' if direction == 2 else '[-:0000'
+            num_str2 = '[-:0000' if direction == 2 else '[+:0000'
+            while not StopClass.is_stopped():
                 if equipment==1:
-                    _safe_serial_write(anc, (num_str1 + str(distance) + '] ').encode())
+                    _queue_commands([setup_cmds[0], (num_str1 + str(distance) + '] ').encode()])
                 else :
-                    _safe_serial_write(anc, (num_str2 + str(distance) + '] ').encode())
-            time.sleep(0.1)  # 在锁外sleep
+                    _queue_commands([setup_cmds[0], (num_str2 + str(distance) + '] ').encode()])
+                StopClass.stop_event.wait(0.1)
     
-    #Z轴, 4按压,5抬升
-    elif direction == 4 or direction == 5:
-        with SerialLock.serial_lock:
+        #Z轴, 4按压,5抬升
+        elif direction == 4 or direction == 5:
             setup_cmds = [
                 f'[ch{directionArray[equipment][2]}:1]'.encode(),
                 b'[cap:013nF]',
                 f'[volt:+{voltage}V]'.encode(),
                 f'[freq:+0{frequencyZ}Hz]'.encode()
             ]
-            for cmd in setup_cmds:
-                if not _safe_serial_write(anc, cmd):
-                    indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(False))
-                    return False
+            if not _queue_commands(setup_cmds):
+                indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(False))
+                return False
             time.sleep(0.2)
         
-        num_str = '[+:0000' if direction == 4 else '[-:0000'
-        while StopClass.stop_num == 0:
-            # 🔒 每次写入时加锁，避免长时间持锁
-            with SerialLock.serial_lock:
-                _safe_serial_write(anc, (num_str + str(distance) + '] ').encode())
-            time.sleep(0.2)  # 在锁外sleep
-            keithley = SIM928ConnectionThread.anc
-            current = keithley.current
-            print(current)
+            num_str = '[+:0000' if direction == 4 else '[-:0000'
+            while not StopClass.is_stopped():
+                _queue_commands([setup_cmds[0], (num_str + str(distance) + '] ').encode()])
+                StopClass.stop_event.wait(0.2)
+                keithley = SIM928ConnectionThread.anc
+                current = keithley.current
+                print(current)
 
-    # 🔄 无论哪个分支，结束后都要重置 stop_num
-    StopClass.stop_num = 0
-    locationClass.locationX, locationClass.locationY, locationClass.locationZ = getPosition()
+    # 🔄 无论哪个分支，结束后都要复位停止标志
+    StopClass.clear()
+    # 运动结束后强制刷新一次位置缓存（经命令队列读取）
+    record = position_service.get(max_age=0)
+    locationClass.locationX, locationClass.locationY, locationClass.locationZ = record.x, record.y, record.z
     indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(False))
     return True
 
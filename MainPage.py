@@ -3,6 +3,10 @@ import subprocess
 import sys
 
 from CameraConfig.CameraParams_const import MV_GIGE_DEVICE, MV_USB_DEVICE
+from ANCController import anc_queue
+from CalibrationStore import calibration
+from ProbePublisher import probe_publisher
+from StepCalibration import step_calibration
 from DailyLogger import DailyLogger
 from Load_Mat import load_and_plot_latest_mat_signals
 from StopClass import StopClass
@@ -21,19 +25,23 @@ from datetime import datetime
 import numpy as np
 from PyQt5 import QtCore
 from PyQt5.QtCore import QTimer, Qt
-from PyQt5.QtGui import QImage, QPixmap
-from PyQt5.QtWidgets import QMainWindow, QFileDialog, QMessageBox
+from PyQt5.QtGui import QImage, QPixmap, QKeySequence
+from PyQt5.QtWidgets import QMainWindow, QFileDialog, QMessageBox, QShortcut
 
 from CameraConfig.CamOperation_class import CameraOperation
+from CameraConfig.FramePipeline import FramePipeline
 from CameraConfig.CameraParams_header import MV_CC_DEVICE_INFO_LIST
-from CameraConfig.ImagePro import load_templates, template, match_device_templates
+from CameraConfig.ImagePro import load_templates, template, match_device_templates, demosaic_for_display, \
+    get_tracker, TrackState, last_probe_location
 from CameraConfig.MvCameraControl_class import MvCamera
-from LTDS import ReturnNeedleMove, WhileMove
+from LTDS import ReturnNeedleMove, ReturnNeedleMoveXY, WhileMove
 from Microscope import ReturnZauxdll
-from SerialPage import SIM928ConnectionThread, RelayConnectionThread, NeedelConnectionThread
+from SerialPage import SIM928ConnectionThread, RelayConnectionThread, SIM970ConnectionThread
 from demo import Ui_MainWindow
 # 导入全局温度配置
 from TemperatureConfig import set_low, set_high, is_low
+from VisualServo import VisualServo, PixelJacobian
+from ScanPositioning import ScanFineTuner
 
 
 def handle_coordinates(x, y):
@@ -42,10 +50,6 @@ def handle_coordinates(x, y):
 # 获取日志器实例
 logger = DailyLogger()
 
-global red_dot_x
-global red_dot_y
-
-
 class MainPage1(QMainWindow, Ui_MainWindow):
     micro_distanceY = 0.5
     micro_distanceX = 0.5
@@ -65,6 +69,18 @@ class MainPage1(QMainWindow, Ui_MainWindow):
     #全局的视频帧，为了让其他类也能调用截图
     global_frame = None
 
+    # 显示解码方式：True 为 2x2 超像素快速解码，False 为全分辨率高质量解码
+    fast_demosaic = True
+    # 解码前的传感器裁剪区域 (x, y, w, h)，None 表示整帧
+    display_roi = None
+    # 扫描台移动后至少等待的时间（秒），与驱动给出的稳定时刻（ScanStage.settle_time）取较晚者，早于此时刻采集的帧不作为测量
+    scan_settle_time = 0.05
+    # 粗调阶段使用闭环视觉伺服（每次迭代两轴一起计算步数、在线估计Jacobian、按帧判断到位）；False 为逐轴步进
+    visual_servo = True
+    # 光纤模式批量测试时，模板匹配后在扫描台上自动优化耦合信号（手动触发为 Ctrl+K）；相机亮度作为信号时的取样区域边长（像素）
+    auto_coupling = True
+    coupling_roi = 40
+
     # 给小灯设置颜色
     @staticmethod
     def get_stylesheet(status):
@@ -165,23 +181,34 @@ class MainPage1(QMainWindow, Ui_MainWindow):
         self.pad_x_dia = 0
         self.pad_y_dia = 0
         self.initCamera()
-        self.timer = QTimer()
         self.label_video = label_video
 
         # 保护帧访问的锁，避免多线程读写冲突
         self._frame_lock = threading.Lock()
         # 帧计数器用于节流重载计算
         self._frame_idx = 0
-        # 缓存dia偏移及mtime，避免每帧读文件
-        self._dia_cache = {'mtime': None, 'xdia': 0, 'ydia': 0}
+        # 流水线已取到的最新帧序号及其所属的环形缓冲区
+        self._last_frame_seq = 0
+        self._source_ring = None
+        # 视觉伺服学到的 步数->像素 Jacobian，按 (设备, 是否低温) 分别保存，跨器件复用
+        self._servo_jacobians = {}
+        # 扫描台 设定值->像素 模型，按 (设备, 是否低温) 每次运行标定一次
+        self._scan_tuners = {}
 
         self.label_video.mousePressEvent = self.mousePressEvent
 
         self.label_cameraLabel = label_cameraLabel
-        self.timer.timeout.connect(self.update_frame)
-        # 将UI刷新频率从 ~33FPS 降到 ~16FPS，减轻相机与处理压力
-        self.timer.start(60)
         self.frame_resized = 0
+        # 未经绘制的最新缩放帧：template() 会在 frame_resized 上画匹配结果，需要原始亮度时（耦合优化）才另存一份
+        self.frame_clean = None
+        self._clean_frame_users = 0
+        # 解码/缩放/匹配/叠加在工作线程中完成，GUI线程只负责显示
+        self.frame_pipeline = FramePipeline(
+            self._decode_frame,
+            [('resize', self._resize_frame), ('match', self._match_frame), ('overlay', self._overlay_frame)],
+            parent=self)
+        self.frame_pipeline.frame_ready.connect(self._show_frame)
+        self.frame_pipeline.start()
         self.lineEdit_savePath = lineEdit_savePath
         self.lineEdit_savePath.setText("C:\\Users\\Administrator\\PycharmProjects\\QTneedle\\ScreenShot")
         self.save_folder = "C:\\Users\\Administrator\\PycharmProjects\\QTneedle\\ScreenShot"
@@ -258,18 +285,23 @@ class MainPage1(QMainWindow, Ui_MainWindow):
         Button_pushing.clicked.connect(lambda: threading.Thread(target=self.Pushing).start())
         Button_pulling.clicked.connect(lambda: threading.Thread(target=self.Pulling).start())
 
+        # 光纤耦合优化没有单独的按钮，用快捷键手动触发（本对象不显示，快捷键挂在主窗口中的视频标签上）
+        self.coupling_shortcut = QShortcut(QKeySequence('Ctrl+K'), self.label_video)
+        self.coupling_shortcut.activated.connect(
+            lambda: threading.Thread(target=self.optimize_coupling, daemon=True).start())
+
         self.log_timer = QTimer(self)
         self.log_timer.timeout.connect(self.update_log_display)
         self.log_timer.start(500)  # 每秒更新一次
 
-        # 初次加载模板，并启动文件监视器，仅在模板发生变化时刷新缓存
+        # 初次加载模板，并启动文件监视器，仅在模板/标定文件发生变化时刷新缓存
         try:
             load_templates()
             self._template_files = [
                 os.path.abspath('templateNeedle.png'),
                 os.path.abspath('templatepad.png'),
                 os.path.abspath('templateLight.png'),
-            ]
+            ] + calibration.files
             self._template_watcher = QtCore.QFileSystemWatcher(self)
             existing = [p for p in self._template_files if os.path.exists(p)]
             if existing:
@@ -355,119 +387,107 @@ class MainPage1(QMainWindow, Ui_MainWindow):
             print(f"初始化相机时发生异常: {e}")
             return False
 
-    def update_frame(self):
-        # 🔴 声明全局变量（在函数开始处）
-        global red_dot_x, red_dot_y
-        
-        try:
-            self._frame_idx += 1
+    def _decode_frame(self):
+        """流水线源：等待相机环形缓冲区的新帧，钉住槽位并解码 Bayer -> RGB（可先裁剪/降采样）"""
+        cam = MainPage1.obj_cam_operation
+        # 🚩 相机未就绪或正在重置缓冲区
+        if cam is None or cam.is_resetting or cam.frame_ring is None:
+            time.sleep(0.1)
+            return None
 
-            # 🚩 检查是否正在重置缓冲区
-            if hasattr(MainPage1.obj_cam_operation, 'is_resetting') and MainPage1.obj_cam_operation.is_resetting:
-                return None  # 等待重置完成
+        frame_ring = cam.frame_ring
+        if frame_ring is not self._source_ring:
+            # 重新开始取图后环形缓冲区会重建，序号从头计数
+            self._source_ring = frame_ring
+            self._last_frame_seq = 0
+        if frame_ring.wait_for(self._last_frame_seq, timeout=0.2) <= self._last_frame_seq:
+            return None
 
-            stFrameInfo = MainPage1.obj_cam_operation.st_frame_info
-            if MainPage1.obj_cam_operation.buf_grab_image_size > 0 and stFrameInfo:
-                if stFrameInfo.nWidth > 0 and stFrameInfo.nHeight > 0 and stFrameInfo.nFrameLen > 0:
-                    try:
+        # 钉住最新帧槽位，直接在只读视图上解码，不再拷贝原始数据
+        with frame_ring.read_latest(self._last_frame_seq) as slot:
+            # ✅ 验证缓冲区有效性
+            if slot is None:
+                return None
+            if slot.frame_len <= 0 or slot.width <= 0 or slot.height <= 0:
+                return None
+            self._last_frame_seq = slot.seq
+            rgb = demosaic_for_display(slot.image(), MainPage1.fast_demosaic, MainPage1.display_roi)
+            # 帧序号和采集时间随帧一起传递，供位置发布器标注测量
+            return slot.seq, slot.timestamp, rgb
+
+    def _resize_frame(self, frame):
+        # 单次resize到目标显示尺寸，避免二次缩放
+        frame_seq, timestamp, rgb = frame
+        target_size = (851, 851)
+        return frame_seq, timestamp, cv2.resize(rgb, target_size, interpolation=cv2.INTER_LINEAR)
+
+    def _match_frame(self, frame):
+        frame_seq, timestamp, resized = frame
+        self._frame_idx += 1
+
+        # 写入共享帧前加锁
+        with self._frame_lock:
+            self.frame_resized = resized
+            # 下面的 template() 会在 resized 上绘制，先保存原始图像
+            if self._clean_frame_users:
+                self.frame_clean = resized.copy()
+
+        # 仅在必要频率做模板/器件匹配，降低CPU占用
+        # 每2帧进行一次针/光模板匹配
+        do_template = (self._frame_idx % 2 == 0)
+        # 每15帧进行一次器件模板匹配（且仅当显示开启）
+        do_device_match = self.DeviceTemplate_view
+
+        # dia偏移来自内存中的标定数据，文件变化由监视器负责刷新
+        xdia, ydia = calibration.dia(MainPage1.equipment)
+
+        if do_template:
+            probe_x, probe_y, self.board_height, self.board_width = template(resized, xdia,
+                                                                             ydia, MainPage1.equipment)
+            score = get_tracker(MainPage1.equipment).last_score
+            probe_publisher.publish(probe_x, probe_y, score, frame_seq, timestamp)
+        # 如果开启了器件显示，降低频率进行匹配
+        if do_device_match:
+            match_device_templates(resized)
+
+        aligned = self.align_frame_with_probe()
+        if aligned is None or isinstance(aligned, int):
+            aligned = resized
+        return aligned
+
+    def _overlay_frame(self, aligned):
+        # QImage 可在工作线程中构造（QPixmap 只能在GUI线程使用）
+        h, w, c = aligned.shape
+        bytes_per_line = 3 * w
+        q_image = QImage(aligned.data, w, h, bytes_per_line, QImage.Format_BGR888).copy()
+        # 提取中心区域
+        center_width, center_height = w // 2, h // 2
+        start_x, start_y = max(0, center_width // 2), max(0, center_height // 2)
+        q_image_zoom = q_image.copy(start_x, start_y, center_width, center_height)
 
-                        # 从保存缓冲区复制数据，使用锁防止抓图线程写入过程中发生竞态
-                        with MainPage1.obj_cam_operation.buf_lock:
-                            st_info = MainPage1.obj_cam_operation.st_frame_info
-                            buf = MainPage1.obj_cam_operation.buf_save_image
-                            
-                            # ✅ 验证缓冲区有效性
-                            if not st_info or st_info.nFrameLen <= 0 or buf is None:
-                                return None
-                            if st_info.nWidth <= 0 or st_info.nHeight <= 0:
-                                return None
-                            
-                            try:
-                                data = np.frombuffer(buf, dtype=np.uint8, count=st_info.nFrameLen).copy()
-                            except Exception as e:
-                                print(f"读取帧缓冲区失败: {e}")
-                                return None
-                                
-                            width = st_info.nWidth
-                            height = st_info.nHeight
-
-                        # 解码 Bayer -> RGB（这一步较重，必要时可进一步降低分辨率）
-                        try:
-                            frame = data.reshape((height, width))
-                            rgb = cv2.cvtColor(frame, cv2.COLOR_BayerBG2RGB)
-
-                            # 单次resize到目标显示尺寸，避免二次缩放
-                            target_size = (851, 851)
-                            resized = cv2.resize(rgb, target_size, interpolation=cv2.INTER_LINEAR)
-                        finally:
-                            # 🔴 及时释放临时图像数据
-                            del data
-                            if 'frame' in locals():
-                                del frame
-
-                        # 写入共享帧前加锁
-                        with self._frame_lock:
-                            self.frame_resized = resized
-
-                        # 仅在必要频率做模板/器件匹配，降低CPU占用
-                        # 每2帧进行一次针/光模板匹配
-                        do_template = (self._frame_idx % 2 == 0)
-                        # 每15帧进行一次器件模板匹配（且仅当显示开启）
-                        do_device_match = self.DeviceTemplate_view
-
-                        # 缓存并读取dia偏移（仅当文件修改时才重载）
-                        try:
-                            dia_file = 'dia' + str(MainPage1.equipment) + '.txt'
-                            cur_mtime = os.path.getmtime(dia_file) if os.path.exists(dia_file) else None
-                            if cur_mtime and cur_mtime != self._dia_cache['mtime']:
-                                with open(dia_file, 'r', encoding='utf-8') as file:
-                                    line = file.readline().strip()
-                                    numbers = line.split(',') if line else []
-                                    if len(numbers) >= 2:
-                                        self._dia_cache['xdia'] = int(numbers[0])
-                                        self._dia_cache['ydia'] = int(numbers[1])
-                                        self._dia_cache['mtime'] = cur_mtime
-                        except Exception as e:
-                            # 使用缓存中的默认值
-                            pass
-
-                        xdia = self._dia_cache['xdia']
-                        ydia = self._dia_cache['ydia']
-
-                        if do_template:
-                            red_dot_x, red_dot_y, self.board_height, self.board_width = template(resized, xdia,
-                                                                                                 ydia, MainPage1.equipment)
-                        # 如果开启了器件显示，降低频率进行匹配
-                        if do_device_match:
-                            match_device_templates(resized)
-
-                        aligned = self.align_frame_with_probe()
-                        if aligned is None or isinstance(aligned, int):
-                            aligned = resized
-
-                        h, w, c = aligned.shape
-                        bytes_per_line = 3 * w
-                        q_image = QImage(aligned.data, w, h, bytes_per_line, QImage.Format_BGR888).copy()
-
-                        self.label_video.setPixmap(QPixmap.fromImage(q_image))
-                        # 提取中心区域
-                        center_width, center_height = w // 2, h // 2
-                        start_x, start_y = max(0, center_width // 2), max(0, center_height // 2)
-                        q_image_zoom = q_image.copy(start_x, start_y, center_width, center_height)
-                        self.label_cameraLabel.setPixmap(QPixmap.fromImage(q_image_zoom))
-
-                        MainPage1.global_frame = aligned
-                        return aligned
-
-                    except Exception as e:
-                        print(f"更新视频帧异常: {e}")
-        except Exception as e_outer:
-            print(f"update_frame外层异常: {e_outer}")
+        with self._frame_lock:
+            MainPage1.global_frame = aligned
+        return q_image, q_image_zoom
+
+    def _show_frame(self, images):
+        # GUI线程：只负责贴图
+        q_image, q_image_zoom = images
+        self.label_video.setPixmap(QPixmap.fromImage(q_image))
+        self.label_cameraLabel.setPixmap(QPixmap.fromImage(q_image_zoom))
+
+    def update_frame(self):
+        """返回流水线最近一次处理完成的帧（拷贝），无可用帧时返回 None"""
+        with self._frame_lock:
+            frame = MainPage1.global_frame
+            return None if frame is None else frame.copy()
 
     def _on_template_changed(self, path):
-        # 文件更改时刷新模板，并重新添加监视（Windows上有时需要）
+        # 文件更改时刷新模板或标定数据，并重新添加监视（Windows上有时需要）
         try:
-            load_templates()
+            if os.path.abspath(path) in calibration.files:
+                calibration.reload(path)
+            else:
+                load_templates()
         except Exception as e:
             print(f"刷新模板失败({path}): {e}")
         finally:
@@ -478,12 +498,15 @@ class MainPage1(QMainWindow, Ui_MainWindow):
                 pass
 
     def _on_template_dir_changed(self, path):
-        # 目录变化时尝试添加新创建的模板文件
+        # 目录变化时尝试添加新创建的模板/标定文件
         try:
             for f in self._template_files:
                 if os.path.exists(f) and f not in self._template_watcher.files():
                     try:
                         self._template_watcher.addPath(f)
+                        # 新建的标定文件不会触发 fileChanged，这里补读一次
+                        if f in calibration.files:
+                            calibration.reload(f)
                     except Exception:
                         pass
         except Exception as e:
@@ -781,8 +804,7 @@ class MainPage1(QMainWindow, Ui_MainWindow):
         cv2.destroyWindow("Select Needle Template")
 
         # 保存偏移量
-        with open('dia' + str(MainPage1.equipment) + '.txt', 'w', encoding='utf-8') as f:
-            f.write(f"{self.x_dia},{self.y_dia}")
+        calibration.set_dia(MainPage1.equipment, self.x_dia, self.y_dia)
 
         print(f"偏移量已保存: x_dia={self.x_dia}, y_dia={self.y_dia}")
         
@@ -871,10 +893,7 @@ class MainPage1(QMainWindow, Ui_MainWindow):
         print(f"偏移量计算：pad中心({pad_center_x},{pad_center_y}) -> 参考点({mouseX},{mouseY}) = ({x_dia},{y_dia})")
 
         # 保存偏移量
-        with open('Paddia.txt', 'w', encoding='utf-8') as f:
-            f.write(f"{x_dia},{y_dia}")
-            f.flush()  # 强制刷新缓冲区
-            os.fsync(f.fileno())  # 强制同步到磁盘
+        calibration.set_pad_dia(x_dia, y_dia)
         return True
 
 
@@ -1158,11 +1177,38 @@ class MainPage1(QMainWindow, Ui_MainWindow):
         threading.Thread(target=align, daemon=True).start()
         return self.frame_resized
 
-    # 获得探针位置
+    # 获得探针位置（亚像素浮点坐标）
     def get_probe_position(self):
-        global red_dot_x
-        global red_dot_y
-        return red_dot_x, red_dot_y
+        measurement = probe_publisher.latest()
+        return measurement.x, measurement.y
+
+    # 获得探针定位详情：亚像素坐标、匹配得分、置信度和位置协方差
+    def get_probe_location(self):
+        return last_probe_location(MainPage1.equipment)
+
+    # 等待移动结束后的新鲜探针位置
+    def wait_probe_position(self, since=None, timeout=1.0):
+        """
+        等待在 since 时刻之后采集的帧中匹配到的探针位置（默认为调用时刻），
+        跟踪丢失时继续等待重新捕获，最多 timeout 秒；超时或停止返回 (None, None)
+        """
+        since = time.time() if since is None else since
+        deadline = time.time() + timeout
+        seq = 0
+        while not StopClass.is_stopped():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            # 分段等待以便及时响应停止
+            measurement = probe_publisher.wait_newer(seq, timeout=min(0.1, remaining), since=since)
+            if measurement is None:
+                continue
+            seq = measurement.seq
+            if measurement.x is not None:
+                if get_tracker(MainPage1.equipment).state == TrackState.REACQUIRED:
+                    logger.log("探针跟踪已重新捕获")
+                return measurement.x, measurement.y
+        return None, None
 
     # 显微镜移动函数
     def move_microscope_up(self):
@@ -1313,22 +1359,84 @@ class MainPage1(QMainWindow, Ui_MainWindow):
             QMessageBox.warning(self, '提示', '请在视频有效区域内点击！', QMessageBox.Ok)
             return
 
+    # 视觉伺服：下发带符号步数（正值为向右/向下），两轴依次移动
+    def _servo_move(self, ux, uy):
+        moves = []
+        if ux:
+            moves.append((self.needleright if ux > 0 else self.needleuleft, abs(ux)))
+        if uy:
+            moves.append((self.needledown if uy > 0 else self.needleup, abs(uy)))
+        return ReturnNeedleMoveXY(moves, self.indicator, MainPage1.equipment)
+
+    def _servo_observe(self, u, dp, jacobian):
+        """把伺服的每次移动记入步长标定：先扣除另一轴通过耦合项带来的位移"""
+        equipment = MainPage1.equipment
+        if u[0]:
+            step_calibration.observe('px_x', u[0], dp[0] - jacobian.J[0, 1] * u[1], equipment)
+        if u[1]:
+            step_calibration.observe('px_y', u[1], dp[1] - jacobian.J[1, 0] * u[0], equipment)
+
+    def _servo_coarse(self, target_x, target_y, probe_x, probe_y, error):
+        """闭环视觉伺服粗调，返回最终探针位置 (x, y)，失败时为 (None, None)"""
+        key = (MainPage1.equipment, is_low())
+        jacobian = self._servo_jacobians.get(key)
+        if jacobian is None:
+            # Jacobian 初值取自步长标定（两个方向的平均）
+            equipment = MainPage1.equipment
+            gain_x = (step_calibration.units_per_step('px_x', 1, equipment) +
+                      step_calibration.units_per_step('px_x', -1, equipment)) / 2
+            gain_y = (step_calibration.units_per_step('px_y', 1, equipment) +
+                      step_calibration.units_per_step('px_y', -1, equipment)) / 2
+            jacobian = self._servo_jacobians[key] = PixelJacobian((gain_x, gain_y))
+        servo = VisualServo(probe_publisher, self._servo_move, jacobian,
+                            stop_fn=StopClass.is_stopped,
+                            observe_fn=lambda u, dp: self._servo_observe(u, dp, jacobian))
+        # 每次移动及其后的到位判断期间后台位置刷新暂停，不在运动中切换通道
+        with anc_queue.motion():
+            pos, converged, iterations = servo.run((target_x, target_y), error, start=(probe_x, probe_y))
+        logger.log(f"视觉伺服粗调{'完成' if converged else '未收敛'}，迭代 {iterations} 次")
+        if pos is None:
+            return None, None
+        return float(pos[0]), float(pos[1])
+
+    def _scan_tuner(self, center, scan_range):
+        """返回当前设备/温度下已标定的扫描台精调器，首次使用时在 center 附近标定，失败返回 None"""
+        from Scan.ScanXY import scan_stage
+        key = (MainPage1.equipment, is_low())
+        tuner = self._scan_tuners.get(key)
+        if tuner is not None:
+            return tuner
+
+        def stage_fn(x, y):
+            settle_at = scan_stage.set_target_xy(x, y, is_low=key[1])
+            return max(settle_at, time.time() + self.scan_settle_time)
+
+        tuner = ScanFineTuner(stage_fn, lambda since: self.wait_probe_position(since=since), scan_range,
+                              stop_fn=StopClass.is_stopped)
+        if not tuner.calibrate(center):
+            return None
+        gains = ', '.join(f"{m.gain:.2f}" for m in tuner.models)
+        hysteresis = ', '.join(f"{m.hysteresis:.2f}" for m in tuner.models)
+        logger.log(f"扫描台标定完成：增益 ({gains}) 像素/单位，回差 ({hysteresis}) 像素")
+        self._scan_tuners[key] = tuner
+        return tuner
+
+    # 像素误差 -> 探针步数（来自步长标定，按轴、方向、温度、设备区分）
+    def _pixel_steps(self, axis, pixel_error):
+        return step_calibration.steps_for(axis, pixel_error, MainPage1.equipment)
+
     # 计算距离并移动探针
     def move_probe_to_target(self, target_x, target_y):
-        from Scan.ScanXY import ScanX, ScanY
+        from Scan.ScanXY import scan_stage
         
         # 根据全局配置选择参数
         if is_low():
-            distance_weight = 50  # 低温
             error = 20
-            sleep_time = 0.2 #这里本来是0.5，但是为了加快速度改成0.2
             error_Scan = 20
             scan_range_min = -150
             scan_range_max = 150
         else:
-            distance_weight = 10  # 常温
             error = 100
-            sleep_time = 0.1
             error_Scan = 30
             scan_range_min = 0
             scan_range_max = 75
@@ -1340,165 +1448,153 @@ class MainPage1(QMainWindow, Ui_MainWindow):
         scan_center_x = (scan_range_min + scan_range_max) / 2.0
         scan_center_y = (scan_range_min + scan_range_max) / 2.0
         logger.log(f"预先将扫描台移动到中间位置: X={scan_center_x:.2f}, Y={scan_center_y:.2f}")
-        ScanX(scan_center_x, is_low=is_low())
-        ScanY(scan_center_y, is_low=is_low())
-        time.sleep(0.5)  # 等待扫描台稳定
-        
-        probe_x, probe_y = self.get_probe_position()
+        # 两轴目标合并为一帧写出，不等待固定稳定时间，由下面的新鲜帧测量判断
+        settle_at = scan_stage.set_target_xy(scan_center_x, scan_center_y, is_low=is_low())
+
+        # 等待扫描台稳定后的第一帧测量
+        probe_x, probe_y = self.wait_probe_position(since=max(settle_at, time.time() + self.scan_settle_time))
+        if probe_x is None or probe_y is None:
+            logger.log("模板匹配失败，请先进行模板匹配")
+            self.allow_alignment = True
+            self.indicator.setStyleSheet(MainPage1.get_stylesheet(False))
+            StopClass.clear()
+            return
         
         # ========== 第一阶段：粗调 - 使用机械臂移动（距离 > error）==========
-        distance = np.sqrt((target_x - probe_x) ** 2) *distance_weight
+        if MainPage1.visual_servo:
+            probe_x, probe_y = self._servo_coarse(target_x, target_y, probe_x, probe_y, error)
+            if probe_x is None:
+                logger.log("视觉伺服时探针跟踪丢失")
+                self.allow_alignment = True
+                self.indicator.setStyleSheet(MainPage1.get_stylesheet(False))
+                StopClass.clear()
+                return
+            distance = 0
+        else:
+            distance = self._pixel_steps('px_x', target_x - probe_x)
         while distance>=error:
-            if StopClass.stop_num == 1:
+            if StopClass.is_stopped():
                 break
             if probe_x is None:
                 logger.log("模板匹配失败，请先进行模板匹配")
                 break
-            if target_x < probe_x:
-                ReturnNeedleMove(self.needleuleft, distance, self.indicator, True, False, MainPage1.equipment)
-            elif target_x > probe_x:
-                ReturnNeedleMove(self.needleright, distance, self.indicator, True, False, MainPage1.equipment)
-            # 低温情况下time.sleep应该是0.5，常温情况是0.1
-            time.sleep(sleep_time)
-            probe_x, probe_y = self.get_probe_position()
-            distance = np.sqrt((target_x - probe_x) ** 2)*distance_weight
-
-        distance = np.sqrt((target_y - probe_y) ** 2)*distance_weight
+            steps = int(round(distance))
+            sign = 1 if target_x > probe_x else -1
+            ReturnNeedleMove(self.needleright if sign > 0 else self.needleuleft, steps, self.indicator, True, False,
+                             MainPage1.equipment)
+            previous_x = probe_x
+            # 移动命令返回后等待一帧新测量，而不是固定sleep
+            probe_x, probe_y = self.wait_probe_position()
+            if probe_x is None:
+                logger.log("X轴粗调时探针跟踪丢失")
+                break
+            step_calibration.observe('px_x', sign * steps, probe_x - previous_x, MainPage1.equipment)
+            distance = self._pixel_steps('px_x', target_x - probe_x)
+
+        distance = 0 if MainPage1.visual_servo else self._pixel_steps('px_y', target_y - probe_y)
         while distance>=error:
-            if StopClass.stop_num == 1:
+            if StopClass.is_stopped():
                 break
             if probe_y is None:
                 logger.log("模板匹配失败，请先进行模板匹配")
                 break
-            if target_y < probe_y:
-                ReturnNeedleMove(self.needleup, distance, self.indicator, True, False, MainPage1.equipment)
-            elif target_y > probe_y:
-                ReturnNeedleMove(self.needledown, distance, self.indicator, True, False, MainPage1.equipment)
-            # 低温情况下time.sleep应该是0.5，常温情况是0.1
-            time.sleep(sleep_time)
-            probe_x, probe_y = self.get_probe_position()
-            distance = np.sqrt((target_y - probe_y) ** 2)*distance_weight
-
-        # ========== 第二阶段：精调 - 使用扫描台二分法（error > 距离 > error_Scan）==========
+            steps = int(round(distance))
+            sign = 1 if target_y > probe_y else -1
+            ReturnNeedleMove(self.needledown if sign > 0 else self.needleup, steps, self.indicator, True, False,
+                             MainPage1.equipment)
+            previous_y = probe_y
+            # 移动命令返回后等待一帧新测量，而不是固定sleep
+            probe_x, probe_y = self.wait_probe_position()
+            if probe_y is None:
+                logger.log("Y轴粗调时探针跟踪丢失")
+                break
+            step_calibration.observe('px_y', sign * steps, probe_y - previous_y, MainPage1.equipment)
+            distance = self._pixel_steps('px_y', target_y - probe_y)
+
+        # ========== 第二阶段：精调 - 扫描台模型直接定位（error > 距离 > error_Scan）==========
         probe_x, probe_y = self.get_probe_position()
-        distance_x = abs(target_x - probe_x) * distance_weight
-        distance_y = abs(target_y - probe_y) * distance_weight
+        distance_x = self._pixel_steps('px_x', target_x - probe_x)
+        distance_y = self._pixel_steps('px_y', target_y - probe_y)
         
         # 判断是否需要进入精调模式（任一轴满足条件即可）
         need_fine_tune = (error > distance_x > error_Scan) or (error > distance_y > error_Scan)
         
         if need_fine_tune:
-            logger.log(f"进入扫描台二分法精调模式，X轴距离: {distance_x:.2f}, Y轴距离: {distance_y:.2f}")
-            
-            # 初始化扫描台搜索范围（扫描台已经在中间位置）
-            scan_x_min = scan_range_min
-            scan_x_max = scan_range_max
-            scan_y_min = scan_range_min
-            scan_y_max = scan_range_max
-            
-            # 当前扫描台位置（已经在中间）
-            current_scan_x = scan_center_x
-            current_scan_y = scan_center_y
-            
-            max_iterations = 15
-            
-            # ========== X轴二分法循环 ==========
-            if distance_x > error_Scan:
-                logger.log(f"开始X轴二分法调整，初始距离: {distance_x:.2f}")
-                iteration_x = 0
-                
-                while distance_x > error_Scan and iteration_x < max_iterations:
-                    if StopClass.stop_num == 1:
-                        break
-                    
-                    iteration_x += 1
-                    
-                    # 重新获取探针位置
-                    probe_x, probe_y = self.get_probe_position()
-                    if probe_x is None:
-                        logger.log("X轴调整时模板匹配失败")
-                        break
-                    
-                    # 计算X轴误差
-                    pixel_error_x = target_x - probe_x
-                    distance_x = abs(pixel_error_x) * distance_weight
-                    
-                    if distance_x <= error_Scan:
-                        logger.log(f"X轴已达到精度要求，距离: {distance_x:.2f}")
-                        break
-                    
-                    # X轴二分法调整
-                    # x正方向在图像中向下，所以当target_x > probe_x时，需要增加scan_x
-                    if pixel_error_x > 0:  # 目标在探针下方，需要增加scan_x
-                        scan_x_min = current_scan_x
-                    else:  # 目标在探针上方，需要减少scan_x
-                        scan_x_max = current_scan_x
-                    
-                    # 更新扫描台X位置
-                    new_scan_x = (scan_x_min + scan_x_max) / 2.0
-                    ScanX(new_scan_x, is_low=is_low())
-                    current_scan_x = new_scan_x
-                    time.sleep(0.3)
-                    
-                    # 移动后重新获取位置并计算距离
-                    probe_x, probe_y = self.get_probe_position()
-                    if probe_x is not None:
-                        distance_x = abs(target_x - probe_x) * distance_weight
-                        logger.log(f"X轴迭代 {iteration_x}: 扫描台X={current_scan_x:.2f}, 探针X={probe_x:.1f}, 距离={distance_x:.2f}")
-                
-                logger.log(f"X轴二分法完成，最终距离: {distance_x:.2f}")
-            
-            # ========== Y轴二分法循环 ==========
-            if distance_y > error_Scan:
-                logger.log(f"开始Y轴二分法调整，初始距离: {distance_y:.2f}")
-                iteration_y = 0
-                
-                while distance_y > error_Scan and iteration_y < max_iterations:
-                    if StopClass.stop_num == 1:
-                        break
-                    
-                    iteration_y += 1
-                    
-                    # 重新获取探针位置
-                    probe_x, probe_y = self.get_probe_position()
-                    if probe_y is None:
-                        logger.log("Y轴调整时模板匹配失败")
-                        break
-                    
-                    # 计算Y轴误差
-                    pixel_error_y = target_y - probe_y
-                    distance_y = abs(pixel_error_y) * distance_weight
-                    
-                    if distance_y <= error_Scan:
-                        logger.log(f"Y轴已达到精度要求，距离: {distance_y:.2f}")
-                        break
-                    
-                    # Y轴二分法调整
-                    # y正方向在图像中向右，所以当target_y > probe_y时，需要增加scan_y
-                    if pixel_error_y > 0:  # 目标在探针右方，需要增加scan_y
-                        scan_y_min = current_scan_y
-                    else:  # 目标在探针左方，需要减少scan_y
-                        scan_y_max = current_scan_y
-                    
-                    # 更新扫描台Y位置
-                    new_scan_y = (scan_y_min + scan_y_max) / 2.0
-                    ScanY(new_scan_y, is_low=is_low())
-                    current_scan_y = new_scan_y
-                    time.sleep(0.3)
-                    
-                    # 移动后重新获取位置并计算距离
-                    probe_x, probe_y = self.get_probe_position()
-                    if probe_y is not None:
-                        distance_y = abs(target_y - probe_y) * distance_weight
-                        logger.log(f"Y轴迭代 {iteration_y}: 扫描台Y={current_scan_y:.2f}, 探针Y={probe_y:.1f}, 距离={distance_y:.2f}")
-                
-                logger.log(f"Y轴二分法完成，最终距离: {distance_y:.2f}")
-            
-            logger.log(f"扫描台二分法精调全部完成，最终 X轴距离: {distance_x:.2f}, Y轴距离: {distance_y:.2f}")
+            logger.log(f"进入扫描台精调模式，X轴距离: {distance_x:.2f}, Y轴距离: {distance_y:.2f}")
+            tuner = self._scan_tuner((scan_center_x, scan_center_y), (scan_range_min, scan_range_max))
+            if tuner is None:
+                logger.log("扫描台标定失败，跳过精调")
+            else:
+                done_fn = lambda ex, ey: (self._pixel_steps('px_x', ex) <= error_Scan,
+                                          self._pixel_steps('px_y', ey) <= error_Scan)
+                # 扫描台在第一阶段前已移到中心，探针位置以最新测量为准
+                probe_x, probe_y = self.get_probe_position()
+                start = None if probe_x is None else (probe_x, probe_y)
+                pos, converged, steps = tuner.run((target_x, target_y), done_fn, start=start,
+                                                  setpoint=(scan_center_x, scan_center_y))
+                if pos is not None:
+                    distance_x = self._pixel_steps('px_x', target_x - pos[0])
+                    distance_y = self._pixel_steps('px_y', target_y - pos[1])
+                logger.log(f"扫描台精调{'完成' if converged else '未收敛'}，移动 {steps} 次，"
+                           f"最终 X轴距离: {distance_x:.2f}, Y轴距离: {distance_y:.2f}")
+
+        location = self.get_probe_location()
+        if location is not None:
+            std_x, std_y = np.sqrt(np.diag(location.cov))
+            logger.log(f"探针最终位置: ({location.x:.2f}, {location.y:.2f}) ±({std_x:.2f}, {std_y:.2f})像素, "
+                       f"置信度 {location.confidence:.2f}")
 
         self.allow_alignment = True  # 重新允许对齐
         self.indicator.setStyleSheet(MainPage1.get_stylesheet(False))
-        StopClass.stop_num = 0
+        StopClass.clear()
+
+    # 光纤耦合优化：在扫描台 X/Y 上最大化耦合信号
+    def optimize_coupling(self, detector=None, method='nelder-mead'):
+        """
+        返回最优 ScanSample（失败为 None），结束时扫描台停在最优点。detector 默认：SIM970 已连接时用其读数，
+        否则用相机图像中当前光纤位置附近 coupling_roi 区域的平均亮度（取自未绘制匹配结果的原始帧）。
+        在后台线程中调用：批量测试（auto_coupling）或快捷键 Ctrl+K
+        """
+        from Scan.CouplingOptimizer import CouplingOptimizer
+        from Scan.ScanEngine import SIM970Detector, CameraIntensityDetector
+        if detector is None:
+            if SIM970ConnectionThread.anc is not None:
+                detector = SIM970Detector()
+            else:
+                probe_x, probe_y = self.get_probe_position()
+                if probe_x is None:
+                    logger.log("光纤位置未知，无法优化耦合")
+                    return None
+                size = MainPage1.coupling_roi
+                roi = (max(0, int(probe_x) - size // 2), max(0, int(probe_y) - size // 2), size, size)
+                detector = CameraIntensityDetector(self._fresh_frame, roi)
+
+        self.indicator.setStyleSheet(MainPage1.get_stylesheet(True))
+        optimizer = CouplingOptimizer(detector, is_low=is_low(), dwell=self.scan_settle_time,
+                                      stop_fn=StopClass.is_stopped)
+        with self._frame_lock:
+            self._clean_frame_users += 1
+        try:
+            best = optimizer.optimize(method=method)
+        finally:
+            with self._frame_lock:
+                self._clean_frame_users -= 1
+                if not self._clean_frame_users:
+                    self.frame_clean = None
+        self.indicator.setStyleSheet(MainPage1.get_stylesheet(False))
+        if best is None:
+            logger.log("耦合优化失败：探测器无读数")
+        else:
+            logger.log(f"耦合优化完成：扫描台 ({best.x:.2f}, {best.y:.2f})，信号 {best.value:.4g}，"
+                       f"测量 {optimizer.evaluations} 次，噪声 {optimizer.sigma:.2g}")
+        return best
+
+    def _fresh_frame(self):
+        """等待调用之后采集的一帧，返回其未绘制的原始图像（无新帧时为 None）"""
+        if probe_publisher.wait_newer(0, timeout=1.0, since=time.time()) is None:
+            return None
+        with self._frame_lock:
+            return self.frame_clean
 
     # 928更新电压的函数
     def update_voltage(self):
@@ -1,10 +1,12 @@
 import time
+from collections import namedtuple
 
 
-from SerialLock import SerialLock
+from ANCController import anc_queue, halt_frame, STOP, MOVE, QUERY
 from SerialPage import NeedelConnectionThread, SIM928ConnectionThread
 import sys
 
+from StepCalibration import step_calibration
 from StopClass import StopClass
 # 导入全局温度配置
 from TemperatureConfig import is_low
@@ -16,140 +18,286 @@ custom_lib_path = "c:\\users\\administrator\\appdata\\local\\programs\\python\\p
 if custom_lib_path not in sys.path:
     sys.path.append(custom_lib_path)
 
-def getPosition(Z_flag=False,Only_XY=False):
-
+# 一次位置读数：x/y/z 为换算后的坐标（未读取的轴为 None），timestamp 为读数完成时刻，voltages 为原始电容读数
+PositionRecord = namedtuple('PositionRecord', ['x', 'y', 'z', 'timestamp', 'voltages'])
+
+# 轴 -> 通道（设备0）
+AXIS_CHANNELS = {'x': 3, 'y': 2, 'z': 1}
+
+# 每次读数完成后回调 fn(record)，例如位置缓存服务（见 PositionService）
+_position_listeners = []
+
+
+def add_position_listener(fn):
+    if fn not in _position_listeners:
+        _position_listeners.append(fn)
+
+# 切换通道后电容读数稳定所需时间（秒）。初值为原来的保守值，首次读数时实测一次后更新
+channel_switch_settle = 0.2
+_switch_settle_measured = False
+
+
+def _voltage_to_position(voltage):
+    return (1 - voltage / 2.5) * 10.92 - 5
+
+
+def _parse_voltage(ret):
+    """解析 [v?] 的应答（形如 [+1.2345v]），失败返回 None"""
+    ret_str = ret.decode(errors='ignore')
+    start_index = ret_str.find('[+') + 2
+    end_index = ret_str.find('v]')
+    if start_index > 1 and end_index > start_index:
+        voltage_str = ret_str[start_index:end_index].strip()
+        if voltage_str:
+            try:
+                return float(voltage_str)
+            except ValueError:
+                return None
+    return None
+
+
+def _query_voltage(anc):
+    anc.write('[v?]'.encode())
+    anc.write('[read:pulse?]'.encode())
+    try:
+        return _parse_voltage(anc.readline())
+    except Exception:
+        return None
+
+
+def measure_switch_settle(anc, channel, other_channel, max_settle=0.3, tol=0.002, poll=0.01):
+    """
+    实测通道切换后读数稳定所需时间：先切到 other_channel，再切回 channel 并连续读数，
+    返回读数进入最终值 ±tol 的最早时刻（加一次轮询间隔余量），测量失败返回 None。调用方需持有串口锁。
+    """
+    anc.write(f'[ch{other_channel}:1]'.encode())
+    time.sleep(max_settle)
+    anc.write(f'[ch{channel}:1]'.encode())
+    t0 = time.time()
+    samples = []
+    while time.time() - t0 < max_settle:
+        voltage = _query_voltage(anc)
+        if voltage is None:
+            return None
+        samples.append((time.time() - t0, voltage))
+        time.sleep(poll)
+    if not samples:
+        return None
+    final = samples[-1][1]
+    settle = samples[-1][0]
+    # 从后往前找到最后一个超出容差的读数，其后即为稳定
+    for elapsed, voltage in reversed(samples):
+        if abs(voltage - final) > tol:
+            break
+        settle = elapsed
+    return min(max_settle, settle + poll)
+
+
+def _ensure_switch_settle(anc):
+    """首次读数时实测一次通道切换稳定时间（取X/Y两次测量的较大值）"""
+    global channel_switch_settle, _switch_settle_measured
+    if _switch_settle_measured:
+        return
+    _switch_settle_measured = True
+    measured = [measure_switch_settle(anc, 3, 2), measure_switch_settle(anc, 2, 3)]
+    if all(m is not None for m in measured):
+        channel_switch_settle = max(measured)
+        print(f"通道切换稳定时间实测为 {channel_switch_settle * 1000:.0f} ms")
+
+
+def read_position(axes='xyz'):
+    """
+    一次读取多个轴的位置，返回 PositionRecord。调用方需持有串口锁。
+
+    各轴的切换/查询命令连续下发、最后统一读取应答；每次切换只等待实测的稳定时间，
+    已选中的通道（见 ANCController 状态缓存）不再切换。读数结束后重新选中原来的通道，
+    之后不带选通道指令的步进命令仍作用于原通道。
+    """
     anc = NeedelConnectionThread.anc
-    x_distance = 0
-    y_distance = 0
-    z_distance = 0
-
-    if Z_flag is not True:
-        # X轴坐标
-        try:
-            anc.write('[ch3:1]'.encode())
-            time.sleep(0.2)
-            anc.write('[v?]'.encode())
-            anc.write('[read:pulse?]'.encode())
-            ret = anc.readline()
-            ret_str = ret.decode()
-            start_index = ret_str.find('[+') + 2
-            end_index = ret_str.find('v]')
-            if start_index > 1 and end_index > start_index:
-                voltage_str = ret_str[start_index:end_index].strip()
-                if voltage_str:  # 确保不是空字符串
-                    distance = float(voltage_str)  # 浮点型
-                    x_distance = (1 - distance / 2.5) * 10.92 - 5
-            time.sleep(0.1)
-        except (ValueError, IndexError) as e:
-            print(f"获取X轴位置失败: {e}, 返回数据: {ret_str if 'ret_str' in locals() else 'N/A'}")
-            x_distance = 0
-
-        try:
-            anc.write('[ch2:1]'.encode())
-            time.sleep(0.2)
-            anc.write('[v?]'.encode())
-            anc.write('[read:pulse?]'.encode())
-            ret = anc.readline()
-            ret_str = ret.decode()
-            start_index = ret_str.find('[+') + 2
-            end_index = ret_str.find('v]')
-            if start_index > 1 and end_index > start_index:
-                voltage_str = ret_str[start_index:end_index].strip()
-                if voltage_str:  # 确保不是空字符串
-                    distance = float(voltage_str)  # 浮点型
-                    y_distance = (1 - distance / 2.5) * 10.92 - 5
-            time.sleep(0.1)
-        except (ValueError, IndexError) as e:
-            print(f"获取Y轴位置失败: {e}, 返回数据: {ret_str if 'ret_str' in locals() else 'N/A'}")
-            y_distance = 0
-
-    if Only_XY is not True:
+    _ensure_switch_settle(anc)
+    if hasattr(anc, 'reset_input_buffer'):
+        anc.reset_input_buffer()  # 丢弃残留应答，保证应答与轴一一对应
+
+    state = getattr(anc, 'state', None)
+    previous = None if state is None else state.selected
+    queried = []
+    for axis in axes:
+        channel = AXIS_CHANNELS[axis]
+        if state is None or state.selected != channel:
+            anc.write(f'[ch{channel}:1]'.encode())
+            time.sleep(channel_switch_settle)
+        anc.write('[v?]'.encode())
+        anc.write('[read:pulse?]'.encode())
+        queried.append(axis)
+
+    voltages = {}
+    for axis in queried:
         try:
-            anc.write('[ch1:1]'.encode())
-            time.sleep(0.2)
-            anc.write('[v?]'.encode())
-            anc.write('[read:pulse?]'.encode())
-            ret = anc.readline()
-            ret_str = ret.decode()
-            start_index = ret_str.find('[+') + 2
-            end_index = ret_str.find('v]')
-            if start_index > 1 and end_index > start_index:
-                voltage_str = ret_str[start_index:end_index].strip()
-                if voltage_str:  # 确保不是空字符串
-                    distance = float(voltage_str)  # 浮点型
-                    z_distance = (1 - distance / 2.5) * 10.92 - 5
-            time.sleep(0.1)
-        except (ValueError, IndexError) as e:
-            print(f"获取Z轴位置失败: {e}, 返回数据: {ret_str if 'ret_str' in locals() else 'N/A'}")
-            z_distance = 0
-
-    return round(x_distance,4),round(y_distance,4),round(z_distance,6)
-
-def move_to_Z(z,indicatorLight,Voltage_flag=False):
-    with SerialLock.serial_lock:
-        _, _, z_current = getPosition(Z_flag=True)
-    import MainPage
-    indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(True))
-    # 定义不同阶段的阈值和参数
-    FAR_THRESHOLD = 0.02  # 20微米以上为远距离移动
-    NEAR_THRESHOLD = 0.005  # 5微米以下为微调阶段
-    step_per_unit = 0.06  # 1单位对应0.06实际距离
-
-    # 根据全局配置选择参数
-    Z_k = 600 if is_low() else 100  # 低温600，常温100（基于其他文件推断）
-
-    while abs(z_current - z) > 0.005:  # 最终精度要求5纳米
-        if Voltage_flag:
-            keithley = SIM928ConnectionThread.anc
-            current = keithley.current
-            print(current)
-            if current >= 9e-10:
-                break
-        if StopClass.stop_num == 1:
-            break
+            voltage = _parse_voltage(anc.readline())
+        except Exception as e:
+            print(f"获取{axis.upper()}轴位置失败: {e}")
+            voltage = None
+        voltages[axis] = voltage
 
-        # 计算剩余距离
-        remaining_distance = abs(z_current - z)
-
-        # 根据距离动态调整参数
-        if remaining_distance > FAR_THRESHOLD:
-            # 远距离快速移动 - 使用最大速度但限制单次移动距离
-            speed_factor = 3.0
-            max_step = 0.01  # 最大单次移动10微米
-            micro_adjust = False
-        elif remaining_distance > NEAR_THRESHOLD:
-            # 中等距离正常移动 - 使用中等速度和小步长
-            speed_factor = 1.0
-            max_step = 0.002  # 最大单次移动2微米
-            micro_adjust = False
-        else:
-            # 微调阶段 - 使用小步长和高精度
-            speed_factor = 0.3  # 更慢的速度
-            max_step = 0.0005  # 最大单次移动0.5微米
-            micro_adjust = True
+    if previous is not None and state.selected != previous:
+        anc.write(f'[ch{previous}:1]'.encode())
+        time.sleep(channel_switch_settle)
 
-        # 计算实际移动距离（不超过max_step）
-        move_distance = min(remaining_distance, max_step)
+    coords = {axis: None if v is None else _voltage_to_position(v) for axis, v in voltages.items()}
+    record = PositionRecord(coords.get('x'), coords.get('y'), coords.get('z'), time.time(), voltages)
+    for listener in _position_listeners:
+        listener(record)
+    return record
 
-        with SerialLock.serial_lock:
-            z_diff = z - z_current
-            adjusted_distance = move_distance / step_per_unit * Z_k * speed_factor
 
-            if z_diff > 0:
-                move('-Z', adjusted_distance, False,micro_adjust)
-            elif z_diff < 0:
-                move('Z', adjusted_distance, False,micro_adjust)
+def getPosition(Z_flag=False,Only_XY=False):
+    """兼容接口：返回 (x, y, z)，未读取或读取失败的轴为 0"""
+    axes = ('' if Z_flag else 'xy') + ('' if Only_XY else 'z')
+    record = read_position(axes)
+    x_distance = record.x or 0
+    y_distance = record.y or 0
+    z_distance = record.z or 0
+    return round(x_distance,4),round(y_distance,4),round(z_distance,6)
 
-            _, _, z_current = getPosition(Z_flag=True)
 
-    StopClass.stop_num = 0
+def read_channel_voltage(anc, channel, switch_settle=None):
+    """
+    读取单个通道的电容位置读数（电压），读不到返回 None。调用方需持有串口锁。
+    通道已处于选中状态（见 ANCController 的状态缓存）时不再切换，也不需要等待切换稳定。
+    """
+    state = getattr(anc, 'state', None)
+    if state is None or state.selected != channel:
+        anc.write(f'[ch{channel}:1]'.encode())
+        time.sleep(channel_switch_settle if switch_settle is None else switch_settle)
+    return _query_voltage(anc)
+
+
+def wait_motion_done(anc, channel, expected, fallback, tol=0.001, poll=0.03, stable_reads=2, timeout=None,
+                     reader=None):
+    """
+    移动命令发出后轮询该通道的电容读数，连续 stable_reads 次读数变化小于 tol（伏）即认为已停止。
+
+    - expected: 按步数/频率估算的运动时长，之前不做判断（避免运动尚未开始就误判为停止）；
+    - fallback: 原来的固定等待时长；读数不可用时退回按它等待，超时上限也由它决定；
+    - reader(channel): 自定义读数方式（例如经 ANCCommandQueue 提交查询）；默认直接读 anc，调用方需持有串口锁；
+    返回是否检测到运动完成（False 表示停止、超时或读数不可用）。
+    """
+    t0 = time.time()
+    deadline = t0 + (timeout if timeout is not None else max(fallback, 2 * expected) + 0.5)
+    if StopClass.stop_event.wait(max(expected, poll)):
+        return False
+    last = None
+    stable = 0
+    while time.time() < deadline:
+        if StopClass.is_stopped():
+            return False
+        voltage = reader(channel) if reader is not None else read_channel_voltage(anc, channel)
+        if voltage is None:
+            StopClass.stop_event.wait(max(0.0, t0 + fallback - time.time()))
+            return False
+        if last is not None and abs(voltage - last) < tol:
+            stable += 1
+            if stable >= stable_reads - 1:
+                return True
+        else:
+            stable = 0
+        last = voltage
+        if StopClass.stop_event.wait(poll):
+            return False
+    return False
+
+
+def queue_read_voltage(channel):
+    """经 ANC 命令队列读取单个通道的电容读数（查询优先级，移动/停止命令可插队），失败返回 None"""
+    try:
+        return anc_queue.submit(lambda anc: read_channel_voltage(anc, channel), QUERY).result(2.0)
+    except Exception:
+        return None
+
+
+def _queue_position():
+    """经 ANC 命令队列读取 X/Y，返回 (x, y)"""
+    x, y, _ = anc_queue.submit(lambda anc: getPosition(Only_XY=True), QUERY).result(5.0)
+    return x, y
+
+# Z 通道步进频率 {方向: (高速, 低速上限)}，方向 +1 为 Z 坐标增大（抬升，[-:] 命令），-1 为按压（[+:] 命令）
+Z_FREQUENCIES = {1: (800, 500), -1: (1000, 700)}
+Z_CONTACT_CURRENT = 9e-10
+
+
+def _z_move(sign, steps, frequency):
+    """经命令队列下发一条 Z 通道步进命令（不等待运动完成）"""
+    voltage = '200' if is_low() else '150'
+    commands = [b'[ch1:1]', b'[cap:013nF]', f'[volt:+{voltage}V]'.encode(),
+                f'[freq:+{int(frequency):05d}Hz]'.encode(),
+                (('[-:0000' if sign > 0 else '[+:0000') + str(steps) + '] ').encode()]
+    try:
+        anc_queue.send(commands, MOVE).result(2.0)
+        return True
+    except Exception as e:
+        print(f"Z轴移动命令发送失败: {e}")
+        return False
+
+
+def _z_read():
+    """经命令队列读取 Z（通道已选中时不需要切换等待），读数同时写入位置缓存"""
+    voltage = queue_read_voltage(AXIS_CHANNELS['z'])
+    if voltage is None:
+        return None
+    record = PositionRecord(None, None, _voltage_to_position(voltage), time.time(), {'z': voltage})
+    for listener in _position_listeners:
+        listener(record)
+    return record.z
+
+
+def _z_halt():
+    frame = halt_frame((AXIS_CHANNELS['z'],))
+    try:
+        anc_queue.submit(lambda anc: anc.write(frame), STOP).result(1.0)
+    except Exception as e:
+        print(f"Z轴停止命令发送失败: {e}")
+
+
+def _contact_current():
+    current = SIM928ConnectionThread.anc.current
+    if current >= Z_CONTACT_CURRENT:
+        print(f"检测到接触电流: {current}")
+        return True
+    return False
+
+
+def move_to_Z(z,indicatorLight,Voltage_flag=False,contact=None):
+    """
+    Z 轴逼近 z：高速连续移动到接触高度 contact（未知时为目标）附近，再低速精细逼近，
+    运动中持续监测位置和（Voltage_flag 时）接触电流，见 ZApproach。调用方不能持有串口锁。
+    到位或检测到接触时返回最终 Z；停止、读数失败或超时未到位返回 None。
+    """
+    import MainPage
+    from ZApproach import ZApproach
+    indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(True))
+    approach = ZApproach(_z_move, _z_read, _z_halt,
+                         model_fn=lambda sign: step_calibration.model('Z', sign),
+                         frequencies=Z_FREQUENCIES,
+                         stop_fn=StopClass.is_stopped,
+                         contact_fn=_contact_current if Voltage_flag else None,
+                         observe_fn=lambda steps, dz: step_calibration.observe('Z', steps, dz))
+    t0 = time.time()
+    with anc_queue.motion():
+        z_current, result = approach.run(z, contact)
+    print(f"Z轴逼近结束: {result}, 用时 {time.time() - t0:.2f}s, Z={z_current}")
+
+    StopClass.clear()
     indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(False))
-    return z_current
+    return z_current if result in ('reached', 'contact') else None
 
 
 def move(axis, distance, flag,Z_adjust=False):
+    """
+    单轴移动并等待完成，返回命令是否已下发。调用方不能持有串口锁：
+    命令帧和每次读数都是独立的队列任务，停止帧随时可以插队（见 ANCCommandQueue）。
+    """
     distance = round(distance)
-    ser4 = NeedelConnectionThread.anc
+    commands = []
     move_time = distance/8000 #初始为10000
 
     # 根据全局配置选择参数
@@ -164,41 +312,41 @@ def move(axis, distance, flag,Z_adjust=False):
 
     # X/Y轴保持原始代码（固定频率1000Hz，固定时间0.3秒）
     if axis == '-X':
-        ser4.write('[ch3:1]'.encode())
-        ser4.write('[cap:013nF]'.encode())
-        ser4.write(('[volt:+'+voltage+'V]').encode())
-        ser4.write(('[freq:+'+frequencyXY+'Hz]').encode())
-        ser4.write(('[+:0000' + str(distance) + ']').encode())
+        commands.append('[ch3:1]'.encode())
+        commands.append('[cap:013nF]'.encode())
+        commands.append(('[volt:+'+voltage+'V]').encode())
+        commands.append(('[freq:+'+frequencyXY+'Hz]').encode())
+        commands.append(('[+:0000' + str(distance) + ']').encode())
 
     elif axis == 'X':
-        ser4.write('[ch3:1]'.encode())
-        ser4.write('[cap:013nF]'.encode())
-        ser4.write(('[volt:+'+voltage+'V]').encode())
-        ser4.write(('[freq:+'+frequencyXY+'Hz]').encode())
-        ser4.write(('[-:0000' + str(distance) + ']').encode())
+        commands.append('[ch3:1]'.encode())
+        commands.append('[cap:013nF]'.encode())
+        commands.append(('[volt:+'+voltage+'V]').encode())
+        commands.append(('[freq:+'+frequencyXY+'Hz]').encode())
+        commands.append(('[-:0000' + str(distance) + ']').encode())
     elif axis == '-Y':
-        ser4.write('[ch2:1]'.encode())
-        ser4.write('[cap:013nF]'.encode())
-        ser4.write(('[volt:+'+voltage+'V]').encode())
-        ser4.write(('[freq:+'+frequencyXY+'Hz]').encode())
-        ser4.write(('[+:0000' + str(distance) + ']').encode())
+        commands.append('[ch2:1]'.encode())
+        commands.append('[cap:013nF]'.encode())
+        commands.append(('[volt:+'+voltage+'V]').encode())
+        commands.append(('[freq:+'+frequencyXY+'Hz]').encode())
+        commands.append(('[+:0000' + str(distance) + ']').encode())
     elif axis == 'Y':
-        ser4.write('[ch2:1]'.encode())
-        ser4.write('[cap:013nF]'.encode())
-        ser4.write(('[volt:+'+voltage+'V]').encode())
-        ser4.write(('[freq:+'+frequencyXY+'Hz]').encode())
-        ser4.write(('[-:0000' + str(distance) + ']').encode())
+        commands.append('[ch2:1]'.encode())
+        commands.append('[cap:013nF]'.encode())
+        commands.append(('[volt:+'+voltage+'V]').encode())
+        commands.append(('[freq:+'+frequencyXY+'Hz]').encode())
+        commands.append(('[-:0000' + str(distance) + ']').encode())
 
     # Z轴保持微调和非微调功能
     elif axis == 'Z':
-        ser4.write('[ch1:1]'.encode())
-        ser4.write('[cap:013nF]'.encode())
-        ser4.write(('[volt:+'+voltage+'V]').encode())
+        commands.append('[ch1:1]'.encode())
+        commands.append('[cap:013nF]'.encode())
+        commands.append(('[volt:+'+voltage+'V]').encode())
 
         # 根据flag决定频率（微调500Hz，非微调800Hz）
         freq = '+0700Hz' if Z_adjust else '+1000Hz'
-        ser4.write(f'[freq:{freq}]'.encode())
-        ser4.write(('[+:0000' + str(distance) + '] ').encode())
+        commands.append(f'[freq:{freq}]'.encode())
+        commands.append(('[+:0000' + str(distance) + '] ').encode())
 
         # 动态计算移动时间
         base_time = 0.3
@@ -207,14 +355,14 @@ def move(axis, distance, flag,Z_adjust=False):
         move_time = max(0.2, min(move_time, 3.0))
 
     elif axis == '-Z':
-        ser4.write('[ch1:1]'.encode())
-        ser4.write('[cap:013nF]'.encode())
-        ser4.write(('[volt:+'+voltage+'V]').encode())
+        commands.append('[ch1:1]'.encode())
+        commands.append('[cap:013nF]'.encode())
+        commands.append(('[volt:+'+voltage+'V]').encode())
 
         # 根据flag决定频率（微调500Hz，非微调800Hz）
         freq = '+0500Hz' if Z_adjust else '+0800Hz'
-        ser4.write(f'[freq:{freq}]'.encode())
-        ser4.write(('[-:0000' + str(distance) + '] ').encode())
+        commands.append(f'[freq:{freq}]'.encode())
+        commands.append(('[-:0000' + str(distance) + '] ').encode())
 
         # 动态计算移动时间
         base_time = 0.3
@@ -222,109 +370,92 @@ def move(axis, distance, flag,Z_adjust=False):
         move_time = base_time + distance * scale_factor
         move_time = max(0.2, min(move_time, 3.0))
 
-    # 睡眠时间处理
-    if flag:
-        time.sleep((distance + 1) / 1500)
+    # 等待移动完成：轮询电容读数判断停止，原固定等待时长作为读数不可用时的后备和超时依据
+    channel = {'X': 3, 'Y': 2, 'Z': 1}[axis.lstrip('-')]
+    if axis.lstrip('-') == 'Z':
+        frequency = float(freq.strip('+Hz'))
     else:
-        time.sleep(move_time)
+        frequency = float(frequencyXY)
+    fallback = (distance + 1) / 1500 if flag else move_time
+    with anc_queue.motion():
+        try:
+            anc_queue.send(commands, MOVE).result(5.0)
+        except Exception as e:
+            # 停止时排队中的移动任务被取消
+            print(f"{axis}轴移动命令未下发: {e}")
+            return False
+        wait_motion_done(None, channel, distance / frequency, fallback, reader=queue_read_voltage)
+    return True
+
+def _signed_steps(diff, steps):
+    """与 move() 相同的取整，并带上移动方向的符号，供步长标定记录"""
+    return round(steps) * (1 if diff > 0 else -1)
 
-def move_to_target(x, y,indicatorLight):
-    # 根据全局配置选择参数
-    if is_low():
-        XY_k = 1000
-        XY_k_2 = 10000
-    else:
-        XY_k = 300
-        XY_k_2 = 3000
 
-    step_per_unit = 0.06  # 假设每 0.06 单位对应 100 步
+def move_to_target(x, y,indicatorLight):
+    # 步数由在线标定的步长模型给出（按轴、方向、温度区分），取代硬编码的 XY_k / XY_k_2 / step_per_unit；
+    # 移动和读数都经命令队列，不长时间持有串口锁，停止帧可以随时插队。调用方不能持有串口锁
     import MainPage
     indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(True))
-    with SerialLock.serial_lock:
-        x_current, y_current,_ = getPosition(Only_XY=True)
-        x_diff = round((x - x_current), 3)
-        y_diff = round((y - y_current), 3)
-
-        flag = True
-        if x_diff > 0:
-            move('X', abs(x_diff) / 0.03 * XY_k, flag)
-        elif x_diff < 0:
-            move('-X', abs(x_diff) / 0.03 * XY_k, flag)
-
-        if y_diff > 0:
-            move('Y', abs(y_diff) / 0.03 * XY_k, flag)
-        elif y_diff < 0:
-            move('-Y', abs(y_diff) / 0.03 * XY_k, flag)
-        x_current, y_current,_ = getPosition(Only_XY=True)
-        time.sleep(0.2)
+    x_start, y_start = _queue_position()
+    x_diff = round((x - x_start), 3)
+    y_diff = round((y - y_start), 3)
+    x_steps = step_calibration.steps_for('X', x_diff)
+    y_steps = step_calibration.steps_for('Y', y_diff)
+
+    flag = True
+    if x_diff > 0:
+        move('X', x_steps, flag)
+    elif x_diff < 0:
+        move('-X', x_steps, flag)
+
+    if y_diff > 0:
+        move('Y', y_steps, flag)
+    elif y_diff < 0:
+        move('-Y', y_steps, flag)
+    x_current, y_current = _queue_position()
+    # 停止时运动被中途打断，实际位移不能用于标定
+    stopped = StopClass.is_stopped()
+    if x_diff and not stopped:
+        step_calibration.observe('X', _signed_steps(x_diff, x_steps), x_current - x_start)
+    if y_diff and not stopped:
+        step_calibration.observe('Y', _signed_steps(y_diff, y_steps), y_current - y_start)
+    StopClass.stop_event.wait(0.2)
 
     while  abs(y_current - y) > 0.015 :
-        if StopClass.stop_num == 1:
-            StopClass.stop_num = 0
-            anc = NeedelConnectionThread.anc
-            anc.write('[ch1:1]'.encode())
-            anc.write('[cap:000nF]'.encode())
-            anc.write('[volt:+000V] '.encode())
-            anc.write('[freq:+00000Hz]'.encode())
-            time.sleep(0.2)
-            anc.write('[ch2:1]'.encode())
-            anc.write('[cap:000nF]'.encode())
-            anc.write('[volt:+000V] '.encode())
-            anc.write('[freq:+00000Hz]'.encode())
-            time.sleep(0.2)
-            anc.write('[ch3:1]'.encode())
-            anc.write('[cap:000nF]'.encode())
-            anc.write('[volt:+000V] '.encode())
-            anc.write('[freq:+00000Hz]'.encode())
-            time.sleep(0.2)
-            anc.write('[ch1:0]'.encode())
-            anc.write('[ch2:0]'.encode())
-            anc.write('[ch3:0]'.encode())
-            time.sleep(0.2)
+        if StopClass.is_stopped():
+            # 全通道停止帧已由 StopClass.request_stop() 插队下发
             break
         else:
             flag = False
-            with SerialLock.serial_lock:
-                y_diff = round((y - y_current), 3)
-                if y_diff > 0:
-                    move('Y', abs(y_diff) / step_per_unit * XY_k_2, flag)
-                elif y_diff < 0:
-                    move('-Y', abs(y_diff) / step_per_unit * XY_k_2, flag)
-                _, y_current,_ = getPosition(Only_XY=True)
-                time.sleep(0.2)
+            y_diff = round((y - y_current), 3)
+            y_steps = step_calibration.steps_for('Y_fine', y_diff)
+            if y_diff > 0:
+                move('Y', y_steps, flag)
+            elif y_diff < 0:
+                move('-Y', y_steps, flag)
+            y_previous = y_current
+            _, y_current = _queue_position()
+            if y_diff and not StopClass.is_stopped():
+                step_calibration.observe('Y_fine', _signed_steps(y_diff, y_steps), y_current - y_previous)
+            StopClass.stop_event.wait(0.2)
     while abs(x_current - x) > 0.015:
-        if StopClass.stop_num == 1:
-            StopClass.stop_num = 0
-            anc = NeedelConnectionThread.anc
-            anc.write('[ch1:1]'.encode())
-            anc.write('[cap:000nF]'.encode())
-            anc.write('[volt:+000V] '.encode())
-            anc.write('[freq:+00000Hz]'.encode())
-            time.sleep(0.2)
-            anc.write('[ch2:1]'.encode())
-            anc.write('[cap:000nF]'.encode())
-            anc.write('[volt:+000V] '.encode())
-            anc.write('[freq:+00000Hz]'.encode())
-            time.sleep(0.2)
-            anc.write('[ch3:1]'.encode())
-            anc.write('[cap:000nF]'.encode())
-            anc.write('[volt:+000V] '.encode())
-            anc.write('[freq:+00000Hz]'.encode())
-            time.sleep(0.2)
-            anc.write('[ch1:0]'.encode())
-            anc.write('[ch2:0]'.encode())
-            anc.write('[ch3:0]'.encode())
-            time.sleep(0.2)
+        if StopClass.is_stopped():
+            # 全通道停止帧已由 StopClass.request_stop() 插队下发
             break
         else:
             flag = False
-            with SerialLock.serial_lock:
-                x_diff = round((x - x_current), 3)
-                if x_diff > 0:
-                    move('X', abs(x_diff) / step_per_unit * XY_k_2, flag)
-                elif x_diff < 0:
-                    move('-X', abs(x_diff) / step_per_unit * XY_k_2, flag)
-                x_current, _, _ = getPosition(Only_XY=True)
-                time.sleep(0.2)
+            x_diff = round((x - x_current), 3)
+            x_steps = step_calibration.steps_for('X_fine', x_diff)
+            if x_diff > 0:
+                move('X', x_steps, flag)
+            elif x_diff < 0:
+                move('-X', x_steps, flag)
+            x_previous = x_current
+            x_current, _ = _queue_position()
+            if x_diff and not StopClass.is_stopped():
+                step_calibration.observe('X_fine', _signed_steps(x_diff, x_steps), x_current - x_previous)
+            StopClass.stop_event.wait(0.2)
+    StopClass.clear()
     indicatorLight.setStyleSheet(MainPage.MainPage1.get_stylesheet(False))
     return x_current, y_current
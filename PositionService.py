@@ -0,0 +1,109 @@
+import threading
+import time
+
+from Position import read_position, add_position_listener, AXIS_CHANNELS, PositionRecord
+from ANCController import anc_queue, QUERY
+from SerialPage import NeedelConnectionThread
+
+
+class PositionService:
+    """
+    定位器位置缓存服务：集中持有 X/Y/Z 的最新读数及其时间戳。
+
+    - 所有经 Position.read_position()/getPosition() 的读数都会自动写入缓存（无论由谁发起）；
+    - get(max_age) 返回不早于 max_age 秒的位置，缓存足够新且该轴此后没有下发过步进命令时直接复用，
+      否则经 ANC 命令队列以查询优先级读取一次（并发请求只读一次）；
+    - 后台线程在命令队列空闲时刷新"移动过"的轴（以及超过 idle_refresh 未读的轴），有命令排队或运动进行中
+      就跳过，从不延迟运动命令；定位器静止时不产生串口流量；
+    - latest() 不做任何 I/O，供界面定时器和地图动画使用。
+    """
+
+    def __init__(self, refresh_interval=0.5, idle_refresh=10.0):
+        self.refresh_interval = refresh_interval
+        self.idle_refresh = idle_refresh
+        self._lock = threading.Lock()
+        self._values = {axis: (None, 0.0) for axis in AXIS_CHANNELS}
+        self._stop_event = threading.Event()
+        self._thread = None
+        add_position_listener(self.update)
+
+    def update(self, record):
+        """写入一次读数（只更新读到的轴）"""
+        with self._lock:
+            for axis in AXIS_CHANNELS:
+                value = getattr(record, axis)
+                if value is not None:
+                    self._values[axis] = (value, record.timestamp)
+
+    def latest(self):
+        """返回缓存中的位置（不读串口），timestamp 为所含各轴中最旧的读数时间"""
+        with self._lock:
+            values = dict(self._values)
+        timestamp = min(t for _, t in values.values())
+        return PositionRecord(values['x'][0], values['y'][0], values['z'][0], timestamp, {})
+
+    def age(self, axis):
+        """某轴缓存读数的年龄（秒）；该轴读数后又下发过步进命令时视为无穷大"""
+        with self._lock:
+            value, timestamp = self._values[axis]
+        if value is None:
+            return float('inf')
+        state = getattr(NeedelConnectionThread.anc, 'state', None)
+        if state is not None and state.moved_since(AXIS_CHANNELS[axis], timestamp):
+            return float('inf')
+        return time.time() - timestamp
+
+    def _stale_axes(self, axes, max_age):
+        return ''.join(axis for axis in axes if self.age(axis) > max_age)
+
+    def get(self, max_age=0.0, axes='xyz'):
+        """
+        返回 axes 各轴不早于 max_age 秒的位置（PositionRecord）。调用方不能持有串口锁（见 ANCCommandQueue）。
+        max_age=0 表示必须重新读取。
+        """
+        stale = self._stale_axes(axes, max_age)
+        if stale:
+            anc_queue.submit(lambda anc: self._read_stale(stale, max_age), QUERY).result()
+        return self.latest()
+
+    def _read_stale(self, axes, max_age):
+        # 排队期间可能已被其他任务刷新
+        stale = self._stale_axes(axes, max_age) if max_age > 0 else axes
+        if stale:
+            read_position(stale)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, daemon=True, name="PositionService")
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _refresh_loop(self):
+        while not self._stop_event.wait(self.refresh_interval):
+            anc = NeedelConnectionThread.anc
+            if anc is None or not getattr(anc, 'is_open', False):
+                continue
+            # age() 对下发过步进命令的轴返回无穷大，静止的轴只按 idle_refresh 兜底刷新
+            stale = self._stale_axes('xyz', self.idle_refresh)
+            if not stale:
+                continue
+            # 有命令排队或运动进行中（见 ANCCommandQueue.motion）时跳过本轮，绝不与运动争串口、改变选中通道
+            if anc_queue.pending or anc_queue.motion_active:
+                continue
+            try:
+                anc_queue.submit(lambda anc: self._idle_refresh(stale), QUERY).result()
+            except Exception as e:
+                print(f"后台位置刷新失败: {e}")
+
+    def _idle_refresh(self, axes):
+        # 排队期间运动可能已经开始
+        if not anc_queue.motion_active:
+            self._read_stale(axes, self.idle_refresh)
+
+
+# 全局唯一的位置缓存服务
+position_service = PositionService()
@@ -0,0 +1,56 @@
+import threading
+import time
+from collections import namedtuple
+
+# 一次探针定位测量：x/y 为亚像素坐标（未命中时为 None），seq 为发布序号（单调递增），
+# timestamp 为对应相机帧的采集时间（time.time()），frame_seq 为相机环形缓冲区中的帧序号
+ProbeMeasurement = namedtuple('ProbeMeasurement', ['x', 'y', 'score', 'seq', 'timestamp', 'frame_seq'])
+
+
+class ProbePositionPublisher:
+    """
+    线程安全的探针位置发布器，取代 red_dot_x/red_dot_y 全局变量。
+
+    帧流水线的匹配级每完成一次探针匹配就 publish() 一次（未命中也发布，x/y 为 None），
+    运动控制循环用 wait_newer() 精确等待移动结束后的第一帧测量，而不是固定 sleep。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._latest = ProbeMeasurement(None, None, -1.0, 0, 0.0, 0)
+
+    @property
+    def seq(self):
+        return self._latest.seq
+
+    def latest(self):
+        """返回最近一次测量（ProbeMeasurement）"""
+        return self._latest
+
+    def publish(self, x, y, score, frame_seq=0, timestamp=None):
+        """发布一次新测量并唤醒所有等待者，返回该测量"""
+        with self._cond:
+            measurement = ProbeMeasurement(x, y, float(score), self._latest.seq + 1,
+                                           time.time() if timestamp is None else timestamp, frame_seq)
+            self._latest = measurement
+            self._cond.notify_all()
+        return measurement
+
+    def wait_newer(self, seq, timeout=None, since=None):
+        """
+        等待序号大于 seq 的测量；给出 since 时还要求对应帧在 since 之后采集（排除移动过程中拍到的帧）。
+
+        返回满足条件的最新测量，超时返回 None。
+        """
+        def ready():
+            m = self._latest
+            return m.seq > seq and (since is None or m.timestamp >= since)
+
+        with self._cond:
+            if not self._cond.wait_for(ready, timeout):
+                return None
+            return self._latest
+
+
+# 全局唯一的探针位置发布器
+probe_publisher = ProbePositionPublisher()
@@ -0,0 +1,105 @@
+import numpy as np
+
+
+class RoutePlanner:
+    """
+    批量测试的器件访问顺序规划：从当前位置出发、依次访问给定的器件（不回到起点），
+    用最近邻构造初始路径，再用 2-opt 消除交叉，使定位器总行程（按轴加权）最短。
+
+    - weights: 每个轴单位位移的代价（例如每单位位移所需步数 / 频率），慢轴权重大；
+    - backlash: 每个轴换向时的额外代价（与 weights 加权后的位移同单位），用于回差补偿；
+    - overhead: 每次某个轴需要移动时的固定代价（启动、稳定、逐次逼近等）。
+
+    2-opt 先按对称代价（不含回差）快速优化；器件数不超过 exact_limit 时再按含回差的完整代价细化一轮。
+    """
+
+    def __init__(self, weights=(1.0, 1.0), backlash=(0.0, 0.0), overhead=0.0, exact_limit=80, max_passes=20):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.backlash = np.asarray(backlash, dtype=np.float64)
+        self.overhead = overhead
+        self.exact_limit = exact_limit
+        self.max_passes = max_passes
+
+    def _cost_matrix(self, points):
+        delta = np.abs(points[:, None, :] - points[None, :, :])
+        return (delta * self.weights).sum(axis=2) + self.overhead * (delta > 1e-9).sum(axis=2)
+
+    def route_cost(self, points, order, start, direction=(0, 0)):
+        """
+        从 start 出发按 order 访问 points 的总代价（含换向回差）。
+        direction 为出发前各轴最后一次移动的方向（+1/-1，0 表示未知）
+        """
+        path = np.vstack([start, points[order]])
+        steps = np.diff(path, axis=0)
+        cost = (np.abs(steps) * self.weights).sum() + self.overhead * (np.abs(steps) > 1e-9).sum()
+        for axis in range(2):
+            signs = np.sign(steps[:, axis])
+            signs = signs[signs != 0]
+            if direction[axis]:
+                signs = np.concatenate([[direction[axis]], signs])
+            cost += self.backlash[axis] * np.count_nonzero(signs[1:] != signs[:-1])
+        return float(cost)
+
+    @staticmethod
+    def _nearest_neighbour(cost, start_cost):
+        n = len(start_cost)
+        visited = np.zeros(n, dtype=bool)
+        current = int(np.argmin(start_cost))
+        order = [current]
+        visited[current] = True
+        for _ in range(n - 1):
+            row = np.where(visited, np.inf, cost[current])
+            current = int(np.argmin(row))
+            order.append(current)
+            visited[current] = True
+        return order
+
+    def _two_opt(self, order, cost, start_cost):
+        """开放路径的 2-opt：反转 order[i..j]，首节点的前驱为起点"""
+        n = len(order)
+        for _ in range(self.max_passes):
+            improved = False
+            for i in range(n - 1):
+                before = start_cost[order[i]] if i == 0 else cost[order[i - 1], order[i]]
+                for j in range(i + 1, n):
+                    after = cost[order[j], order[j + 1]] if j + 1 < n else 0.0
+                    new_before = start_cost[order[j]] if i == 0 else cost[order[i - 1], order[j]]
+                    new_after = cost[order[i], order[j + 1]] if j + 1 < n else 0.0
+                    if new_before + new_after < before + after - 1e-9:
+                        order[i:j + 1] = order[i:j + 1][::-1]
+                        improved = True
+                        before = start_cost[order[i]] if i == 0 else cost[order[i - 1], order[i]]
+            if not improved:
+                break
+        return order
+
+    def _two_opt_exact(self, points, order, start, direction):
+        """按含回差的完整路径代价做 2-opt（O(n³)，只用于小规模）"""
+        best = self.route_cost(points, order, start, direction)
+        n = len(order)
+        for _ in range(self.max_passes):
+            improved = False
+            for i in range(n - 1):
+                for j in range(i + 1, n):
+                    candidate = order[:i] + order[i:j + 1][::-1] + order[j + 1:]
+                    cost = self.route_cost(points, candidate, start, direction)
+                    if cost < best - 1e-9:
+                        order, best = candidate, cost
+                        improved = True
+            if not improved:
+                break
+        return order
+
+    def plan(self, points, start, direction=(0, 0)):
+        """返回访问顺序（points 的下标列表）"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        start = np.asarray(start, dtype=np.float64)
+        if len(points) <= 1:
+            return list(range(len(points)))
+        cost = self._cost_matrix(points)
+        start_delta = np.abs(points - start)
+        start_cost = (start_delta * self.weights).sum(axis=1) + self.overhead * (start_delta > 1e-9).sum(axis=1)
+        order = self._two_opt(self._nearest_neighbour(cost, start_cost), cost, start_cost)
+        if len(points) <= self.exact_limit and np.any(self.backlash):
+            order = self._two_opt_exact(points, order, start, direction)
+        return order
@@ -0,0 +1,228 @@
+import time
+
+import numpy as np
+
+from Scan.ScanEngine import ScanSample, SampleWriter, spiral_points
+from Scan.ScanXY import scan_stage, scan_range
+
+
+class _Vertex:
+    """一个已测点：重复测量时对读数取累计平均，抵消"幸运噪声"造成的虚高"""
+
+    def __init__(self, point, value):
+        self.point = np.asarray(point, dtype=np.float64)
+        self.value = value
+        self.count = 1
+
+    def add(self, value):
+        self.count += 1
+        self.value += (value - self.value) / self.count
+
+
+class CouplingOptimizer:
+    """
+    光耦合优化：在扫描台 X/Y 上无梯度地最大化探测器读数（SIM970 电压、相机光斑亮度等），
+    所需测量次数远少于全范围扫描。
+
+    - hill_climb(): 坐标轮换爬山，成功方向优先、成功时放大步长、失败时减半；
+    - nelder_mead(): 单纯形法，每轮重新测量当前最优顶点并取平均；
+    - 噪声感知：开始时在起点重复测量估计噪声 sigma，改进量小于 noise_k·sigma 视为噪声，不算改进；
+    - 起点附近读数平坦（只有噪声）时先做有限的螺旋搜索找到信号，再开始局部优化；
+    - 所有测量计入 max_evaluations 预算，并逐点写入 path（CSV，可选）。
+
+    detector(): 返回当前读数，失败返回 None；stage: 提供 set_target_xy 的扫描台驱动（返回预计稳定时刻）。
+    """
+
+    def __init__(self, detector, stage=scan_stage, is_low=False, dwell=0.05, repeats=1, noise_k=2.0,
+                 max_evaluations=60, path=None, stop_fn=lambda: False):
+        self.detector = detector
+        self.stage = stage
+        self.is_low = is_low
+        self.dwell = dwell
+        self.repeats = repeats
+        self.noise_k = noise_k
+        self.max_evaluations = max_evaluations
+        self.path = path
+        self.stop_fn = stop_fn
+        self.evaluations = 0
+        self.sigma = 0.0
+        self.samples = []
+        self._writer = None
+
+    @property
+    def threshold(self):
+        """有意义的最小改进量"""
+        return self.noise_k * self.sigma * np.sqrt(2.0 / self.repeats)
+
+    def _exhausted(self):
+        return self.stop_fn() or self.evaluations >= self.max_evaluations
+
+    def _clip(self, point):
+        low, high = scan_range(self.is_low)
+        return np.clip(np.asarray(point, dtype=np.float64), low, high)
+
+    def measure(self, point, level=0):
+        """移动到 point 并读取 repeats 次取平均，读取失败返回 None"""
+        x, y = self._clip(point)
+        settle_at = self.stage.set_target_xy(x, y, is_low=self.is_low) or 0.0
+        # 等扫描台稳定（驱动给出的稳定时刻）且至少 dwell 秒后再读数，否则噪声估计测到的是运动
+        time.sleep(max(self.dwell, settle_at - time.time()))
+        values = [v for v in (self.detector() for _ in range(self.repeats)) if v is not None]
+        self.evaluations += 1
+        if not values:
+            return None
+        sample = ScanSample(float(x), float(y), float(np.mean(values)), time.time(), level)
+        self.samples.append(sample)
+        if self._writer is not None:
+            self._writer.write(sample)
+        return sample.value
+
+    def estimate_noise(self, point, n=4):
+        """在 point 重复测量 n 次，返回 (平均值, 标准差)"""
+        values = [v for v in (self.measure(point) for _ in range(n)) if v is not None]
+        if not values:
+            return None, 0.0
+        self.sigma = float(np.std(values, ddof=1)) if len(values) > 1 else 0.0
+        return float(np.mean(values)), self.sigma
+
+    def _vertex(self, point):
+        point = self._clip(point)
+        value = self.measure(point)
+        return None if value is None else _Vertex(point, value)
+
+    def acquire(self, start, start_value, step, budget):
+        """
+        从 start 向外螺旋搜索，第一圈内有读数与起点的差超过噪声阈值（存在梯度）时直接返回 start；
+        否则继续直到找到明显高于起点的点，最多 budget 次测量。返回局部优化的起点
+        """
+        best_point, best_value = np.asarray(start, dtype=np.float64), start_value
+        low, high = scan_range(self.is_low)
+        limit = self.evaluations + budget
+        for i, point in enumerate(spiral_points(start, step, high - low)):
+            if i == 0:
+                continue
+            if self._exhausted() or self.evaluations >= limit:
+                break
+            point = self._clip(point)
+            value = self.measure(point)
+            if value is None:
+                continue
+            if i <= 8 and abs(value - start_value) > self.threshold:
+                return np.asarray(start, dtype=np.float64)
+            if value > best_value:
+                best_point, best_value = point, value
+            if best_value > start_value + 2 * self.threshold:
+                break
+        return best_point
+
+    def hill_climb(self, start, step, min_step):
+        """坐标轮换爬山，返回最优 _Vertex"""
+        best = self._vertex(start)
+        if best is None:
+            return None
+        directions = [np.array(d, dtype=np.float64) for d in ((1, 0), (-1, 0), (0, 1), (0, -1))]
+        max_step = step * 4
+        while step >= min_step and not self._exhausted():
+            improved = False
+            for i, d in enumerate(directions):
+                if self._exhausted():
+                    break
+                candidate = self._vertex(best.point + d * step)
+                if candidate is None or np.allclose(candidate.point, best.point):
+                    continue
+                if candidate.value > best.value + self.threshold:
+                    # 复测一次新点，避免被单次噪声带偏
+                    value = self.measure(candidate.point)
+                    if value is not None:
+                        candidate.add(value)
+                    if candidate.value > best.value + self.threshold:
+                        best = candidate
+                        # 成功的方向下一轮优先尝试
+                        directions.insert(0, directions.pop(i))
+                        improved = True
+                        break
+            step = min(step * 1.5, max_step) if improved else step / 2
+        return best
+
+    def nelder_mead(self, start, step, min_step):
+        """Nelder-Mead 单纯形法（最大化），返回最优 _Vertex"""
+        start = self._clip(start)
+        simplex = [self._vertex(start + offset) for offset in ((0, 0), (step, 0), (0, step))]
+        simplex = [v for v in simplex if v is not None]
+        if len(simplex) < 3:
+            return max(simplex, key=lambda v: v.value) if simplex else None
+
+        while not self._exhausted():
+            simplex.sort(key=lambda v: v.value, reverse=True)
+            best, second, worst = simplex
+            # 重新测量最优顶点，取累计平均
+            value = self.measure(best.point)
+            if value is not None:
+                best.add(value)
+                simplex.sort(key=lambda v: v.value, reverse=True)
+                best, second, worst = simplex
+            size = max(np.hypot(*(v.point - best.point)) for v in simplex)
+            if size < min_step:
+                break
+            if best.value - worst.value < self.threshold:
+                # 顶点间差异淹没在噪声中：向最优点收缩
+                simplex = [best] + [v for v in (self._vertex((best.point + w.point) / 2) for w in (second, worst))
+                                    if v is not None]
+                if len(simplex) < 3:
+                    break
+                continue
+
+            centroid = (best.point + second.point) / 2
+            reflected = self._vertex(centroid + (centroid - worst.point))
+            if reflected is None:
+                break
+            if reflected.value > best.value:
+                expanded = self._vertex(centroid + 2 * (centroid - worst.point))
+                simplex[2] = expanded if expanded is not None and expanded.value > reflected.value else reflected
+            elif reflected.value > second.value:
+                simplex[2] = reflected
+            else:
+                # 反射点好于最差点时向反射点一侧收缩，否则向最差点一侧收缩
+                outside = reflected.value > worst.value
+                contracted = self._vertex(centroid + (0.5 if outside else -0.5) * (centroid - worst.point))
+                bar = reflected.value if outside else worst.value
+                if contracted is not None and contracted.value > bar:
+                    simplex[2] = contracted
+                else:
+                    # 收缩失败：整体向最优点缩小
+                    simplex = [best] + [v for v in (self._vertex((best.point + w.point) / 2) for w in (second, worst))
+                                        if v is not None]
+                    if len(simplex) < 3:
+                        break
+        return max(simplex, key=lambda v: v.value)
+
+    def optimize(self, start=None, step=None, min_step=None, method='nelder-mead'):
+        """
+        从 start（默认扫描台当前设定值，未知时为范围中心）开始优化，step 为初始步长（默认范围的 1/10），
+        min_step 为终止步长（默认 step/20）。结束时扫描台停在最优点，返回最优 ScanSample（失败为 None）
+        """
+        low, high = scan_range(self.is_low)
+        if start is None:
+            start = self.stage.target_xy() if hasattr(self.stage, 'target_xy') else None
+            if start is None or None in start:
+                start = ((low + high) / 2,) * 2
+        step = (high - low) / 10 if step is None else step
+        min_step = step / 20 if min_step is None else min_step
+
+        self.evaluations = 0
+        self.samples = []
+        self._writer = SampleWriter(self.path) if self.path else None
+        try:
+            start_value, _ = self.estimate_noise(start)
+            if start_value is not None:
+                start = self.acquire(start, start_value, step, self.max_evaluations // 2)
+            search = self.nelder_mead if method == 'nelder-mead' else self.hill_climb
+            best = search(start, step, min_step)
+        finally:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        if best is None:
+            return None
+        self.stage.set_target_xy(*best.point, is_low=self.is_low)
+        return ScanSample(float(best.point[0]), float(best.point[1]), best.value, time.time(), 0)
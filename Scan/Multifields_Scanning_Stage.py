@@ -66,6 +66,11 @@ class Positioner_scanning(object):
         write_str = '[target:ch%d:%6f]' % (CH,cap_v)
         # print(write_str)
         self.write(write_str)     
+
+    def set_targets(self, targets):
+        """多个通道的目标值合并为一帧写出，targets 为 {通道: 目标值}"""
+        write_str = ''.join('[target:ch%d:%6f]' % (CH, cap_v) for CH, cap_v in targets.items())
+        self.write(write_str)
         
     def cap(self, CAP):
         write_str = '[cap:%dnF]' % (CAP)
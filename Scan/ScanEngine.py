@@ -0,0 +1,231 @@
+import csv
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from Scan.ScanXY import scan_stage, scan_range
+
+# 一个扫描采样点：设定值 (x, y)，探测器读数 value，采样时刻，所属细化层级（0 为初始扫描）
+ScanSample = namedtuple('ScanSample', ['x', 'y', 'value', 'timestamp', 'level'])
+
+
+# ---------------------------- 扫描路径 ---------------------------- #
+
+def _axis(start, stop, step):
+    """包含两端点的等间距设定值序列"""
+    n = int(round(abs(stop - start) / step)) + 1
+    return np.linspace(start, stop, max(n, 1))
+
+
+def raster_points(x_range, y_range, step):
+    """逐行扫描，每行都从 x_range[0] 走到 x_range[1]"""
+    for y in _axis(*y_range, step):
+        for x in _axis(*x_range, step):
+            yield x, y
+
+
+def serpentine_points(x_range, y_range, step):
+    """蛇形扫描：相邻行反向，省去每行的回程"""
+    xs = _axis(*x_range, step)
+    for i, y in enumerate(_axis(*y_range, step)):
+        for x in (xs if i % 2 == 0 else xs[::-1]):
+            yield x, y
+
+
+def spiral_points(center, step, radius):
+    """从 center 向外的方形螺旋，适合在已知大致位置附近搜索"""
+    x, y = center
+    yield x, y
+    dx, dy = step, 0.0
+    length = 1
+    # 多走一圈的前两条边以补齐最外圈，超出半径的点丢弃
+    while length * step <= 2 * radius + step:
+        for _ in range(2):
+            for _ in range(length):
+                x, y = x + dx, y + dy
+                if abs(x - center[0]) <= radius and abs(y - center[1]) <= radius:
+                    yield x, y
+            dx, dy = -dy, dx
+        length += 1
+
+
+PATTERNS = {'raster': raster_points, 'serpentine': serpentine_points}
+
+
+# ---------------------------- 探测器 ---------------------------- #
+
+class PowerDetector:
+    """光功率计，meter 需提供 read_power()（单位 W）"""
+
+    def __init__(self, meter):
+        self.meter = meter
+
+    def __call__(self):
+        return float(self.meter.read_power())
+
+
+class SIM970Detector:
+    """SIM970 电压表某通道 n 次读数的平均值，默认使用已连接的 SIM970ConnectionThread.anc"""
+
+    def __init__(self, channel='1', n=1, meter=None):
+        self.channel = str(channel)
+        self.n = n
+        self.meter = meter
+
+    def __call__(self):
+        meter = self.meter
+        if meter is None:
+            from SerialPage import SIM970ConnectionThread
+            meter = SIM970ConnectionThread.anc
+        _, mean, _ = meter.read_n_return_mean_std(self.channel, self.n)
+        return float(mean)
+
+
+class CameraIntensityDetector:
+    """相机图像 roi=(x, y, w, h) 区域的平均灰度；image_fn() 返回最新一帧（None 表示暂无图像）"""
+
+    def __init__(self, image_fn, roi=None):
+        self.image_fn = image_fn
+        self.roi = roi
+
+    def __call__(self):
+        image = self.image_fn()
+        if image is None:
+            return None
+        if self.roi is not None:
+            x, y, w, h = self.roi
+            image = image[y:y + h, x:x + w]
+        return float(np.mean(image))
+
+
+# ---------------------------- 扫描引擎 ---------------------------- #
+
+class SampleWriter:
+    """把采样逐行追加写入 CSV（每行写完即 flush，中途中断也不丢数据）"""
+
+    FIELDS = ScanSample._fields
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'a', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        if self._file.tell() == 0:
+            self._writer.writerow(self.FIELDS)
+
+    def write(self, sample):
+        self._writer.writerow(sample)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ScanEngine:
+    """
+    扫描台光学对准扫描：按给定路径逐点设置扫描台、等待 dwell 秒后读取探测器，
+    采样逐点写入 path（CSV，可选），支持在最大值附近逐级加密的自适应细化。
+
+    - detector(): 返回当前读数（float），读取失败返回 None（该点跳过）；
+    - stage: 提供 set_target_xy(x, y, is_low)（返回预计稳定时刻）的扫描台驱动，默认全局 scan_stage；
+    - max_duration: 整个扫描（含细化）的时长上限（秒），超时提前结束；
+    - stop_fn(): 返回 True 时立即中止。
+    """
+
+    def __init__(self, detector, stage=scan_stage, is_low=False, dwell=0.05, path=None, max_duration=None,
+                 stop_fn=lambda: False):
+        self.detector = detector
+        self.stage = stage
+        self.is_low = is_low
+        self.dwell = dwell
+        self.path = path
+        self.max_duration = max_duration
+        self.stop_fn = stop_fn
+        self.samples = []
+        self._deadline = None
+        self._writer = None
+
+    def _in_range(self, x, y):
+        low, high = scan_range(self.is_low)
+        return low <= x <= high and low <= y <= high
+
+    def _expired(self):
+        return self.stop_fn() or (self._deadline is not None and time.time() > self._deadline)
+
+    def _sample(self, x, y, level):
+        settle_at = self.stage.set_target_xy(x, y, is_low=self.is_low) or 0.0
+        # 等扫描台稳定（驱动给出的稳定时刻）且至少 dwell 秒后再读数
+        time.sleep(max(self.dwell, settle_at - time.time()))
+        value = self.detector()
+        if value is None:
+            return None
+        sample = ScanSample(float(x), float(y), value, time.time(), level)
+        self.samples.append(sample)
+        if self._writer is not None:
+            self._writer.write(sample)
+        return sample
+
+    def _run_points(self, points, level):
+        taken = []
+        for x, y in points:
+            if self._expired():
+                break
+            if not self._in_range(x, y):
+                continue
+            sample = self._sample(x, y, level)
+            if sample is not None:
+                taken.append(sample)
+        return taken
+
+    def _best(self, samples, maximize):
+        valid = [s for s in samples if s.value is not None]
+        if not valid:
+            return None
+        return max(valid, key=lambda s: s.value if maximize else -s.value)
+
+    def scan(self, points, refine_levels=0, refine_factor=4, refine_span=1.0, step=None, maximize=True):
+        """
+        扫描 points（例如 serpentine_points(...) 的结果），然后在最优点附近细化 refine_levels 级：
+        每级以上一级步长 / refine_factor 为步长、在 ±refine_span 个上一级步长的窗口内蛇形扫描。
+        step 为初始路径的步长（细化时需要），返回最优采样（无有效采样时为 None）
+        """
+        self.samples = []
+        self._deadline = None if self.max_duration is None else time.time() + self.max_duration
+        self._writer = SampleWriter(self.path) if self.path else None
+        try:
+            best = self._best(self._run_points(points, 0), maximize)
+            for level in range(1, refine_levels + 1):
+                if best is None or step is None or self._expired():
+                    break
+                window = step * refine_span
+                step = step / refine_factor
+                points = serpentine_points((best.x - window, best.x + window), (best.y - window, best.y + window),
+                                           step)
+                best = self._best([best] + self._run_points(points, level), maximize)
+        finally:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        if best is not None:
+            # 停在最优点
+            self.stage.set_target_xy(best.x, best.y, is_low=self.is_low)
+        return best
+
+    def run(self, pattern, x_range=None, y_range=None, step=5.0, center=None, radius=None, **kwargs):
+        """
+        按名称运行扫描：pattern 为 'raster'、'serpentine' 或 'spiral'。
+        raster/serpentine 需要 x_range/y_range（默认整个扫描台范围），spiral 需要 center/radius。
+        其余参数（refine_levels 等）传给 scan()
+        """
+        if pattern == 'spiral':
+            low, high = scan_range(self.is_low)
+            center = ((low + high) / 2,) * 2 if center is None else center
+            radius = (high - low) / 2 if radius is None else radius
+            points = spiral_points(center, step, radius)
+        else:
+            full = scan_range(self.is_low)
+            points = PATTERNS[pattern](x_range or full, y_range or full, step)
+        return self.scan(points, step=step, **kwargs)
@@ -1,46 +1,111 @@
+import atexit
+import threading
 import time
 from Scan.Multifields_Scanning_Stage import Positioner_scanning
 
+# 扫描台通道：X -> ch2，Y -> ch1
+SCAN_CHANNELS = {'x': 2, 'y': 1}
+
+
+def scan_range(is_low=False):
+    """扫描台允许的目标范围 (最小, 最大)"""
+    return (-150, 150) if is_low else (0, 75)
+
+
+def _clamp(value, is_low):
+    low, high = scan_range(is_low)
+    return min(max(value, low), high)
+
+
+class ScanStage:
+    """
+    扫描台长连接驱动：首次使用时打开串口并发送 [nch:12] [start]，之后保持连接，
+    set_target_xy() 把两个轴的目标合并为一帧写出后立即返回（可选等待稳定），
+    未变化的轴不重复发送。串口异常时关闭连接，下次调用自动重连。
+    """
+
+    def __init__(self, port='COM3', settle_time=0.3):
+        self.port = port
+        self.settle_time = settle_time
+        self._lock = threading.Lock()
+        self._mfs = None
+        self._targets = {}
+        self._settle_at = 0.0
+
+    def _connect(self):
+        if self._mfs is not None and self._mfs.is_open():
+            return self._mfs
+        # 使用 COM 端口连接，波特率 115200
+        self._mfs = Positioner_scanning(self.port)
+        self._mfs.nch(12)
+        self._mfs.write('[start]')
+        self._targets = {}
+        return self._mfs
+
+    def _disconnect(self):
+        if self._mfs is not None:
+            try:
+                self._mfs.close()
+            except Exception:
+                pass
+        self._mfs = None
+        self._targets = {}
+
+    def set_target_xy(self, x=None, y=None, is_low=False, wait=False):
+        """
+        设置扫描台 X/Y 目标（None 表示该轴不动），超出范围时截断。
+        返回预计稳定时刻（time.time() 时间基准）；wait=True 时等到稳定后返回。
+        """
+        targets = {}
+        for axis, value in (('x', x), ('y', y)):
+            if value is not None:
+                targets[SCAN_CHANNELS[axis]] = _clamp(value, is_low)
+        with self._lock:
+            changed = {ch: v for ch, v in targets.items() if self._targets.get(ch) != v}
+            if changed:
+                try:
+                    self._connect().set_targets(changed)
+                except Exception:
+                    self._disconnect()
+                    raise
+                self._targets.update(changed)
+                self._settle_at = time.time() + self.settle_time
+            settle_at = self._settle_at
+        if wait:
+            self.wait_settled()
+        return settle_at
+
+    def target_xy(self):
+        """最近一次设置的 (X, Y) 目标，未设置过的轴为 None"""
+        with self._lock:
+            return self._targets.get(SCAN_CHANNELS['x']), self._targets.get(SCAN_CHANNELS['y'])
+
+    def wait_settled(self):
+        """等到最近一次设置目标后的稳定时间过去"""
+        remaining = self._settle_at - time.time()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def close(self):
+        """发送 [stop] 并关闭串口"""
+        with self._lock:
+            if self._mfs is not None and self._mfs.is_open():
+                try:
+                    self._mfs.write('[stop]')
+                except Exception:
+                    pass
+            self._disconnect()
+
+
+# 全局唯一的扫描台连接
+scan_stage = ScanStage('COM3')  # 根据实际设备端口修改 COM 号
+atexit.register(scan_stage.close)
+
+
 def ScanY(x,is_low=False):
-    if is_low:
-        if x<= -150:
-            x=-150
-        if x>= 150:
-            x=150
-    else:
-        if x<= 0:
-            x = 0
-        if x>=75:
-            x=75
-
-    # 使用 COM 端口连接，波特率 115200
-    MFS = Positioner_scanning('COM3')  # 根据实际设备端口修改 COM 号
-    MFS.nch(12)
-    MFS.write('[start]')
-    MFS.set_target(1, x)
-    time.sleep(0.3)
-    MFS.write('[stop]')
-    # 关闭串口连接
-    MFS.close()
+    """兼容接口：设置扫描台 Y 并等待稳定"""
+    scan_stage.set_target_xy(y=x, is_low=is_low, wait=True)
 
 def ScanX(y,is_low=False):
-    if is_low:
-        if y <= -150:
-            y = -150
-        if y >= 150:
-            y = 150
-    else:
-        if y <= 0:
-            y = 0
-        if y >= 75:
-            y = 75
-    # 使用 COM 端口连接，波特率 115200
-    MFS = Positioner_scanning('COM3')  # 根据实际设备端口修改 COM 号
-    MFS.nch(12)
-    MFS.write('[start]')
-    MFS.set_target(2, y)
-    time.sleep(0.3)
-    MFS.write('[stop]')
-    # 关闭串口连接
-    MFS.close()
-
+    """兼容接口：设置扫描台 X 并等待稳定"""
+    scan_stage.set_target_xy(x=y, is_low=is_low, wait=True)
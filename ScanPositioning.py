@@ -0,0 +1,132 @@
+import numpy as np
+
+
+class ScanAxisModel:
+    """
+    扫描台单轴模型：像素位置 p = p0 + gain·v + s·hysteresis/2，
+    v 为扫描台设定值，s 为最近一次移动的方向（+1/-1）。gain 为每单位设定值的像素位移（带符号），
+    hysteresis 为从下方与从上方到达同一设定值时的像素差。
+    """
+
+    def __init__(self, gain, hysteresis=0.0, direction=1):
+        self.gain = float(gain)
+        self.hysteresis = float(hysteresis)
+        self.direction = direction
+
+    def _hysteresis_shift(self, direction):
+        return (direction - self.direction) * self.hysteresis / 2
+
+    def setpoint_for(self, setpoint, pixel_error):
+        """从 setpoint 出发消除 pixel_error 所需的新设定值（换向时补偿回差）"""
+        direction = 1 if pixel_error / self.gain > 0 else -1
+        return setpoint + (pixel_error - self._hysteresis_shift(direction)) / self.gain
+
+    def observe(self, dv, dp, min_dv=1e-3, max_ratio=2.0):
+        """
+        记录一次移动 (设定值变化, 像素位移)，更新方向并按割线修正 gain；
+        位移太小或与模型相差超过 max_ratio 倍（跟踪异常）时只更新方向，返回是否修正了 gain
+        """
+        if abs(dv) < min_dv:
+            return False
+        direction = 1 if dv > 0 else -1
+        gain = (dp - self._hysteresis_shift(direction)) / dv
+        self.direction = direction
+        ratio = gain / self.gain
+        if not 1.0 / max_ratio <= ratio <= max_ratio:
+            return False
+        self.gain = 0.5 * self.gain + 0.5 * gain
+        return True
+
+
+class ScanFineTuner:
+    """
+    扫描台精调：标定一次两轴的 设定值->像素 增益与回差，之后按模型直接跳到预测设定值，
+    再用一两次修正步消除残差，取代逐轴二分搜索。
+
+    - stage_fn(x, y): 设置扫描台两轴目标，返回此后采集的帧才有效的时刻；
+    - measure_fn(since): 返回 since 之后采集的帧中的探针位置 (x, y)，失败为 (None, None)；
+    - scan_range: 设定值范围 (最小, 最大)；
+    - stop_fn(): 返回 True 时立即中止。
+    """
+
+    def __init__(self, stage_fn, measure_fn, scan_range, stop_fn=lambda: False):
+        self.stage_fn = stage_fn
+        self.measure_fn = measure_fn
+        self.scan_range = scan_range
+        self.stop_fn = stop_fn
+        self.models = None
+        self.setpoint = None
+        self.position = None
+
+    def _move(self, x, y):
+        since = self.stage_fn(x, y)
+        self.setpoint = np.array([x, y], dtype=np.float64)
+        pos = self.measure_fn(since)
+        return None if pos[0] is None or pos[1] is None else np.array(pos, dtype=np.float64)
+
+    def calibrate(self, center, span=None, min_gain=0.05):
+        """
+        以 center 为中心标定：依次移动到 center+span、center、center-span、center，
+        由两端位置得到增益，由从上方/下方回到中心的位置差得到回差。成功返回 True
+        """
+        low, high = self.scan_range
+        span = (high - low) / 6 if span is None else span
+        c = np.asarray(center, dtype=np.float64)
+        points = []
+        for offset in (span, 0.0, -span, 0.0):
+            if self.stop_fn():
+                return False
+            v = np.clip(c + offset, low, high)
+            pos = self._move(*v)
+            if pos is None:
+                return False
+            points.append((v, pos))
+        (v1, p1), (_, p_above), (v2, p2), (_, p_below) = points
+        hysteresis = p_below - p_above
+        # 正端由下方到达、负端由上方到达，两者之差包含一次回差
+        gain = (p1 - p2 - hysteresis) / (v1 - v2)
+        if np.any(np.abs(gain) < min_gain):
+            return False
+        # 最后一次是从下方回到中心，方向为 +1
+        self.models = [ScanAxisModel(gain[i], hysteresis[i], direction=1) for i in range(2)]
+        self.position = p_below
+        return True
+
+    def run(self, target, done_fn, start=None, setpoint=None, max_steps=3):
+        """
+        把探针移到 target（像素），done_fn(误差x, 误差y) 返回两轴是否已满足精度 (bool, bool)。
+        start/setpoint 为当前探针位置和扫描台设定值（在别处移动过扫描台时传入），默认沿用上次的结果。
+        需先 calibrate()。返回 (最终位置 (x, y) 或 None, 是否收敛, 移动次数)
+        """
+        target = np.asarray(target, dtype=np.float64)
+        if setpoint is not None:
+            setpoint = np.asarray(setpoint, dtype=np.float64)
+            for i, model in enumerate(self.models):
+                if setpoint[i] != self.setpoint[i]:
+                    model.direction = 1 if setpoint[i] > self.setpoint[i] else -1
+            self.setpoint = setpoint
+        pos = self.position if start is None else np.asarray(start, dtype=np.float64)
+        low, high = self.scan_range
+        for step in range(max_steps + 1):
+            error = target - pos
+            done = done_fn(*error)
+            if all(done):
+                return pos, True, step
+            if step == max_steps or self.stop_fn():
+                break
+            new = self.setpoint.copy()
+            for i, model in enumerate(self.models):
+                if not done[i]:
+                    new[i] = np.clip(model.setpoint_for(self.setpoint[i], error[i]), low, high)
+            if np.allclose(new, self.setpoint):
+                # 目标超出扫描台范围
+                break
+            old = self.setpoint
+            new_pos = self._move(*new)
+            if new_pos is None:
+                return None, False, step + 1
+            for i, model in enumerate(self.models):
+                model.observe(new[i] - old[i], new_pos[i] - pos[i])
+            pos = new_pos
+            self.position = pos
+        return pos, False, step
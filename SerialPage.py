@@ -4,6 +4,7 @@ from PyQt5.QtWidgets import QMainWindow
 import serial.tools.list_ports
 from PyQt5.QtCore import *
 from pymeasure.instruments.keithley import Keithley2450
+from ANCController import TrackedSerial
 from SRS_SIM970 import SRSSIM970
 from ZauxdllTest import GBIOConnect
 from demo import Ui_MainWindow
@@ -286,7 +287,8 @@ class NeedelConnectionThread(QThread):
         try:
             bps = 115200
             port = "COM" + str(NeedelConnectionThread.port_number)
-            NeedelConnectionThread.anc = serial.Serial(port, bps, timeout=0.1)
+            # 包装一层以记录控制器状态（通道/电容/电压/频率），LTDS 据此只发送变化的设置
+            NeedelConnectionThread.anc = TrackedSerial(serial.Serial(port, bps, timeout=0.1))
             self.connected.emit(True, f"连接成功，端口 {NeedelConnectionThread.port_number}")
         except Exception as e:
             self.connected.emit(False, f"连接失败: {str(e)}")
@@ -0,0 +1,161 @@
+import atexit
+import json
+import math
+import os
+import threading
+import time
+
+from TemperatureConfig import get_mode
+
+
+class StepModel:
+    """
+    单个 (轴, 方向, 温度) 的步长模型：每步位移 k（编码器单位或像素）。
+
+    以先验值起步，每次观测 (步数, 实际位移) 后用指数加权平均在对数域更新 k，
+    前几次观测权重较大，之后保持 min_alpha 的遗忘率以跟踪压电步长的缓慢漂移。
+    """
+
+    def __init__(self, units_per_step, prior_count=3, min_alpha=0.1):
+        self.k = float(units_per_step)
+        self.count = 0
+        self.prior_count = prior_count
+        self.min_alpha = min_alpha
+        self.log_var = 0.0  # 对数比值的方差，反映模型可信度
+
+    def steps_for(self, displacement):
+        """走过 |displacement| 所需的步数（浮点，未取整）"""
+        return abs(displacement) / self.k
+
+    def observe(self, steps, displacement, min_steps=10, max_ratio=5.0):
+        """
+        记录一次观测：steps 为正的步数，displacement 为沿命令方向的位移（反向时为负）。
+        步数太少、方向相反或与当前模型相差超过 max_ratio 倍（跟踪丢失、撞限位等）时拒绝，返回是否采纳
+        """
+        if steps < min_steps or displacement <= 0:
+            return False
+        ratio = displacement / steps / self.k
+        if not 1.0 / max_ratio <= ratio <= max_ratio:
+            return False
+        alpha = max(1.0 / (self.count + self.prior_count + 1), self.min_alpha)
+        log_ratio = math.log(ratio)
+        self.k *= math.exp(alpha * log_ratio)
+        self.log_var = (1 - alpha) * (self.log_var + alpha * log_ratio ** 2)
+        self.count += 1
+        return True
+
+    def to_dict(self):
+        return {'k': self.k, 'count': self.count, 'log_var': self.log_var}
+
+    def load_dict(self, data):
+        self.k = float(data.get('k', self.k))
+        self.count = int(data.get('count', 0))
+        self.log_var = float(data.get('log_var', 0.0))
+
+
+class StepCalibration:
+    """
+    ANC 定位器步长标定：按 轴 / 方向 / 温度模式（以及设备）分别维护 StepModel，
+    由实际移动的观测（getPosition 编码器读数或相机像素位移）在线拟合并持久化到 JSON 文件，
+    取代各运动函数中硬编码的 distance_weight、XY_k、XY_k_2、Z_k、step_per_unit。
+
+    轴名：
+      X / Y / Z           编码器单位，move_to_target 首次移动与 move_to_Z（正方向为坐标增大）
+      X_fine / Y_fine     编码器单位，move_to_target 逐次逼近阶段（小步数时步长更短）
+      px_x / px_y         相机像素，探针移动（正方向为图像向右/向下）
+    """
+
+    FILE = 'step_calibration.json'
+
+    # 先验（每步位移），由原硬编码常数换算：
+    #   XY: 0.03/XY_k, XY_fine: step_per_unit/XY_k_2, Z: step_per_unit/Z_k, px: 1/distance_weight
+    DEFAULTS = {
+        'low': {'X': 0.03 / 1000, 'Y': 0.03 / 1000, 'X_fine': 0.06 / 10000, 'Y_fine': 0.06 / 10000,
+                'Z': 0.06 / 600, 'px_x': 1 / 50, 'px_y': 1 / 50},
+        'high': {'X': 0.03 / 300, 'Y': 0.03 / 300, 'X_fine': 0.06 / 3000, 'Y_fine': 0.06 / 3000,
+                 'Z': 0.06 / 100, 'px_x': 1 / 10, 'px_y': 1 / 10},
+    }
+
+    def __init__(self, path=None, save_interval=5.0):
+        self.path = os.path.abspath(path or self.FILE)
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._models = {}
+        self._saved = {}
+        self._last_save = 0.0
+        self._dirty = False
+        self.load()
+
+    @staticmethod
+    def _key(axis, direction, mode, equipment):
+        sign = '+' if direction >= 0 else '-'
+        return f"{mode}/{axis}{sign}" if equipment is None else f"{mode}/{axis}{sign}/eq{equipment}"
+
+    def model(self, axis, direction=1, mode=None, equipment=None):
+        """返回 (轴, 方向, 温度模式, 设备) 对应的模型，不存在时按先验创建"""
+        mode = mode or get_mode().value
+        key = self._key(axis, direction, mode, equipment)
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                model = StepModel(self.DEFAULTS[mode][axis])
+                if key in self._saved:
+                    model.load_dict(self._saved[key])
+                self._models[key] = model
+            return model
+
+    def units_per_step(self, axis, direction=1, equipment=None):
+        return self.model(axis, direction, equipment=equipment).k
+
+    def steps_for(self, axis, displacement, equipment=None):
+        """沿 displacement 符号方向走过 |displacement| 所需的步数（浮点，未取整）"""
+        return self.model(axis, 1 if displacement >= 0 else -1, equipment=equipment).steps_for(displacement)
+
+    def observe(self, axis, signed_steps, displacement, equipment=None):
+        """记录一次移动：signed_steps 的符号为命令方向，displacement 为测得的带符号位移"""
+        if not signed_steps:
+            return False
+        direction = 1 if signed_steps > 0 else -1
+        model = self.model(axis, direction, equipment=equipment)
+        with self._lock:
+            accepted = model.observe(abs(signed_steps), displacement * direction)
+            if accepted:
+                self._dirty = True
+        if accepted and time.time() - self._last_save > self.save_interval:
+            self.save()
+        return accepted
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = {}
+        with self._lock:
+            self._saved = saved
+            for key, model in self._models.items():
+                if key in saved:
+                    model.load_dict(saved[key])
+
+    def save(self):
+        """写入标定文件（先写临时文件再替换，避免中途断电留下半个文件）"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = dict(self._saved)
+            data.update({key: model.to_dict() for key, model in self._models.items()})
+            self._saved = data
+            self._dirty = False
+            self._last_save = time.time()
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"保存步长标定失败: {e}")
+
+
+# 全局唯一的步长标定实例
+step_calibration = StepCalibration()
+atexit.register(step_calibration.save)
@@ -1,3 +1,5 @@
+import threading
+
 from PyQt5.QtWidgets import QMainWindow
 
 from demo import Ui_MainWindow
@@ -5,9 +7,30 @@ from demo import Ui_MainWindow
 
 class StopClass(QMainWindow, Ui_MainWindow):
     stop_num = 0
+    # 停止事件：运动流程用 stop_event.wait(t) 代替 time.sleep(t)，按下停止后立即返回
+    stop_event = threading.Event()
+
     def __init__(self,Button_needle1Stop):
         super().__init__()
         Button_needle1Stop.clicked.connect(self.STOP_MOVE)
 
     def STOP_MOVE(self):
-        StopClass.stop_num = 1
\ No newline at end of file
+        StopClass.request_stop()
+
+    @staticmethod
+    def request_stop():
+        """置位停止标志，唤醒所有等待，并经命令队列插队下发一帧全通道停止命令"""
+        StopClass.stop_num = 1
+        StopClass.stop_event.set()
+        from ANCController import anc_queue
+        anc_queue.halt()
+
+    @staticmethod
+    def is_stopped():
+        return StopClass.stop_event.is_set()
+
+    @staticmethod
+    def clear():
+        """运动流程响应停止后复位标志"""
+        StopClass.stop_num = 0
+        StopClass.stop_event.clear()
\ No newline at end of file
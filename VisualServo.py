@@ -0,0 +1,137 @@
+import time
+
+import numpy as np
+
+
+class PixelJacobian:
+    """
+    步数 -> 像素位移的 2x2 线性模型 J（Δp = J·u），用 Broyden 秩一更新在线修正。
+
+    u = (ux, uy) 为带符号步数：正值对应"向右/向下"的移动命令。初值为对角阵 (x, y 每步像素数)，
+    通常取自步长标定（StepCalibration 的 px_x / px_y 模型）。
+    """
+
+    def __init__(self, pixels_per_step):
+        if np.isscalar(pixels_per_step):
+            pixels_per_step = (pixels_per_step, pixels_per_step)
+        self.initial = np.diag(pixels_per_step).astype(np.float64)
+        self.J = self.initial.copy()
+        self.updates = 0
+
+    def reset(self):
+        self.J = self.initial.copy()
+        self.updates = 0
+
+    def steps_for(self, pixel_error):
+        """达到给定像素误差所需的步数 J⁻¹·e"""
+        return np.linalg.solve(self.J, np.asarray(pixel_error, dtype=np.float64))
+
+    def update(self, u, dp, min_pixels=1.0):
+        """
+        用一次观测 (u, Δp) 修正 J；位移太小（噪声主导）或修正后模型退化时拒绝更新，返回是否更新
+        """
+        u = np.asarray(u, dtype=np.float64)
+        dp = np.asarray(dp, dtype=np.float64)
+        uu = float(u @ u)
+        if uu == 0 or np.hypot(*dp) < min_pixels:
+            return False
+        J_new = self.J + np.outer(dp - self.J @ u, u) / uu
+        # 方向（对角符号）不能翻转，且不能接近奇异
+        if np.any(np.sign(np.diag(J_new)) != np.sign(np.diag(self.initial))) or np.linalg.cond(J_new) > 50:
+            return False
+        self.J = J_new
+        self.updates += 1
+        return True
+
+
+class VisualServo:
+    """
+    基于相机测量的闭环视觉伺服：每次迭代按当前 Jacobian 计算两轴步数并下发，
+    再由连续帧测量判断到位（相邻两帧位置变化小于 settle_tol），用实际位移在线修正 Jacobian。
+
+    - publisher: ProbePositionPublisher，提供带时间戳的新鲜测量；
+    - move_fn(ux, uy): 下发带符号步数，返回预计运动时长（秒），失败返回 None；
+    - stop_fn(): 返回 True 时立即中止；
+    - observe_fn(u, dp): 每次到位后回调实际步数与像素位移（例如喂给步长标定），可选。
+    """
+
+    def __init__(self, publisher, move_fn, jacobian, stop_fn=lambda: False, observe_fn=None, gain=0.8,
+                 max_steps=20000, settle_tol=0.5, settle_frames=2, settle_timeout=2.0):
+        self.publisher = publisher
+        self.move_fn = move_fn
+        self.jacobian = jacobian
+        self.stop_fn = stop_fn
+        self.observe_fn = observe_fn
+        self.gain = gain
+        self.max_steps = max_steps
+        self.settle_tol = settle_tol
+        self.settle_frames = settle_frames
+        self.settle_timeout = settle_timeout
+
+    def wait_settled(self, since):
+        """
+        等待 since 之后采集的帧中探针位置稳定，返回 (x, y)；超时返回最后一次有效测量，
+        停止或一直未匹配到返回 None
+        """
+        deadline = max(time.time(), since) + self.settle_timeout
+        seq = 0
+        last = None
+        stable = 0
+        while not self.stop_fn():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            m = self.publisher.wait_newer(seq, timeout=min(0.1, remaining), since=since)
+            if m is None:
+                continue
+            seq = m.seq
+            if m.x is None:
+                continue
+            pos = np.array([m.x, m.y])
+            if last is not None and np.hypot(*(pos - last)) < self.settle_tol:
+                stable += 1
+                if stable >= self.settle_frames - 1:
+                    return pos
+            else:
+                stable = 0
+            last = pos
+        return None if self.stop_fn() else last
+
+    def run(self, target, tol_steps, start=None, max_iterations=30):
+        """
+        把探针移到 target（像素），直到两轴剩余步数都小于 tol_steps。
+
+        返回 (最终位置 (x, y) 或 None, 是否收敛, 迭代次数)。
+        """
+        target = np.asarray(target, dtype=np.float64)
+        pos = start if start is not None else self.wait_settled(time.time())
+        if pos is None:
+            return None, False, 0
+        pos = np.asarray(pos, dtype=np.float64)
+
+        for iteration in range(1, max_iterations + 1):
+            if self.stop_fn():
+                return pos, False, iteration - 1
+            remaining = self.jacobian.steps_for(target - pos)
+            if np.all(np.abs(remaining) < tol_steps):
+                return pos, True, iteration - 1
+
+            # 已到位的轴不再移动，避免来回抖动
+            u = np.where(np.abs(remaining) < tol_steps, 0.0, self.gain * remaining)
+            u = np.clip(np.round(u), -self.max_steps, self.max_steps)
+            if not np.any(u):
+                return pos, True, iteration - 1
+
+            t_move = time.time()
+            duration = self.move_fn(int(u[0]), int(u[1]))
+            if duration is None:
+                return pos, False, iteration
+            new_pos = self.wait_settled(t_move + duration)
+            if new_pos is None:
+                return None, False, iteration
+            self.jacobian.update(u, new_pos - pos)
+            if self.observe_fn is not None:
+                self.observe_fn(u, new_pos - pos)
+            pos = new_pos
+
+        return pos, False, max_iterations
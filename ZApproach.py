@@ -0,0 +1,152 @@
+import time
+from collections import namedtuple
+
+# 一段连续运动：从当前位置移动到 end，步进频率 frequency（Hz）
+ZSegment = namedtuple('ZSegment', ['end', 'frequency'])
+
+
+class ZApproach:
+    """
+    Z 轴逼近规划与执行：先以高频连续移动到接触高度（或目标）前 slow_zone 处，再以低频精细逼近目标。
+    每段只下发一条步进命令，运动过程中持续读取位置（以及可选的接触电流），
+    按实测速度预判停止距离提前停止；到位、检测到接触或停止时立即下发停止命令。
+
+    - move_fn(sign, steps, frequency): 下发一条步进命令，sign=+1 为 Z 坐标增大的方向，返回是否成功；
+    - read_fn(): 读取当前 Z，失败返回 None；
+    - halt_fn(): 立即停止 Z 通道；
+    - model_fn(sign): 返回该方向的步长模型（StepModel，k 为每步位移）；
+    - frequencies: {sign: (高速频率, 低速频率上限)}；
+    - contact_fn(): 返回 True 表示已接触（例如电流超过阈值），可选；
+    - observe_fn(signed_steps, dz): 每段结束后回调执行的步数和实际位移（例如喂给步长标定），可选。
+    """
+
+    def __init__(self, move_fn, read_fn, halt_fn, model_fn, frequencies, stop_fn=lambda: False,
+                 contact_fn=None, observe_fn=None, slow_zone=0.01, tol=0.005, poll=0.02,
+                 min_frequency=50, max_passes=6):
+        self.move_fn = move_fn
+        self.read_fn = read_fn
+        self.halt_fn = halt_fn
+        self.model_fn = model_fn
+        self.frequencies = frequencies
+        self.stop_fn = stop_fn
+        self.contact_fn = contact_fn
+        self.observe_fn = observe_fn
+        self.slow_zone = slow_zone
+        self.tol = tol
+        self.poll = poll
+        self.min_frequency = min_frequency
+        self.max_passes = max_passes
+        self.latency = 0.05  # 一次读数的耗时（秒），运行中按实测更新
+
+    def fine_frequency(self, sign):
+        """低速段频率：保证一次读数 + 停止命令生效期间的位移不超过 tol 的一半"""
+        k = self.model_fn(sign).k
+        limit = self.tol / 2 / (k * 2 * self.latency)
+        return int(max(self.min_frequency, min(self.frequencies[sign][1], limit)))
+
+    def plan(self, z_start, z_target, contact=None):
+        """
+        规划从 z_start 到 z_target 的分段：contact（接触高度）位于途中时在其前 slow_zone 处转入低速段，
+        否则在目标前 slow_zone 处转入低速段；距离不足 slow_zone 时只有低速段
+        """
+        sign = 1 if z_target > z_start else -1
+        slow_from = z_target
+        if contact is not None and 0 < (contact - z_start) * sign < (z_target - z_start) * sign:
+            slow_from = contact
+        slow_start = slow_from - sign * self.slow_zone
+        segments = []
+        if (slow_start - z_start) * sign > 0:
+            segments.append(ZSegment(slow_start, self.frequencies[sign][0]))
+        segments.append(ZSegment(z_target, self.fine_frequency(sign)))
+        return segments
+
+    def _read(self):
+        t = time.time()
+        z = self.read_fn()
+        if z is not None:
+            self.latency = 0.8 * self.latency + 0.2 * (time.time() - t)
+        return z
+
+    def _stream(self, segment, z):
+        """
+        执行一段运动并持续监测，返回 (最终读数, 结果)，
+        结果为 'done'（走完或提前停在段终点）、'contact'、'stopped' 或 'failed'
+        """
+        sign = 1 if segment.end > z else -1
+        k = self.model_fn(sign).k
+        steps = int(round(abs(segment.end - z) / k))
+        if steps < 1:
+            return z, 'done'
+        expected = steps / segment.frequency
+        t0 = time.time()
+        if not self.move_fn(sign, steps, segment.frequency):
+            return z, 'failed'
+
+        z0 = z
+        last_t = t0
+        stable = 0
+        halted = None
+        deadline = t0 + 2 * expected + 1.0
+        while True:
+            if self.stop_fn():
+                # 停止命令已由停止流程下发
+                return z, 'stopped'
+            z_new = self._read()
+            now = time.time()
+            if z_new is None:
+                self.halt_fn()
+                return z, 'failed'
+            if self.contact_fn is not None and self.contact_fn():
+                self.halt_fn()
+                return z_new, 'contact'
+            velocity = abs(z_new - z) / max(now - last_t, 1e-3)
+            remaining = (segment.end - z_new) * sign
+            moved = abs(z_new - z)
+            z, last_t = z_new, now
+            # 按模型剩余的指令行程会越过段终点，且已进入停止距离（再读一次数加上停止命令生效期间的位移）时提前停止；
+            # 模型准确时让命令自然走完，该段可用于标定
+            commanded = max(0.0, steps - (now - t0) * segment.frequency) * k
+            if commanded > remaining + self.tol / 2 and remaining <= velocity * 2 * self.latency:
+                self.halt_fn()
+                halted = time.time()
+                break
+            if now > t0 + expected:
+                stable = stable + 1 if moved < self.tol / 5 else 0
+                if stable >= 2:
+                    break
+            if now > deadline:
+                self.halt_fn()
+                halted = time.time()
+                break
+            time.sleep(self.poll)
+
+        if self.observe_fn is not None:
+            if halted is not None:
+                # 提前停止的段按已运行时间估算实际执行的步数，并读取停稳后的位置
+                steps = min(steps, int((halted - t0) * segment.frequency))
+                z_end = self._read()
+                z = z if z_end is None else z_end
+            self.observe_fn(sign * steps, z - z0)
+        return z, 'done'
+
+    def run(self, z_target, contact=None):
+        """
+        逼近 z_target，返回 (最终 Z 或 None, 结果)，结果为 'reached'、'contact'、'stopped'、'failed' 或 'timeout'
+        """
+        z = self._read()
+        if z is None:
+            return None, 'failed'
+        for _ in range(self.max_passes):
+            if self.stop_fn():
+                return z, 'stopped'
+            if abs(z_target - z) <= self.tol:
+                return z, 'reached'
+            for segment in self.plan(z, z_target, contact):
+                z, result = self._stream(segment, z)
+                if result != 'done':
+                    return z, result
+            # 停止后定位器可能还有少量惯性位移，重新读数再修正
+            z = self._read()
+            if z is None:
+                return None, 'failed'
+        return z, 'reached' if abs(z_target - z) <= self.tol else 'timeout'
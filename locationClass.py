@@ -9,6 +9,9 @@ from PyQt5.QtCore import QTimer, Qt
 
 from DailyLogger import DailyLogger
 from Position import move_to_Z, getPosition, move_to_target
+from PositionService import position_service
+from RoutePlanner import RoutePlanner
+from StepCalibration import step_calibration
 from SerialLock import SerialLock
 from demo import Ui_MainWindow
 from SerialPage import SIM928ConnectionThread, RelayConnectionThread, NeedelConnectionThread
@@ -82,6 +85,13 @@ class locationClass(QMainWindow, Ui_MainWindow):
         self.move_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='MoveExecutor')
 
         self.device_positions = []
+        # 批量测试时按规划的最短路径访问器件；False 为原来的 S 型顺序
+        self.route_optimization = True
+        # 定位器换向回差折算的额外行程（位置单位）
+        self.route_backlash = 0.01
+        # 本轮批量测试规划的访问顺序和已处理的器件下标，继续测试时只访问剩下的器件
+        self.planned_order = []
+        self.visited = set()
         self.ax = None
         self.fig = None
         self.mainpage1 = mainpage1
@@ -100,6 +110,7 @@ class locationClass(QMainWindow, Ui_MainWindow):
         self.location3 = None
         self.Zlocation1 = 0
         self.Zlocation2 = 0
+        self.Zcontact = None  # 记录按压位置时的接触高度，供 Z 轴逼近规划在其附近减速
 
         self.lineEdit_Location1 = lineEdit_Location1
         self.lineEdit_Location2 = lineEdit_Location2
@@ -128,6 +139,8 @@ class locationClass(QMainWindow, Ui_MainWindow):
         self.log_timer = QTimer(self)
         self.log_timer.timeout.connect(self.update_location_display)
         self.log_timer.start(500)  # 每秒更新一次
+        # 后台位置缓存：界面和地图只读缓存，串口空闲且定位器移动过时才刷新
+        position_service.start()
 
     def checkbox_DontTest_changed(self,state):
         # 根据复选框的状态更新标志位
@@ -137,15 +150,25 @@ class locationClass(QMainWindow, Ui_MainWindow):
             self.DontTest = False
 
     def PushBack(self,flag=True):
-        move_to_Z(self.Zlocation1,self.indicator,flag)
-        locationClass.locationX, locationClass.locationY, locationClass.locationZ = getPosition()
+        """按压到记录的按压位置，返回是否到位（停止、读数失败或超时为 False）"""
+        z = move_to_Z(self.Zlocation1,self.indicator,flag,contact=self.Zcontact)
+        with SerialLock.serial_lock:
+            locationClass.locationX, locationClass.locationY, locationClass.locationZ = getPosition()
+        return z is not None
 
     def PullBack(self):
         move_to_Z(self.Zlocation2,self.indicator)
-        locationClass.locationX, locationClass.locationY, locationClass.locationZ = getPosition()
+        with SerialLock.serial_lock:
+            locationClass.locationX, locationClass.locationY, locationClass.locationZ = getPosition()
 
 
     def update_location_display(self):
+        # 只读位置缓存，不访问串口（GUI线程绝不等待串口锁）
+        record = position_service.latest()
+        if record.x is not None:
+            locationClass.locationX, locationClass.locationY = round(record.x, 4), round(record.y or 0, 4)
+        if record.z is not None:
+            locationClass.locationZ = round(record.z, 6)
         self.lineEdit_Xlocation.setText(str(locationClass.locationX))
         self.lineEdit_Ylocation.setText(str(locationClass.locationY))
         self.lineEdit_Zlocation.setText(str(locationClass.locationZ))
@@ -167,6 +190,7 @@ class locationClass(QMainWindow, Ui_MainWindow):
         with SerialLock.serial_lock:
             _, _, locationClass.locationZ = getPosition()
         if flag == 1:
+            self.Zcontact = locationClass.locationZ
             self.Zlocation1 = locationClass.locationZ - 0.01
             self.lineEdit_Pushlocation.setText(str(self.Zlocation1))
         if flag == 2:
@@ -204,6 +228,8 @@ class locationClass(QMainWindow, Ui_MainWindow):
                 self.location3, x3, y3,
                 row, col
             )
+            self.planned_order = []
+            self.visited = set()
 
             # 基于三个基准名称生成整图命名（左上、右上、右下）
             self.device_names = self.calculate_device_names(
@@ -297,14 +323,50 @@ class locationClass(QMainWindow, Ui_MainWindow):
 
 
 
+    def plan_visit_order(self, indices):
+        """
+        规划器件访问顺序：从当前位置出发经过 indices 中的器件，总行程最短。
+        各轴代价按步长标定换算为步数（慢轴权重大），换向时计入回差
+        """
+        valid, invalid = [], []
+        for i in indices:
+            try:
+                valid.append((i, float(self.device_positions[i][0]), float(self.device_positions[i][1])))
+            except (ValueError, TypeError, IndexError):
+                invalid.append(i)
+        if len(valid) <= 1:
+            return [v[0] for v in valid] + invalid
+
+        # 每单位位移的步数（两个方向的平均）
+        weights = [(1 / step_calibration.units_per_step(axis, 1) + 1 / step_calibration.units_per_step(axis, -1)) / 2
+                   for axis in ('X', 'Y')]
+        planner = RoutePlanner(weights=weights, backlash=[w * self.route_backlash for w in weights])
+        record = position_service.get(max_age=1.0, axes='xy')
+        start = (record.x, record.y) if record.x is not None and record.y is not None else valid[0][1:]
+        points = [v[1:] for v in valid]
+        order = planner.plan(points, start)
+        sequential = planner.route_cost(np.asarray(points), list(range(len(points))), start)
+        planned = planner.route_cost(np.asarray(points), order, start)
+        logger.log(f'访问顺序已规划: {len(points)} 个器件，预计行程 {planned:.0f} 步（原顺序 {sequential:.0f} 步）')
+        return [valid[k][0] for k in order] + invalid
+
     # 遍历设备位置，依次移动探针 从头开始测试所有的探针
-    def move_to_all_targets(self, start_index=0):
+    def move_to_all_targets(self, start_index=0, indices=None):
+        """
+        依次测试器件：indices 为要测试的器件下标（例如复测的子集），默认从 start_index 到最后；
+        route_optimization 开启时按规划的最短路径访问。处理过的器件记入 self.visited
+        """
         test_event.set()
         try:
-            step_size = 1
-            for i in range(start_index, len(self.device_positions),step_size):
-                if not test_event.is_set() or StopClass.stop_num==1:
-                    StopClass.stop_num=0
+            if indices is None:
+                indices = range(start_index, len(self.device_positions))
+            indices = list(indices)
+            if self.route_optimization:
+                indices = self.plan_visit_order(indices)
+            self.planned_order = indices
+            for i in indices:
+                if not test_event.is_set() or StopClass.is_stopped():
+                    StopClass.clear()
                     break
 
                 # 确保坐标值是浮点数
@@ -314,6 +376,7 @@ class locationClass(QMainWindow, Ui_MainWindow):
                     target_y = float(target_y)
                 except (ValueError, TypeError) as e:
                     logger.log(f'坐标转换失败: 索引={i}, 原始值={self.device_positions[i]}, 错误={e}')
+                    self.visited.add(i)
                     continue
                 
                 PadName = self.device_names[i] if getattr(self, 'device_names', None) and i < len(self.device_names) else ''
@@ -339,12 +402,18 @@ class locationClass(QMainWindow, Ui_MainWindow):
                     template_error = self.mainpage1.match_and_move()
                     if template_error:
                         logger.log(f'该点模板匹配失败: x={target_x}, y={target_y}，跳过当前点的处理')
+                        self.visited.add(i)
                         continue
                 else:
                     time.sleep(0.5)  # 简单等待以确保稳定
 
+                # 光纤模式：在扫描台上优化耦合后再测试
+                if self.mainpage1.equipment == 1 and self.mainpage1.auto_coupling:
+                    self.mainpage1.optimize_coupling()
+
 
-                locationClass.locationX, locationClass.locationY,_ = getPosition()
+                record = position_service.get(max_age=0.5, axes='xy')
+                locationClass.locationX, locationClass.locationY = record.x, record.y
                 time.sleep(1)  # 等待 1 秒，确保探针稳定
 
                 if self.DontTest is False:
@@ -358,11 +427,16 @@ class locationClass(QMainWindow, Ui_MainWindow):
                     keithley.enable_source()  # 打开源表
                     keithley.source_voltage = 0.1
 
-                    self.PushBack(True)
+                    if not self.PushBack(True):
+                        # 探针状态不确定，不能当作已接触继续测量：抬起并终止本轮，继续测试时从该器件重新开始
+                        logger.log(f'按压未到位: x={target_x}, y={target_y}，终止测试')
+                        self.PullBack()
+                        break
                     template_error = self.mainpage1.match_and_move()
                     if template_error:
                         logger.log(f'该点模板匹配失败: x={target_x}, y={target_y}，跳过当前点的处理')
                         self.PullBack()
+                        self.visited.add(i)
                         continue
 
                     time.sleep(0.5)  # 等待 1 秒，确保探针稳定
@@ -393,6 +467,7 @@ class locationClass(QMainWindow, Ui_MainWindow):
                     self.PullBack()
 
                 self.mainpage1.save_image()
+                self.visited.add(i)
         except Exception as e:
             logger.log(f"移动线程出现异常: {e}")
             self.PullBack()
@@ -400,9 +475,20 @@ class locationClass(QMainWindow, Ui_MainWindow):
             test_event.clear()
 
     def continue_test(self):
-        if not test_event.is_set():
-            with SerialLock.serial_lock:
-                current_x, current_y,_ = getPosition()
+        if test_event.is_set():
+            logger.log("测试正在进行中")
+            return
+        # 上一轮按规划顺序中断时，只继续其中还没处理的器件（从当前位置重新规划）
+        remaining = [i for i in self.planned_order if i not in self.visited]
+        if remaining:
+            logger.log(f'继续测试：剩余 {len(remaining)} 个器件')
+            move_thread = threading.Thread(target=self.move_to_all_targets, kwargs={'indices': remaining}, daemon=True)
+            move_thread.start()
+            return
+        self.visited = set()
+        # 定位器静止时缓存即为当前位置，无需重新读取
+        record = position_service.get(max_age=1.0, axes='xy')
+        current_x, current_y = record.x or 0, record.y or 0
         nearest_index = self.find_nearest_index(current_x, current_y)
         start_index = nearest_index  if nearest_index < len(self.device_positions) else 0
         move_thread = threading.Thread(target=self.move_to_all_targets, args=(start_index,), daemon=True)
@@ -574,7 +660,8 @@ class locationClass(QMainWindow, Ui_MainWindow):
                 logger.log(f"地图点击移动完成，当前位置: ({locationClass.locationX:.4f}, {locationClass.locationY:.4f})")
             else:
                 # 如果没有返回有效结果，重新获取一次
-                locationClass.locationX, locationClass.locationY, _ = getPosition()
+                record = position_service.get(max_age=0.5, axes='xy')
+                locationClass.locationX, locationClass.locationY = record.x, record.y
 
             # 将后续的耗时操作（模板匹配）也放入后台线程，防止阻塞UI
             threading.Thread(target=self._post_move_actions, daemon=True).start()